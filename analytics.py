@@ -0,0 +1,135 @@
+"""Per-account farming analytics for the /analytics page.
+
+Two aggregation pipelines over weekly_progress do the heavy lifting on the
+server: one gives each account's logged span (first/last week, row count),
+the other groups farmed drops by (account, case) with the weeks they fell
+in. Drops are valued at the price valid when their week started, from one
+scan of the involved cases' price history. The time series are then built
+as week-indexed columns (one list per account) and accumulated in a single
+pass, instead of walking the history week by week.
+
+Results are in USD and cached per user (LRUTTLCache); progress and account
+writes invalidate that user's entry, price changes clear the cache, and
+analytics_in_currency converts a copy for display.
+"""
+from collections import Counter
+from itertools import accumulate
+
+from price_history import get_price_timelines, price_from_timeline
+from week_view import week_start_of, weeks_between
+
+
+def _span_pipeline(user_id):
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$group": {"_id": "$account_doc_id", "first_week": {"$min": "$week_start"},
+                    "last_week": {"$max": "$week_start"}, "rows": {"$sum": 1}}},
+    ]
+
+
+def _farmed_pipeline(user_id):
+    return [
+        {"$match": {"user_id": user_id, "drop_farmed": True}},
+        {"$group": {"_id": {"account": "$account_doc_id", "case": "$case_name"},
+                    "weeks": {"$push": "$week_start"}, "count": {"$sum": 1}}},
+    ]
+
+
+def _missed_streaks(farmed_indices, start, end):
+    """(longest, current) runs of consecutive unfarmed weeks between week indices start..end inclusive."""
+    if end < start:
+        return 0, 0
+    bounds = [start - 1] + sorted(farmed_indices) + [end + 1]
+    gaps = [later - earlier - 1 for earlier, later in zip(bounds, bounds[1:])]
+    return max(gaps), gaps[-1]
+
+
+def compute_account_analytics(progress_collection, history_collection, user_id, accounts, case_price_map,
+                              current_week):
+    """
+    Analytics for every tracked account from the first logged week up to current_week (a Wednesday).
+    Weeks without a farmed row count as missed; values are in USD.
+    """
+    spans = {row["_id"]: row for row in progress_collection.aggregate(_span_pipeline(user_id))}
+    groups = list(progress_collection.aggregate(_farmed_pipeline(user_id)))
+    account_ids = {acc['_id'] for acc in accounts}
+
+    # Rows logged on another weekday (the date picker allows any date) count towards their Wednesday's week
+    tracked_starts = [week_start_of(spans[acc['_id']]["first_week"]) for acc in accounts if acc['_id'] in spans]
+    first_week = min(tracked_starts + [current_week])
+    weeks = weeks_between(first_week, current_week)
+    week_pos = {week: i for i, week in enumerate(weeks)}
+
+    case_names = {group["_id"].get("case") for group in groups if group["_id"].get("case")}
+    timelines = get_price_timelines(history_collection, case_names, current_week)
+
+    values = {acc['_id']: [0.0] * len(weeks) for acc in accounts}
+    farmed_weeks = {acc['_id']: set() for acc in accounts}
+    case_counts = {acc['_id']: Counter() for acc in accounts}
+    for group in groups:
+        account_id, case_name = group["_id"].get("account"), group["_id"].get("case")
+        if account_id not in account_ids:
+            continue  # Progress of a deleted account
+        column = values[account_id]
+        for week_start in group["weeks"]:
+            position = week_pos.get(week_start_of(week_start))
+            if position is None:
+                continue  # Future week
+            farmed_weeks[account_id].add(position)
+            if case_name:
+                price = price_from_timeline(timelines.get(case_name), weeks[position])
+                column[position] += price if price is not None else case_price_map.get(case_name, 0.0)
+        if case_name:
+            case_counts[account_id][case_name] += group["count"]
+
+    rows = []
+    for acc in accounts:
+        span = spans.get(acc['_id'])
+        start = week_pos.get(week_start_of(span["first_week"]), len(weeks)) if span else len(weeks)
+        tracked = len(weeks) - start
+        longest, current = _missed_streaks(farmed_weeks[acc['_id']], start, len(weeks) - 1)
+        cumulative = list(accumulate(values[acc['_id']]))
+        rows.append({
+            "id": str(acc['_id']),
+            "name": acc['account_name'],
+            "steamid": acc['steamid'],
+            "first_week": weeks[start].strftime('%Y-%m-%d') if start < len(weeks) else None,
+            "weeks_tracked": tracked,
+            "farmed_weeks": len(farmed_weeks[acc['_id']]),
+            "farm_rate": round(len(farmed_weeks[acc['_id']]) / tracked, 4) if tracked else 0.0,
+            "longest_missed_streak": longest,
+            "current_missed_streak": current,
+            "total_value": round(cumulative[-1], 2) if cumulative else 0.0,
+            "cases": [{"name": name, "count": count} for name, count in case_counts[acc['_id']].most_common()],
+            "cumulative_value": [round(value, 2) for value in cumulative],
+        })
+
+    weekly_totals = [sum(column) for column in zip(*values.values())] if values else [0.0] * len(weeks)
+    return {
+        "weeks": [week.strftime('%Y-%m-%d') for week in weeks],
+        "accounts": rows,
+        "cumulative_value": [round(value, 2) for value in accumulate(weekly_totals)],
+    }
+
+
+def analytics_in_currency(payload, currency):
+    """Copy of an analytics payload with values in `currency` (fx.CurrencyDisplay); the cached one stays in USD."""
+    return dict(
+        payload,
+        accounts=[
+            dict(row, total_value=currency.convert(row["total_value"]),
+                 cumulative_value=[currency.convert(value) for value in row["cumulative_value"]])
+            for row in payload["accounts"]
+        ],
+        cumulative_value=[currency.convert(value) for value in payload["cumulative_value"]],
+        currency=currency.to_json(),
+    )
+
+
+def sparkline_points(values, width=160, height=32):
+    """SVG polyline points for a small cumulative-value chart."""
+    if not values:
+        return ""
+    top = max(values) or 1.0
+    step = width / max(len(values) - 1, 1)
+    return " ".join(f"{i * step:.1f},{height - (value / top) * height:.1f}" for i, value in enumerate(values))
@@ -1,53 +1,135 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session # Added flash, session
+import re
+from flask import (Flask, render_template, request, redirect, url_for, jsonify, flash, session, make_response, # Added flash, session
+                   stream_with_context)
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user # Added Flask-Login
-from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne 
+from pymongo import ASCENDING, DESCENDING, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from datetime import datetime, timedelta, timezone
 from bson import ObjectId, BSON 
+import csv
 import json
 from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash # Added hashing
 from functools import wraps
 
-import requests
-from bs4 import BeautifulSoup
-from forex_python.converter import CurrencyRates
-import time # For adding delays
+import metrics
+from analytics import analytics_in_currency, compute_account_analytics, sparkline_points
+from caching import CatalogCache, LRUTTLCache
+from drop_stats import compact as compact_drop_stats, drop_stats_in_currency, read_drop_stats
+from export import EXPORT_FORMATS, csv_chunks, gzip_chunks, iter_export_rows, ndjson_chunks
+from fx import CURRENCY_SYMBOLS, DEFAULT_DISPLAY_CURRENCY, FxRateCache, normalise_currency
+from importer import IMPORT_FORMATS, IMPORT_KINDS, detect_format, import_accounts, import_progress, read_rows
+from mongo import LazyCollection
+from price_history import get_price_series, get_week_price_map, record_prices
+from price_jobs import REFRESH_MODES, advance_price_refresh_job, find_active_job, job_to_json, start_price_refresh_job
+from week_view import (as_utc, fetch_week_entries, get_week_views, get_weeks_range, load_user_accounts, progress_stamps,
+                       range_in_currency, row_to_json, view_etag, week_etag, week_total)
+from weekly_totals import apply_progress_change, get_totals, recompute_for_price_change, recompute_weeks
 
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-
 # --- Configuration ---
-app.config['SECRET_KEY'] = os.getenv("FLASK_SECRET_KEY", "default_secret_key_change_me") # Essential for sessions
-MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
+if not os.getenv("MONGO_URI"):
     print("CRITICAL ERROR: MONGO_URI environment variable not set.")
-DB_NAME = "cs2_tracker_db"
 VALID_INVITE_CODES = set(os.getenv("VALID_INVITE_CODES", "").split(',')) # Load invite codes
+CATALOG_CACHE_TTL_SECONDS = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300")) # Backstop for edits made by other processes
+MAX_RANGE_WEEKS = int(os.getenv("MAX_RANGE_WEEKS", "156")) # Upper bound for /get_weeks_range
+WEEK_VIEW_SERVER_JOIN = os.getenv("WEEK_VIEW_SERVER_JOIN", "0") == "1" # Join point-in-time prices inside the progress aggregation
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60")) # Bounds how long an out-of-band change (e.g. promotion to Admin) takes to apply
+ANALYTICS_CACHE_TTL_SECONDS = int(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "900")) # Per-user analytics; writes invalidate them sooner
+MAX_BULK_PROGRESS_ROWS = int(os.getenv("MAX_BULK_PROGRESS_ROWS", "200")) # Rows accepted per /bulk_add_progress request
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1" # Server-Timing headers and /admin/metrics
+ACCOUNTS_PAGE_SIZE = int(os.getenv("ACCOUNTS_PAGE_SIZE", "50")) # Rows per manage_accounts page
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(50 * 1024 * 1024))) # Largest upload accepted by /import
+SEASON_START = os.getenv("SEASON_START") # YYYY-MM-DD; the season total defaults to the current calendar year
+
+# --- Database Collections (the client is created on first use, see mongo.py) ---
+accounts_collection = LazyCollection("accounts")
+cases_collection = LazyCollection("cases") # Will now have 'case_price'
+progress_collection = LazyCollection("weekly_progress")
+users_collection = LazyCollection("users") # Will now have 'user_type'
+price_jobs_collection = LazyCollection("price_refresh_jobs") # Chunked market price refresh jobs (see price_jobs.py)
+price_history_collection = LazyCollection("case_price_history") # Append-only {case_name, ts, price} points
+weekly_totals_collection = LazyCollection("weekly_totals") # Per-user, per-week rollups maintained by progress writes
+fx_rates_collection = LazyCollection("fx_rates") # Single cached USD exchange rate table (see fx.py)
+drop_stats_collection = LazyCollection("drop_stats") # Install-wide per-week drop counts (see drop_stats.py)
+rollup_checkpoints_collection = LazyCollection("rollup_checkpoints") # Last processed last_updated per rollup job
+
+# --- Case Catalog Cache (price map + sorted dropdown, shared by all requests in this process) ---
+catalog_cache = CatalogCache(
+    lambda: list(cases_collection.find({}, {"case_name": 1, "case_price": 1, "release_date": 1})),
+    ttl_seconds=CATALOG_CACHE_TTL_SECONDS
+)
+
+# --- Exchange rates (prices are stored in USD and converted per user at render time) ---
+fx_cache = FxRateCache(fx_rates_collection)
+
+# --- Point-in-time price cache (price valid at a past week_start never changes) ---
+week_price_cache = LRUTTLCache(maxsize=4096, ttl_seconds=24 * 3600)
+
+# --- Per-user analytics (USD, see analytics.py) ---
+analytics_cache = LRUTTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl_seconds=ANALYTICS_CACHE_TTL_SECONDS)
+
+
+def on_user_data_changed(user_id):
+    """Called after a user's progress or accounts change; drops the views derived from them."""
+    analytics_cache.invalidate(str(user_id))
+
+
+# --- Weekly Totals Rollups ---
+def update_weekly_totals(user_id, week_start, before, after):
+    """Applies one progress row change to the weekly_totals rollup, valuing drops at the week's price."""
+    week_start = as_utc(week_start)
+    price_map = catalog_cache.get().price_map
+
+    def price_for_case(case_name):
+        return get_week_price_map(price_history_collection, [case_name], week_start, price_map, cache=week_price_cache).get(case_name, 0.0)
+
+    try:
+        apply_progress_change(weekly_totals_collection, user_id, week_start, before, after, price_for_case)
+    except Exception as e:
+        # The progress write already succeeded; `python weekly_totals.py --rebuild` repairs the rollup
+        print(f"Error updating weekly totals for user {user_id}, week {week_start}: {e}")
+
+
+def on_prices_changed(changed_prices):
+    """Called after case prices change (admin edit or market refresh)."""
+    catalog_cache.invalidate()
+    analytics_cache.clear()
+    if not changed_prices:
+        return
+    try:
+        weeks = recompute_for_price_change(
+            weekly_totals_collection, progress_collection, price_history_collection,
+            catalog_cache.get().price_map, changed_prices.keys()
+        )
+        print(f"Recomputed {weeks} weekly total(s) after price changes to {len(changed_prices)} case(s)")
+    except Exception as e:
+        print(f"Error recomputing weekly totals after price change: {e}")
 
-# --- Database Connection ---
-try:
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    accounts_collection = db.accounts
-    cases_collection = db.cases # Will now have 'case_price'
-    progress_collection = db.weekly_progress
-    users_collection = db.users # Will now have 'user_type'
-    client.admin.command('ping')
-    print("Successfully connected to MongoDB!")
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
-    exit()
+
+# --- User Cache (saves a users_collection round trip on every authenticated request) ---
+user_cache = LRUTTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS)
 
 # --- Flask-Login Setup ---
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login' # Redirect to login page if @login_required fails
 login_manager.login_message_category = 'info' # Bootstrap class for flash message
 
+
+# --- Flask App (cheap enough for a cold start: no database or network access happens here) ---
+app = Flask(__name__)
+app.config['SECRET_KEY'] = os.getenv("FLASK_SECRET_KEY", "default_secret_key_change_me") # Essential for sessions
+app.config['MAX_CONTENT_LENGTH'] = IMPORT_MAX_BYTES # Larger bodies get a 413 before they are read (request_too_large)
+login_manager.init_app(app)
+if METRICS_ENABLED:
+    metrics.init_app(app)
+
 # --- User Model (ADD user_type) ---
 class User(UserMixin):
     def __init__(self, user_data):
@@ -55,6 +137,7 @@ class User(UserMixin):
         self.username = user_data['username']
         self.password_hash = user_data['password_hash']
         self.user_type = user_data.get('user_type', 'user') # Default to 'user'
+        self.display_currency = normalise_currency(user_data.get('display_currency')) or DEFAULT_DISPLAY_CURRENCY
         self._mongo_id = user_data['_id']
 
     def is_admin(self):
@@ -62,21 +145,32 @@ class User(UserMixin):
 
     # ... (keep check_password, get_id_obj, get, find_by_username) ...
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        with metrics.timed("hash_ms"):
+            return check_password_hash(self.password_hash, password)
 
     def get_id_obj(self):
         return self._mongo_id
 
     @staticmethod
     def get(user_id):
+        cached_user = user_cache.get(user_id)
+        if cached_user is not None:
+            return cached_user
         try:
             user_data = users_collection.find_one({'_id': ObjectId(user_id)})
             if user_data:
-                return User(user_data)
+                user = User(user_data)
+                user_cache.set(user_id, user)
+                return user
         except Exception: # Be more specific with exceptions if possible
             pass
         return None
 
+    @staticmethod
+    def invalidate(user_id):
+        """Drops a cached user; call this whenever the user's document is modified."""
+        user_cache.invalidate(str(user_id))
+
     @staticmethod
     def find_by_username(username):
         return users_collection.find_one({'username': username})
@@ -98,6 +192,32 @@ def admin_required(f):
     return decorated_function
 
 
+# --- Display Currency ---
+def current_currency():
+    """CurrencyDisplay for the logged-in user's preferred currency, from the cached rate table."""
+    return fx_cache.display(current_user.display_currency)
+
+
+@app.context_processor
+def inject_currency():
+    if not current_user.is_authenticated:
+        return {}
+    return {"currency": current_currency(), "display_currencies": list(CURRENCY_SYMBOLS)}
+
+
+# --- Conditional GET ---
+def with_etag(response, etag):
+    """Tags a per-user response; browsers must revalidate it (If-None-Match) before reuse."""
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag):
+    return with_etag(app.response_class(status=304), etag)
+
+
 # --- Helper Functions ---
 def get_most_recent_wednesday(today=None):
     """Calculates the date of the most recent Wednesday (or today if it's Wednesday)."""
@@ -135,12 +255,10 @@ def register():
         if invite_code not in VALID_INVITE_CODES:
             flash('Invalid invite code.', 'danger')
             return redirect(url_for('register'))
-        if User.find_by_username(username):
-            flash('Username already exists.', 'warning')
-            return redirect(url_for('register'))
 
         # Create user
-        hashed_password = generate_password_hash(password)
+        with metrics.timed("hash_ms"):
+            hashed_password = generate_password_hash(password)
         try:
             users_collection.insert_one({
                 'username': username,
@@ -151,6 +269,9 @@ def register():
             })
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
+        except DuplicateKeyError: # Enforced by the unique index on username
+            flash('Username already exists.', 'warning')
+            return redirect(url_for('register'))
         except Exception as e:
             flash(f'Registration failed: {e}', 'danger')
             print(f"Error registering user {username}: {e}")
@@ -179,7 +300,8 @@ def login():
              flash('Invalid username or password.', 'danger')
              return redirect(url_for('login'))
 
-        # Log user in
+        # Log user in (and refresh the cached copy with the record we just read)
+        user_cache.set(user.id, user)
         login_user(user, remember=remember)
         flash(f'Welcome back, {user.username}!', 'success')
 
@@ -192,20 +314,51 @@ def login():
 @app.route('/logout')
 @login_required
 def logout():
+    User.invalidate(current_user.id)
     logout_user()
     flash('You have been logged out.', 'success')
     return redirect(url_for('login'))
 
 
+@app.route('/set_display_currency', methods=['POST'])
+@login_required
+def set_display_currency():
+    """Stores the user's display currency. Prices are converted on render, so nothing is re-fetched."""
+    currency_code = normalise_currency(request.form.get('currency'))
+    if not currency_code:
+        flash("Unsupported currency.", "warning")
+    else:
+        try:
+            users_collection.update_one({'_id': current_user.get_id_obj()}, {'$set': {'display_currency': currency_code}})
+            User.invalidate(current_user.id)
+        except Exception as e:
+            flash(f"Could not change currency: {e}", "danger")
+            print(f"Error setting display currency for user {current_user.id}: {e}")
+    return redirect(request.referrer or url_for('index'))
+
+
 # --- Account Management Routes (User Specific) ---
 @app.route('/manage_accounts')
 @login_required
 def manage_accounts():
-    # Fetch accounts SORTED BY the display order
+    """One page of the user's accounts in display order, optionally filtered by a name/SteamID prefix (?q=)."""
+    user_id = current_user.get_id_obj()
+    search = (request.args.get('q') or '').strip()
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+
+    account_filter = {'user_id': user_id}
+    if search:
+        # Anchored, case-sensitive prefixes are answered from the (user_id, account_name) and (user_id, steamid) indexes
+        prefix = {"$regex": "^" + re.escape(search)}
+        account_filter["$or"] = [{"account_name": prefix}, {"steamid": prefix}]
+    total = accounts_collection.count_documents(account_filter)
+    page_count = max((total + ACCOUNTS_PAGE_SIZE - 1) // ACCOUNTS_PAGE_SIZE, 1)
+    page = min(page, page_count)
     user_accounts = list(accounts_collection.find(
-        {'user_id': current_user.get_id_obj()}
-    ).sort("sort_number", ASCENDING)) # Ensure sorting here
-    return render_template('manage_accounts.html', user_accounts=user_accounts)
+        account_filter, {"account_name": 1, "steamid": 1, "sort_number": 1}
+    ).sort("sort_number", ASCENDING).skip((page - 1) * ACCOUNTS_PAGE_SIZE).limit(ACCOUNTS_PAGE_SIZE))
+    return render_template('manage_accounts.html', user_accounts=user_accounts, search=search, page=page,
+                           page_count=page_count, total=total, page_offset=(page - 1) * ACCOUNTS_PAGE_SIZE)
 
 @app.route('/add_tracked_account', methods=['POST'])
 @login_required
@@ -224,15 +377,6 @@ def add_tracked_account():
 
     user_id = current_user.get_id_obj()
 
-    # Check if steamid already exists for this user
-    existing = accounts_collection.find_one({
-        'user_id': user_id,
-        'steamid': steamid_str
-    })
-    if existing:
-        flash(f"Account with SteamID {steamid_str} is already being tracked.", "warning")
-        return redirect(url_for('manage_accounts'))
-
     try:
         # Assign a default high sort number initially, it will be set properly on first save order
         # Or determine the next highest number for this user
@@ -249,17 +393,94 @@ def add_tracked_account():
             'sort_number': next_sort_number, # Assign next available sort number
             'added_at': datetime.now(timezone.utc)
         })
+        on_user_data_changed(user_id)
         flash(f"Account '{account_name}' added successfully. You may need to drag it to the desired position and save the order.", "success")
+    except DuplicateKeyError: # Unique (user_id, steamid) index
+        flash(f"Account with SteamID {steamid_str} is already being tracked.", "warning")
     except Exception as e:
         flash(f"Error adding account: {e}", "danger")
         print(f"Error adding account for user {user_id}: {e}")
 
     return redirect(url_for('manage_accounts'))
 
+def import_response(message, category, report=None, status=200):
+    """Answers /import: the report (or {"error"}) as JSON when asked for JSON, otherwise a flash on Manage Accounts."""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(report if report is not None else {"error": message}), status
+    flash(message, category)
+    return redirect(url_for('manage_accounts'))
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """MAX_CONTENT_LENGTH rejects oversized bodies before they are parsed; answer like a failed import."""
+    return import_response(f"File too large. At most {IMPORT_MAX_BYTES // (1024 * 1024)} MB per import.",
+                           "warning", status=413)
+
+
+@app.route('/import', methods=['POST'])
+@login_required
+def import_data():
+    """
+    Imports accounts or weekly progress from an uploaded CSV/NDJSON/JSON file (see importer.py).
+    Form fields: kind (accounts|progress), file, dry_run. Answers with the import report as JSON
+    when asked for JSON, otherwise flashes a summary.
+    """
+    kind = request.form.get('kind')
+    upload = request.files.get('file')
+    if kind not in IMPORT_KINDS or not upload or not upload.filename:
+        return import_response("Choose what to import and a file.", "warning", status=400)
+    file_format = request.form.get('format') or detect_format(upload.filename)
+    if file_format not in IMPORT_FORMATS:
+        return import_response(f"format must be one of: {', '.join(IMPORT_FORMATS)}", "warning", status=400)
+    dry_run = request.form.get('dry_run') in ('on', '1', 'true')
+
+    user_id = current_user.get_id_obj()
+    try:
+        rows = read_rows(upload.stream, file_format)
+        if kind == 'accounts':
+            report = import_accounts(accounts_collection, user_id, rows, dry_run=dry_run)
+        else:
+            price_map = catalog_cache.get().price_map
+            report, weeks = import_progress(progress_collection, accounts_collection, user_id, rows, price_map.keys(),
+                                            dry_run=dry_run)
+            if weeks:
+                try:
+                    recompute_weeks(weekly_totals_collection, progress_collection, price_history_collection, price_map,
+                                    [(user_id, week_start) for week_start in weeks])
+                except Exception as e:
+                    print(f"Error updating weekly totals after import for user {user_id}: {e}")
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return import_response(f"Could not read the file: {e}", "danger", status=400)
+    except Exception as e:
+        print(f"Error importing {kind} for user {user_id}: {e}")
+        return import_response(f"Import failed: {e}", "danger", status=500)
+
+    if not dry_run:
+        on_user_data_changed(user_id)
+    print(f"Import of {kind} for user {user_id}: {report['valid']} valid, {report['invalid']} invalid, dry_run={dry_run}")
+    if dry_run:
+        message = f"Dry run: {report['valid']} of {report['rows']} row(s) are valid"
+        if kind == 'accounts':
+            message += f" ({report['inserted']} new, {report['updated']} existing)"
+    else:
+        message = f"Imported {kind}: {report['inserted']} added, {report['updated']} updated"
+        if report['failed']:
+            message += f", {report['failed']} failed"
+    if report['invalid']:
+        shown = "; ".join(f"line {error['line']}: {error['error']}" for error in report['errors'][:5])
+        message += f". {report['invalid']} invalid row(s) skipped ({shown}{'; ...' if report['invalid'] > 5 else ''})"
+    return import_response(message + ".", "warning" if report['invalid'] or report['failed'] else "success",
+                           report=report)
+
+
 @app.route('/update_account_order', methods=['POST'])
 @login_required
 def update_account_order():
-    """Receives a list of account IDs in the desired order and updates sort_number."""
+    """
+    Receives the account IDs of one page (or search result) in their new order. The accounts swap
+    the sort_number values they already hold, so accounts on other pages keep their positions.
+    """
     data = request.get_json()
     if not data or 'ordered_ids' not in data or not isinstance(data['ordered_ids'], list):
         return jsonify({"success": False, "error": "Invalid data format received."}), 400
@@ -268,40 +489,37 @@ def update_account_order():
     user_id = current_user.get_id_obj()
 
     try:
-        bulk_operations = []
-        for index, account_id_str in enumerate(ordered_ids_str):
+        ordered_ids = []
+        for account_id_str in ordered_ids_str:
             try:
-                account_obj_id = ObjectId(account_id_str)
+                ordered_ids.append(ObjectId(account_id_str))
             except Exception:
-                # Log this error, but potentially continue? Or fail the whole batch?
-                # Failing whole batch is safer if order integrity is critical.
+                # Failing the whole batch keeps the order consistent
                 print(f"Invalid ObjectId format '{account_id_str}' received for user {user_id}")
                 return jsonify({"success": False, "error": f"Invalid account ID format: {account_id_str}"}), 400
 
-            # Prepare an UpdateOne operation
-            # CRITICAL: Filter by user_id to ensure user can only update their own accounts
-            bulk_operations.append(
-                UpdateOne(
-                    {"_id": account_obj_id, "user_id": user_id}, # Security Check!
-                    {"$set": {"sort_number": index}} # Set sort_number to the list index
-                )
-            )
-
-        if not bulk_operations:
-             return jsonify({"success": True, "message": "No accounts to update."}) # Or perhaps an error?
-
-        # Execute all updates in bulk
-        result = accounts_collection.bulk_write(bulk_operations, ordered=False) # ordered=False allows other updates if one fails
+        if not ordered_ids:
+             return jsonify({"success": True, "message": "No accounts to update."})
 
-        # Check result (optional but good practice)
+        # CRITICAL: Filter by user_id to ensure user can only reorder their own accounts
+        slots = sorted(
+            acc.get('sort_number', 0) for acc in
+            accounts_collection.find({"_id": {"$in": ordered_ids}, "user_id": user_id}, {"sort_number": 1})
+        )
+        if len(slots) != len(set(ordered_ids)):
+            print(f"Warning: {len(ordered_ids) - len(slots)} submitted account(s) not found for user {user_id}")
+            return jsonify({"success": False, "error": "Some accounts were not found. Reload the page and try again."}), 400
+        if len(set(slots)) != len(slots):
+            # Duplicate sort numbers (e.g. from older data) would tie; spread them out after the lowest one
+            slots = list(range(slots[0], slots[0] + len(slots)))
+
+        bulk_operations = [
+            UpdateOne({"_id": account_obj_id, "user_id": user_id}, {"$set": {"sort_number": slot}})
+            for account_obj_id, slot in zip(ordered_ids, slots)
+        ]
+        result = accounts_collection.bulk_write(bulk_operations, ordered=False)
+        on_user_data_changed(user_id)
         print(f"Bulk write result for user {user_id}: Matched={result.matched_count}, Modified={result.modified_count}")
-
-        if result.matched_count != len(ordered_ids_str):
-             # This could mean some IDs didn't exist or didn't belong to the user
-             print(f"Warning: Matched count ({result.matched_count}) doesn't equal submitted ID count ({len(ordered_ids_str)}) for user {user_id}")
-             # Decide if this is an error state or just informational
-             # Returning success might be okay if non-matching IDs were invalid anyway
-
         return jsonify({"success": True, "message": "Order updated successfully."})
 
     except Exception as e:
@@ -309,6 +527,51 @@ def update_account_order():
         return jsonify({"success": False, "error": "An internal server error occurred."}), 500
 
 
+@app.route('/move_account', methods=['POST'])
+@login_required
+def move_account():
+    """
+    Moves one account to a 1-based position in the full display order, across pages. Only accounts
+    whose position changes are rewritten. Accepts JSON {account_id, position} or the same form fields.
+    """
+    data = request.get_json(silent=True) or request.form
+    wants_json = request.is_json
+    user_id = current_user.get_id_obj()
+
+    def finish(message, category, status=200):
+        if wants_json:
+            return jsonify({"success": status == 200, ("message" if status == 200 else "error"): message}), status
+        flash(message, category)
+        return redirect(request.referrer or url_for('manage_accounts'))
+
+    try:
+        account_obj_id = ObjectId(data.get('account_id'))
+        position = int(data.get('position'))
+    except Exception:
+        return finish("A valid account and position are required.", "warning", status=400)
+
+    try:
+        current = {acc['_id']: acc.get('sort_number') for acc in
+                   accounts_collection.find({"user_id": user_id}, {"sort_number": 1}).sort("sort_number", ASCENDING)}
+        ordered = list(current)
+        if account_obj_id not in ordered:
+            return finish("Account not found or you do not have permission to move it.", "danger", status=404)
+        ordered.remove(account_obj_id)
+        ordered.insert(min(max(position, 1), len(ordered) + 1) - 1, account_obj_id)
+
+        bulk_operations = [
+            UpdateOne({"_id": acc_id, "user_id": user_id}, {"$set": {"sort_number": index}})
+            for index, acc_id in enumerate(ordered) if current.get(acc_id) != index
+        ]
+        if bulk_operations:
+            accounts_collection.bulk_write(bulk_operations, ordered=False)
+            on_user_data_changed(user_id)
+    except Exception as e:
+        print(f"Error moving account {account_obj_id} for user {user_id}: {e}")
+        return finish("An internal server error occurred.", "danger", status=500)
+    return finish(f"Account moved to position {ordered.index(account_obj_id) + 1}.", "success")
+
+
 @app.route('/delete_tracked_account/<account_id>', methods=['POST'])
 @login_required
 def delete_tracked_account(account_id):
@@ -323,6 +586,7 @@ def delete_tracked_account(account_id):
             'user_id': current_user.get_id_obj() # Security check
         })
         if result.deleted_count == 1:
+            on_user_data_changed(current_user.id)
             flash("Account deleted successfully.", "success")
             # Optional: Add logic here to re-sequence sort_number for remaining accounts if desired
         else:
@@ -340,7 +604,9 @@ def delete_tracked_account(account_id):
 @admin_required
 def admin_manage_cases():
     if request.method == 'POST':
+        changed_prices = {}
         try:
+            case_names_by_id = {str(case['_id']): case.get('case_name') for case in cases_collection.find({}, {"case_name": 1})}
             for case_id_str, price_str in request.form.items():
                 if not case_id_str.startswith("price_"): # Ensure we are processing price fields
                     continue
@@ -358,137 +624,138 @@ def admin_manage_cases():
 
                 cases_collection.update_one(
                     {"_id": ObjectId(actual_case_id_str)},
-                    {"$set": {"case_price": price}}
+                    {"$set": {"case_price": price, "currency": "USD"}}
                 )
+                if case_names_by_id.get(actual_case_id_str):
+                    changed_prices[case_names_by_id[actual_case_id_str]] = price
+            changed_prices = record_prices(price_history_collection, changed_prices) # Only cases whose price changed get a new point
             flash("Case prices updated successfully.", "success")
         except Exception as e:
             flash(f"Error updating case prices: {e}", "danger")
             print(f"Error updating case prices: {e}")
+        on_prices_changed(changed_prices) # Bumps the catalog version even after a partial update
         return redirect(url_for('admin_manage_cases'))
 
     all_cases = list(cases_collection.find().sort("case_name", ASCENDING))
-    return render_template('admin_cases.html', cases=all_cases)
+    active_job = find_active_job(price_jobs_collection)
+    return render_template('admin_cases.html', cases=all_cases, active_job=job_to_json(active_job))
 
 
 @app.route('/admin/fetch_market_prices', methods=['POST'])
 @login_required
 @admin_required
 def admin_fetch_market_prices():
-    updated_count = 0
-    failed_count = 0
-    skipped_no_link = 0
-    usd_to_inr_rate = 0.0 # Initialize to 0.0
-
-    # --- Fetch USD to INR conversion rate from Frankfurter.app ---
+    """Queues a price refresh job and returns immediately with its id; polls advance it (see price_jobs.py)."""
+    mode = request.form.get('mode', 'incremental') # 'incremental' only fetches stale cases, 'full' fetches all
+    if mode not in REFRESH_MODES:
+        mode = 'incremental'
     try:
-        print("Fetching USD to INR conversion rate from Frankfurter.app...")
-        response_forex = requests.get('https://api.frankfurter.app/latest?from=USD&to=INR', timeout=10) # 10 second timeout
-        response_forex.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-        forex_data = response_forex.json()
-        if forex_data and 'rates' in forex_data and 'INR' in forex_data['rates']:
-            usd_to_inr_rate = float(forex_data['rates']['INR'])
-            print(f"Successfully fetched USD to INR rate: {usd_to_inr_rate}")
-            flash(f"Current USD to INR rate: {usd_to_inr_rate:.4f}", "secondary")
-        else:
-            flash("Could not retrieve INR rate from Frankfurter API response. Prices will be in USD.", "warning")
-            print("Frankfurter API response did not contain expected INR rate. Data:", forex_data)
-    except requests.exceptions.RequestException as e_req:
-        flash(f"Failed to fetch currency conversion rate from Frankfurter: {e_req}. Prices will be in USD.", "warning")
-        print(f"Error fetching currency rate from Frankfurter: {e_req}")
-    except (KeyError, ValueError, TypeError) as e_parse_forex: # Catch issues with JSON structure or float conversion
-        flash("Error processing currency conversion data from Frankfurter. Prices will be in USD.", "warning")
-        print(f"Error processing currency conversion JSON from Frankfurter: {e_parse_forex}")
-    # --- End currency fetching ---
-
-    all_cases_to_fetch = list(cases_collection.find()) # Fetch all, filter later if no link
-    total_cases_with_links = 0 # Count cases we will attempt to fetch
-
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-
-    for case_doc in all_cases_to_fetch:
-        market_link = case_doc.get("link")
-        if not market_link: # Skip if no link
-            skipped_no_link += 1
-            continue
-        total_cases_with_links += 1 # Increment count of cases we are processing
-
-    processed_count = 0
-    for case_doc in all_cases_to_fetch:
-        case_name = case_doc.get("case_name", "Unknown Case")
-        market_link = case_doc.get("link")
-        case_id = case_doc["_id"]
-
-        if not market_link:
-            continue # Already counted in skipped_no_link
-
-        processed_count += 1
-        print(f"Fetching price for {case_name} from {market_link} ({processed_count}/{total_cases_with_links})")
-        
-        try:
-            response_steam = requests.get(market_link, headers=headers, timeout=20) # Increased timeout for Steam
-            response_steam.raise_for_status()
-            soup = BeautifulSoup(response_steam.content, 'html.parser')
-            
-            price_span = None
-            first_result_div = soup.find('div', id='result_0') # Attempt to find based on your Google Sheets XPath
-            if first_result_div:
-                # This selector needs to be very accurate for your specific 'link' structure
-                price_elements = first_result_div.select('div.market_listing_row div.market_listing_price_listings_block span.market_table_value span.normal_price')
-                if not price_elements: # Fallback to another common structure
-                     price_elements = first_result_div.select('div > div:nth-of-type(2) > span:nth-of-type(1) > span:nth-of-type(1)')
-
-                if price_elements:
-                    price_span = price_elements[0] # Take the first one found
-            
-            if price_span:
-                price_text = price_span.get_text(strip=True)
-                price_value_str = price_text.replace('USD', '').replace('$', '').replace('€', '').replace('₹', '').replace(',', '.').strip().split(' ')[0] # More robust cleaning
-                
-                try:
-                    price_usd = float(price_value_str) # Assume the scraped price is USD if not explicitly stated otherwise by Steam
-                    final_price = price_usd
-                    
-                    if usd_to_inr_rate > 0:
-                        price_inr = price_usd * usd_to_inr_rate
-                        final_price = round(price_inr, 2)
-                        print(f"Fetched {case_name}: Original Scraped Price '{price_text}' -> ${price_usd:.2f} USD -> ₹{final_price:.2f} INR")
-                    else:
-                        final_price = round(price_usd, 2) # Store USD price if INR conversion failed
-                        print(f"Fetched {case_name}: Original Scraped Price '{price_text}' -> ${final_price:.2f} USD (INR conversion failed or not performed)")
-
-                    cases_collection.update_one(
-                        {"_id": case_id},
-                        {"$set": {"case_price": final_price, "last_price_check": datetime.now(timezone.utc)}}
-                    )
-                    updated_count += 1
-                except ValueError:
-                    print(f"Could not parse price value '{price_value_str}' from text '{price_text}' for {case_name}")
-                    failed_count += 1
-            else:
-                print(f"Could not find price element for {case_name} on page {market_link}. Check HTML structure and CSS selectors.")
-                failed_count += 1
-
-        except requests.exceptions.RequestException as e_req_steam:
-            print(f"Request failed for {case_name}: {e_req_steam}")
-            failed_count += 1
-        except Exception as e_parse_steam:
-            print(f"Error parsing page or price for {case_name}: {e_parse_steam}")
-            failed_count += 1
-        
-        if processed_count < total_cases_with_links:
-            delay_seconds = 10
-            print(f"Waiting {delay_seconds} seconds...")
-            time.sleep(delay_seconds)
-
-    flash_message = f"Market price fetch complete. Processed: {total_cases_with_links}. Updated: {updated_count}, Failed to parse/find: {failed_count}."
-    if skipped_no_link > 0:
-        flash_message += f" Skipped {skipped_no_link} cases due to missing market links."
-    flash(flash_message, "info")
+        job_id, created = start_price_refresh_job(
+            price_jobs_collection, started_by=current_user.get_id_obj(), mode=mode
+        )
+    except Exception as e:
+        print(f"Error starting price refresh job: {e}")
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({"success": False, "error": "Could not start price refresh."}), 500
+        flash(f"Could not start price refresh: {e}", "danger")
+        return redirect(url_for('admin_manage_cases'))
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({"success": True, "job_id": str(job_id), "created": created}), 202
+
+    if created:
+        flash("Market price refresh started. It runs while this page is open; progress is shown below.", "info")
+    else:
+        flash("A market price refresh is already running. Progress is shown below.", "warning")
     return redirect(url_for('admin_manage_cases'))
 
 
+def get_drop_stats():
+    """
+    Compacts the weeks changed since the last run, then reads the install-wide stats (USD). The first
+    full build is the `python drop_stats.py --rebuild` deploy step, never a page load.
+    """
+    try:
+        compact_drop_stats(drop_stats_collection, progress_collection, rollup_checkpoints_collection,
+                           incremental_only=True)
+    except Exception as e:
+        # Serve the last compacted rollups; `python drop_stats.py --compact` catches up
+        print(f"Error compacting drop stats: {e}")
+    return read_drop_stats(drop_stats_collection, price_history_collection, catalog_cache.get().price_map)
+
+
+@app.route('/admin/stats', methods=['GET'])
+@login_required
+@admin_required
+def admin_drop_stats():
+    """Cross-user drop counts per week and case, farmed rate and value logged across the install."""
+    try:
+        stats = drop_stats_in_currency(get_drop_stats(), current_currency())
+    except Exception as e:
+        print(f"Error loading drop stats: {e}")
+        flash(f"Could not load drop statistics: {e}", "danger")
+        return redirect(url_for('admin_manage_cases'))
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(stats)
+    return render_template('admin_stats.html', stats=stats)
+
+
+@app.route('/admin/cache_stats', methods=['GET'])
+@login_required
+@admin_required
+def admin_cache_stats():
+    """Hit/miss counters for the in-process caches of this worker."""
+    return jsonify({
+        "user_cache": user_cache.stats(),
+        "catalog_cache": {"version": catalog_cache.version},
+    })
+
+
+@app.route('/admin/metrics', methods=['GET'])
+@login_required
+@admin_required
+def admin_metrics():
+    """Per-route latency, MongoDB command and render-time histograms for this worker process."""
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled (METRICS_ENABLED=0)."}), 404
+    return jsonify(metrics.registry.to_json())
+
+
+@app.route('/admin/price_jobs/<job_id>', methods=['GET'])
+@login_required
+@admin_required
+def admin_price_job_status(job_id):
+    """Read-only progress of a price refresh job."""
+    try:
+        job_obj_id = ObjectId(job_id)
+    except Exception:
+        return jsonify({"error": "Invalid job ID format."}), 400
+
+    job = price_jobs_collection.find_one({"_id": job_obj_id})
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job_to_json(job))
+
+
+@app.route('/admin/price_jobs/<job_id>/advance', methods=['POST'])
+@login_required
+@admin_required
+def admin_advance_price_job(job_id):
+    """Fetches the next chunk of a price refresh job and returns its progress (polled by admin_cases.html)."""
+    try:
+        job_obj_id = ObjectId(job_id)
+    except Exception:
+        return jsonify({"error": "Invalid job ID format."}), 400
+
+    job = advance_price_refresh_job(
+        price_jobs_collection, cases_collection, job_obj_id, progress_collection,
+        on_complete=on_prices_changed, fx_collection=fx_rates_collection,
+        history_collection=price_history_collection
+    )
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job_to_json(job))
+
 
 # --- Core Application Routes (MODIFIED for price display) ---
 @app.route('/')
@@ -496,98 +763,116 @@ def admin_fetch_market_prices():
 def index():
     try:
         user_id = current_user.get_id_obj()
-        user_accounts = list(accounts_collection.find(
-            {'user_id': user_id}
-        ).sort("sort_number", ASCENDING))
-
-        # Fetch all cases with their prices into a dictionary for quick lookup
-        all_cases_list = list(cases_collection.find({}, {"case_name": 1, "case_price": 1, "release_date": 1}))
-        case_price_map = {case['case_name']: case.get('case_price', 0.0) for case in all_cases_list}
-        
-        # For dropdowns (sorted by release date)
-        cases_for_dropdown = sorted(all_cases_list, key=lambda x: x.get('release_date', datetime.min.replace(tzinfo=timezone.utc)), reverse=True)
+        user_accounts = load_user_accounts(accounts_collection, user_id)
 
+        # Case prices and the release-date-sorted dropdown come from the process-level catalog cache
+        catalog = catalog_cache.get()
 
         current_wednesday = get_most_recent_wednesday()
         last_wednesday = get_previous_week_start(current_wednesday)
 
-        def get_progress_for_week(week_start_date, user_accounts_list, local_case_price_map):
-            account_doc_id_map = {acc['_id']: acc for acc in user_accounts_list}
-            account_ids_tracked = [acc['_id'] for acc in user_accounts_list]
-
-            progress_cursor = progress_collection.find({
-                "user_id": user_id,
-                "week_start": week_start_date,
-                "account_doc_id": {"$in": account_ids_tracked}
-            })
-            progress_list = list(progress_cursor)
-            detailed_progress_map = {}
-            week_total_price = 0.0
-
-            for entry in progress_list:
-                account_info = account_doc_id_map.get(entry.get('account_doc_id'))
-                if account_info:
-                    case_val = 0.0
-                    if entry.get("drop_farmed") and entry.get("case_name"):
-                        case_val = local_case_price_map.get(entry["case_name"], 0.0)
-                        week_total_price += case_val
-
-                    detailed_entry = {
-                        "_id": entry["_id"],
-                        "account_name": account_info["account_name"],
-                        "steamid": account_info["steamid"],
-                        "account_doc_id": account_info["_id"],
-                        "week_start": entry["week_start"],
-                        "drop_farmed": entry["drop_farmed"],
-                        "case_name": entry.get("case_name", ""),
-                        "additional_drop": entry.get("additional_drop", ""),
-                        "case_value": case_val # Store calculated value
-                    }
-                    detailed_progress_map[account_info["_id"]] = detailed_entry
-
-            final_detailed_progress = []
-            for acc in user_accounts_list:
-                if acc['_id'] in detailed_progress_map:
-                    final_detailed_progress.append(detailed_progress_map[acc['_id']])
-                else:
-                    final_detailed_progress.append({
-                        "_id": None, "account_name": acc["account_name"], "steamid": acc["steamid"],
-                        "account_doc_id": acc["_id"], "week_start": week_start_date,
-                        "drop_farmed": False, "case_name": "N/A", "additional_drop": "-",
-                        "case_value": 0.0
-                    })
-            return final_detailed_progress, week_total_price
-
-        current_week_data, current_week_total_value = get_progress_for_week(current_wednesday, user_accounts, case_price_map)
-        last_week_data, last_week_total_value = get_progress_for_week(last_wednesday, user_accounts, case_price_map)
+        # Both weeks in one progress query, which also feeds the ETag
+        week_starts = [current_wednesday, last_wednesday]
+        entries = fetch_week_entries(progress_collection, price_history_collection, user_id, user_accounts,
+                                     week_starts, server_join=WEEK_VIEW_SERVER_JOIN)
+        etag = None
+        if '_flashes' not in session: # Pending flash messages must be rendered, so never answer 304 then
+            currency = current_currency()
+            etag = view_etag(user_accounts, progress_stamps(entries, user_accounts, week_starts), catalog, currency, "index",
+                             current_user.username, current_user.is_admin(), currency.requested)
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+
+        week_views = get_week_views(
+            progress_collection, price_history_collection, user_id, user_accounts, week_starts, catalog.price_map,
+            price_cache=week_price_cache, server_join=WEEK_VIEW_SERVER_JOIN, entries=entries
+        )
+        current_week_data, current_week_total_value = week_views[current_wednesday]
+        last_week_data, last_week_total_value = week_views[last_wednesday]
 
         accounts_for_dropdown = [{"_id": str(acc['_id']), "name": acc['account_name']} for acc in user_accounts]
-        
-        # Use cases_for_dropdown which is already sorted
-        cases_for_dropdown_render = [{"name": case['case_name']} for case in cases_for_dropdown]
 
-
-        return render_template(
+        return with_etag(make_response(render_template(
             'index.html',
             user_accounts_for_dropdown=accounts_for_dropdown,
-            cases=cases_for_dropdown_render, # Pass the sorted list for dropdown
+            cases=catalog.dropdown, # Pass the sorted list for dropdown
             current_week_start_str=current_wednesday.strftime('%Y-%m-%d'),
             current_week_data=current_week_data,
             current_week_total_value=current_week_total_value,
             last_week_data=last_week_data,
             last_week_total_value=last_week_total_value,
             last_week_start_str=last_wednesday.strftime('%Y-%m-%d')
-        )
+        )), etag)
     except Exception as e:
         print(f"Error in index route for user {current_user.id}: {e}")
         flash(f"An error occurred while loading data: {e}", "danger")
         return render_template('error.html', error_message=str(e)), 500 # Create error.html if it doesn't exist
         
 
+def progress_row_payload(user_id, account_doc_id, week_start, progress_id, values):
+    """
+    JSON answer of add_progress/update_progress: the saved row in the /get_week_data shape and the
+    week's new total, both in the display currency, so the page can patch one row in place.
+    """
+    currency = current_currency()
+    price_map = catalog_cache.get().price_map
+    user_accounts = load_user_accounts(accounts_collection, user_id)
+    account = next((acc for acc in user_accounts if acc['_id'] == account_doc_id), {})
+    case_value = 0.0
+    if values["drop_farmed"] and values["case_name"]:
+        case_value = get_week_price_map(price_history_collection, [values["case_name"]], week_start, price_map,
+                                        cache=week_price_cache).get(values["case_name"], 0.0)
+    row = dict(values, _id=progress_id, account_name=account.get("account_name", ""), steamid=account.get("steamid", ""),
+               account_doc_id=account_doc_id, week_start=week_start, case_value=case_value)
+    total = week_total(progress_collection, price_history_collection, user_id, user_accounts, week_start, price_map,
+                       price_cache=week_price_cache)
+    return {"row": row_to_json(row, currency), "week_start": week_start.strftime('%Y-%m-%d'),
+            "total_value": currency.convert(total), "currency": currency.to_json()}
+
+
+def saved_rows_payload(user_id, week_start, account_doc_ids):
+    """
+    JSON part of the bulk_add_progress answer: the saved rows of one week in the /get_week_data shape and
+    the week's new total, both in the display currency, from one progress query and one price lookup.
+    """
+    currency = current_currency()
+    price_map = catalog_cache.get().price_map
+    user_accounts = load_user_accounts(accounts_collection, user_id)
+    accounts_by_id = {acc['_id']: acc for acc in user_accounts}
+    entries = list(progress_collection.find(
+        {"user_id": user_id, "week_start": week_start, "account_doc_id": {"$in": list(account_doc_ids)}}
+    ))
+    case_names = sorted({e["case_name"] for e in entries if e.get("drop_farmed") and e.get("case_name")})
+    prices = get_week_price_map(price_history_collection, case_names, week_start, price_map, cache=week_price_cache)
+    rows = []
+    for entry in entries:
+        account = accounts_by_id.get(entry["account_doc_id"], {})
+        case_value = prices.get(entry["case_name"], 0.0) if entry.get("drop_farmed") and entry.get("case_name") else 0.0
+        rows.append(row_to_json(dict(
+            _id=entry["_id"], account_name=account.get("account_name", ""), steamid=account.get("steamid", ""),
+            week_start=week_start, drop_farmed=entry.get("drop_farmed", False), case_name=entry.get("case_name"),
+            additional_drop=entry.get("additional_drop"), case_value=case_value
+        ), currency))
+    total = week_total(progress_collection, price_history_collection, user_id, user_accounts, week_start, price_map,
+                       price_cache=week_price_cache)
+    return {"rows": rows, "total_value": currency.convert(total), "currency": currency.to_json()}
+
+
+def progress_response(message, category, status=200, payload=None):
+    """Redirects to the dashboard with a flash, or answers JSON when the page asked for it (script.js)."""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(dict(payload or {}, success=status == 200, message=message, category=category)), status
+    flash(message, category)
+    return redirect(url_for('index'))
+
+
 @app.route('/add_progress', methods=['POST'])
 @login_required
 def add_progress():
-    """Adds or updates a weekly progress entry for the current user."""
+    """
+    Adds or updates a weekly progress entry for the current user. Redirects to the dashboard, or with
+    Accept: application/json answers {success, message, status, row, week_start, total_value, currency}.
+    """
     try:
         user_id = current_user.get_id_obj()
         account_doc_id_str = request.form.get('account_doc_id')
@@ -598,28 +883,24 @@ def add_progress():
 
         # --- Validation/Conversion ---
         if not all([account_doc_id_str, week_start_str]):
-             flash("Missing required fields (Account or Week Start)", 'warning')
-             return redirect(url_for('index')) # Redirect early on validation fail
+             return progress_response("Missing required fields (Account or Week Start)", 'warning', status=400)
 
         try:
              account_doc_id = ObjectId(account_doc_id_str)
              account_check = accounts_collection.find_one({
                  "_id": account_doc_id,
                  "user_id": user_id
-             })
+             }, {"_id": 1})
              if not account_check:
-                 flash("Invalid or unauthorized account selected.", 'danger')
-                 return redirect(url_for('index')) # Redirect early
+                 return progress_response("Invalid or unauthorized account selected.", 'danger', status=400)
         except Exception:
-             flash("Invalid Account ID format.", 'danger')
-             return redirect(url_for('index')) # Redirect early
+             return progress_response("Invalid Account ID format.", 'danger', status=400)
 
         try:
             week_start_dt = datetime.strptime(week_start_str, '%Y-%m-%d')
             week_start_utc = datetime.combine(week_start_dt.date(), datetime.min.time(), tzinfo=timezone.utc)
         except ValueError:
-            flash("Invalid Date format. Please use YYYY-MM-DD.", 'warning')
-            return redirect(url_for('index')) # Redirect early
+            return progress_response("Invalid Date format. Please use YYYY-MM-DD.", 'warning', status=400)
 
         drop_farmed = True if drop_farmed_chk == 'on' else False
         case_name_final = case_name if drop_farmed and case_name else None
@@ -631,6 +912,7 @@ def add_progress():
             "account_doc_id": account_doc_id,
             "week_start": week_start_utc
         }
+        new_id = ObjectId() # Known up front, so an insert needs no read-back for the JSON row
         update_doc = {
             "$set": {
                 "drop_farmed": drop_farmed,
@@ -639,34 +921,145 @@ def add_progress():
                 "last_updated": datetime.now(timezone.utc)
             },
             "$setOnInsert": {
+                 "_id": new_id,
                  "user_id": user_id,
                  "account_doc_id": account_doc_id,
                  "week_start": week_start_utc
             }
         }
 
-        result = progress_collection.update_one(filter_doc, update_doc, upsert=True)
+        previous = progress_collection.find_one_and_update(
+            filter_doc, update_doc, upsert=True,
+            projection={"drop_farmed": 1, "case_name": 1, "additional_drop": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        new_values = {"drop_farmed": drop_farmed, "case_name": case_name_final, "additional_drop": additional_drop_final}
+        update_weekly_totals(user_id, week_start_utc, previous, new_values)
+        on_user_data_changed(user_id)
 
-        if result.upserted_id:
+        if previous is None:
             print(f"Added progress for user {user_id}, account_doc {account_doc_id}, week {week_start_utc}")
-            flash("Progress saved successfully.", "success")
-        elif result.modified_count > 0:
+            status, message, category = "inserted", "Progress saved successfully.", "success"
+        elif any(previous.get(field) != value for field, value in new_values.items()):
             print(f"Updated progress for user {user_id}, account_doc {account_doc_id}, week {week_start_utc}")
-            flash("Progress updated successfully.", "success")
+            status, message, category = "updated", "Progress updated successfully.", "success"
         else:
-             flash("Progress already recorded with this information.", "info")
+            status, message, category = "unchanged", "Progress already recorded with this information.", "info"
+
+        payload = None
+        if request.accept_mimetypes.best == 'application/json':
+            progress_id = previous["_id"] if previous else new_id
+            payload = dict(progress_row_payload(user_id, account_doc_id, week_start_utc, progress_id, new_values),
+                           status=status)
+        return progress_response(message, category, payload=payload)
 
     except Exception as e:
         print(f"Error adding/updating progress for user {user_id}: {e}")
-        flash(f"Failed to save progress: {e}", "danger") # Flash the specific error
+        return progress_response(f"Failed to save progress: {e}", "danger", status=500)
+
+@app.route('/bulk_add_progress', methods=['POST'])
+@login_required
+def bulk_add_progress():
+    """
+    Adds or updates many progress entries for one week in a single request.
+    Body: {"week_start": "YYYY-MM-DD", "rows": [{"account_doc_id", "drop_farmed", "case_name", "additional_drop"}, ...]}
+    Returns {"results": [{"index", "account_doc_id", "status", "error"?}, ...]} with status
+    inserted / updated / invalid / failed per row, in request order, plus the saved rows in the
+    /get_week_data shape and the week's new total ({"week_start", "rows", "total_value", "currency"}).
+    """
+    payload = request.get_json(silent=True) or {}
+    rows = payload.get("rows")
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"error": "rows must be a non-empty list"}), 400
+    if len(rows) > MAX_BULK_PROGRESS_ROWS:
+        return jsonify({"error": f"Too many rows. At most {MAX_BULK_PROGRESS_ROWS} per request."}), 400
+    try:
+        week_start_dt = datetime.strptime(payload.get("week_start") or "", '%Y-%m-%d')
+        week_start_utc = datetime.combine(week_start_dt.date(), datetime.min.time(), tzinfo=timezone.utc)
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD."}), 400
+
+    user_id = current_user.get_id_obj()
+    results = [{"index": i, "account_doc_id": row.get("account_doc_id") if isinstance(row, dict) else None}
+               for i, row in enumerate(rows)]
+    account_ids = {}
+    for result, row in zip(results, rows):
+        try:
+            account_ids[result["index"]] = ObjectId(result["account_doc_id"])
+        except Exception:
+            result.update(status="invalid", error="Invalid Account ID format.")
+
+    try:
+        # One ownership check for every row
+        owned_ids = {acc["_id"] for acc in accounts_collection.find(
+            {"_id": {"$in": list(set(account_ids.values()))}, "user_id": user_id}, {"_id": 1}
+        )}
+        now = datetime.now(timezone.utc)
+        operations, op_rows = [], []
+        seen_accounts = set()
+        for index, account_doc_id in account_ids.items():
+            if account_doc_id not in owned_ids:
+                results[index].update(status="invalid", error="Invalid or unauthorized account selected.")
+                continue
+            if account_doc_id in seen_accounts:
+                results[index].update(status="invalid", error="Account appears more than once.")
+                continue
+            seen_accounts.add(account_doc_id)
+            row = rows[index]
+            drop_farmed = bool(row.get("drop_farmed"))
+            operations.append(UpdateOne(
+                {"user_id": user_id, "account_doc_id": account_doc_id, "week_start": week_start_utc},
+                {
+                    "$set": {
+                        "drop_farmed": drop_farmed,
+                        "case_name": (row.get("case_name") or None) if drop_farmed else None,
+                        "additional_drop": (row.get("additional_drop") or None) if drop_farmed else None,
+                        "last_updated": now
+                    },
+                    "$setOnInsert": {"user_id": user_id, "account_doc_id": account_doc_id, "week_start": week_start_utc}
+                },
+                upsert=True
+            ))
+            op_rows.append(index)
+
+        if operations:
+            try:
+                bulk_result = progress_collection.bulk_write(operations, ordered=False)
+                upserted, failed = set(bulk_result.upserted_ids), {}
+            except BulkWriteError as bwe:
+                # Unordered: every operation without a write error was applied
+                upserted = {item["index"] for item in bwe.details.get("upserted", [])}
+                failed = {error["index"]: error.get("errmsg", "Write failed.") for error in bwe.details.get("writeErrors", [])}
+            for op_index, index in enumerate(op_rows):
+                if op_index in failed:
+                    results[index].update(status="failed", error=failed[op_index])
+                else:
+                    results[index]["status"] = "inserted" if op_index in upserted else "updated"
+            try:
+                # One rebuild of this week's rollup instead of a delta per row
+                recompute_weeks(weekly_totals_collection, progress_collection, price_history_collection,
+                                catalog_cache.get().price_map, [(user_id, week_start_utc)])
+            except Exception as e:
+                print(f"Error updating weekly totals for user {user_id}, week {week_start_utc}: {e}")
+        saved_ids = [account_ids[r["index"]] for r in results if r.get("status") in ("inserted", "updated")]
+        if operations:
+            on_user_data_changed(user_id)
+        saved = saved_rows_payload(user_id, week_start_utc, saved_ids)
+        print(f"Bulk progress for user {user_id}, week {week_start_utc}: {len(operations)} row(s) written")
+    except Exception as e:
+        print(f"Error in bulk progress for user {user_id}: {e}")
+        return jsonify({"error": "Failed to save progress"}), 500
+
+    return jsonify(dict(saved, week_start=week_start_utc.strftime('%Y-%m-%d'), results=results))
 
-    # --- !!! THIS IS THE IMPORTANT LINE TO RESTORE !!! ---
-    return redirect(url_for('index'))
 
 @app.route('/update_progress/<progress_id>', methods=['POST'])
 @login_required
 def update_progress(progress_id):
-    """Updates an existing weekly progress entry, ensuring it belongs to the user."""
+    """
+    Updates an existing weekly progress entry, ensuring it belongs to the user. Answers like
+    add_progress (redirect, or JSON with the changed row and the week total).
+    """
     try:
         user_id = current_user.get_id_obj()
 
@@ -679,8 +1072,7 @@ def update_progress(progress_id):
         try:
             obj_id = ObjectId(progress_id)
         except Exception:
-            flash("Invalid Progress ID format", 'danger')
-            return redirect(url_for('index')) # Redirect early
+            return progress_response("Invalid Progress ID format", 'danger', status=400)
 
         drop_farmed = True if drop_farmed_chk == 'on' else False
         case_name_final = case_name if drop_farmed and case_name else None
@@ -697,25 +1089,33 @@ def update_progress(progress_id):
         }
 
         # --- Update in Database (Crucially, check user_id) ---
-        result = progress_collection.update_one(
+        previous = progress_collection.find_one_and_update(
             {"_id": obj_id, "user_id": user_id}, # Ensure this entry belongs to the logged-in user
-            update_data
+            update_data,
+            projection={"week_start": 1, "account_doc_id": 1, "drop_farmed": 1, "case_name": 1, "additional_drop": 1},
+            return_document=ReturnDocument.BEFORE
         )
-
-        if result.matched_count == 0:
-            flash("Progress entry not found or you don't have permission to edit it.", "warning")
-        elif result.modified_count > 0:
-             print(f"Updated progress entry {progress_id} for user {user_id}")
-             flash("Progress updated successfully.", "success")
+        new_values = {"drop_farmed": drop_farmed, "case_name": case_name_final, "additional_drop": additional_drop_final}
+
+        if previous is None:
+            return progress_response("Progress entry not found or you don't have permission to edit it.", "warning", status=404)
+        if any(previous.get(field) != value for field, value in new_values.items()):
+            update_weekly_totals(user_id, previous["week_start"], previous, new_values)
+            on_user_data_changed(user_id)
+            print(f"Updated progress entry {progress_id} for user {user_id}")
+            status, message, category = "updated", "Progress updated successfully.", "success"
         else:
-            flash("No changes detected in progress.", "info")
+            status, message, category = "unchanged", "No changes detected in progress.", "info"
+
+        payload = None
+        if request.accept_mimetypes.best == 'application/json':
+            payload = dict(progress_row_payload(user_id, previous["account_doc_id"], as_utc(previous["week_start"]), obj_id,
+                                                new_values), status=status)
+        return progress_response(message, category, payload=payload)
 
     except Exception as e:
         print(f"Error updating progress {progress_id} for user {user_id}: {e}")
-        flash(f"Failed to update progress: {e}", "danger") # Flash the specific error
-
-    # --- !!! THIS IS THE IMPORTANT LINE TO RESTORE !!! ---
-    return redirect(url_for('index'))
+        return progress_response(f"Failed to update progress: {e}", "danger", status=500)
 
 
 @app.route('/get_week_data', methods=['GET'])
@@ -730,55 +1130,205 @@ def get_week_data():
         week_start_dt = datetime.strptime(week_start_str, '%Y-%m-%d')
         week_start_utc = datetime.combine(week_start_dt.date(), datetime.min.time(), tzinfo=timezone.utc)
 
-        user_accounts = list(accounts_collection.find(
-            {"user_id": user_id},
-            {"_id": 1, "account_name": 1, "steamid": 1, "sort_number": 1}
-        ).sort("sort_number", ASCENDING))
+        user_accounts = load_user_accounts(accounts_collection, user_id)
+        catalog = catalog_cache.get()
+        currency = current_currency()
+        # The ETag comes from the same progress rows; a match skips the price lookups and the response body
+        entries = fetch_week_entries(progress_collection, price_history_collection, user_id, user_accounts,
+                                     [week_start_utc], server_join=WEEK_VIEW_SERVER_JOIN)
+        stamps = progress_stamps(entries, user_accounts, [week_start_utc])
+        etag = week_etag(user_accounts, week_start_utc, stamps[week_start_utc], catalog, currency)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        week_views = get_week_views(
+            progress_collection, price_history_collection, user_id, user_accounts, [week_start_utc],
+            catalog.price_map, price_cache=week_price_cache, server_join=WEEK_VIEW_SERVER_JOIN, entries=entries
+        )
+        week_rows, week_total_price = week_views[week_start_utc]
+        detailed_progress = [row_to_json(row, currency) for row in week_rows]
+
+        return with_etag(jsonify({"progress": detailed_progress, "total_value": currency.convert(week_total_price),
+                                  "currency": currency.to_json()}), etag)
+
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD."}), 400
+    except Exception as e:
+        print(f"Error fetching week data for '{week_start_str}' for user {current_user.id}: {e}")
+        return jsonify({"error": "Failed to fetch data"}), 500
+
+
+def parse_weeks_range(from_str, to_str):
+    """Validates /get_weeks_range arguments. Returns (first_week, last_week, error message or None)."""
+    if not from_str or not to_str:
+        return None, None, "from and to parameters are required"
+    try:
+        first_week = get_most_recent_wednesday(datetime.strptime(from_str, '%Y-%m-%d').date())
+        last_week = get_most_recent_wednesday(datetime.strptime(to_str, '%Y-%m-%d').date())
+    except ValueError:
+        return None, None, "Invalid date format. Use YYYY-MM-DD."
+    if last_week < first_week:
+        return None, None, "'from' must not be after 'to'."
+    if (last_week - first_week).days // 7 + 1 > MAX_RANGE_WEEKS:
+        return None, None, f"Range too large. At most {MAX_RANGE_WEEKS} weeks per request."
+    return first_week, last_week, None
+
+
+@app.route('/get_weeks_range', methods=['GET'])
+@login_required
+def get_weeks_range_data():
+    """Columnar accounts x weeks history between two dates (both snapped back to their Wednesday)."""
+    from_str = request.args.get('from')
+    to_str = request.args.get('to')
+    first_week, last_week, error = parse_weeks_range(from_str, to_str)
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        user_id = current_user.get_id_obj()
+        user_accounts = load_user_accounts(accounts_collection, user_id)
+        catalog = catalog_cache.get()
+        currency = current_currency()
+        payload = get_weeks_range(
+            progress_collection, price_history_collection, user_id, user_accounts, first_week, last_week,
+            catalog.price_map, detail=request.args.get('detail') == '1',
+            etag_for=lambda week_start, stamp: week_etag(user_accounts, week_start, stamp, catalog, currency)
+        )
+        return jsonify(range_in_currency(payload, currency))
+    except Exception as e:
+        print(f"Error fetching weeks range '{from_str}'..'{to_str}' for user {current_user.id}: {e}")
+        return jsonify({"error": "Failed to fetch data"}), 500
 
-        case_price_map = {case['case_name']: case.get('case_price', 0.0) for case in cases_collection.find({}, {"case_name": 1, "case_price": 1})}
 
-        account_doc_id_map = {acc['_id']: acc for acc in user_accounts}
-        account_ids_tracked = list(account_doc_id_map.keys())
+@app.route('/get_totals', methods=['GET'])
+@login_required
+def get_totals_data():
+    """Lifetime and season totals from the weekly_totals rollup (one document read per week)."""
+    try:
+        season_start = datetime.strptime(SEASON_START, '%Y-%m-%d') if SEASON_START else datetime(datetime.now(timezone.utc).year, 1, 1)
+        season_start = season_start.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return jsonify({"error": "SEASON_START is misconfigured. Use YYYY-MM-DD."}), 500
 
-        progress_cursor = progress_collection.find({
-            "user_id": user_id, "week_start": week_start_utc,
-            "account_doc_id": {"$in": account_ids_tracked}
+    try:
+        user_id = current_user.get_id_obj()
+        currency = current_currency()
+        lifetime = get_totals(weekly_totals_collection, user_id)
+        season = get_totals(weekly_totals_collection, user_id, start=season_start)
+        for totals in (lifetime, season):
+            totals["total_value"] = currency.convert(totals["total_value"])
+        return jsonify({
+            "lifetime": lifetime,
+            "season": dict(season, start=season_start.strftime('%Y-%m-%d')),
+            "currency": currency.to_json(),
         })
-        progress_map = {entry['account_doc_id']: entry for entry in progress_cursor}
-        
-        detailed_progress = []
-        week_total_price = 0.0
-
-        for acc in user_accounts:
-            acc_id = acc['_id']
-            acc_info = account_doc_id_map.get(acc_id)
-            entry = progress_map.get(acc_id)
-            
-            case_val = 0.0
-            if entry and entry.get("drop_farmed") and entry.get("case_name"):
-                case_val = case_price_map.get(entry["case_name"], 0.0)
-                week_total_price += case_val
-
-            detailed_entry = {
-                "account_name": acc_info["account_name"], "steamid": acc_info["steamid"],
-                "week_start": week_start_utc.strftime('%Y-%m-%d'),
-                "drop_farmed": entry["drop_farmed"] if entry else False,
-                "case_name": entry.get("case_name", "") if entry else "N/A",
-                "additional_drop": entry.get("additional_drop", "") if entry else "-",
-                "progress_id": str(entry["_id"]) if entry else None,
-                "case_value": case_val
-            }
-            detailed_progress.append(detailed_entry)
-        
-        return jsonify({"progress": detailed_progress, "total_value": week_total_price})
+    except Exception as e:
+        print(f"Error fetching totals for user {current_user.id}: {e}")
+        return jsonify({"error": "Failed to fetch totals"}), 500
+
+
+def get_user_analytics(user_id):
+    """Cached analytics payload (USD) for a user; recomputed when the week rolls over."""
+    current_week = get_most_recent_wednesday()
+    cached = analytics_cache.get(str(user_id))
+    if cached and cached[0] == current_week:
+        return cached[1]
+    payload = compute_account_analytics(
+        progress_collection, price_history_collection, user_id, load_user_accounts(accounts_collection, user_id),
+        catalog_cache.get().price_map, current_week
+    )
+    analytics_cache.set(str(user_id), (current_week, payload))
+    return payload
 
+
+@app.route('/analytics', methods=['GET'])
+@login_required
+def analytics_page():
+    """Per-account farm rate, missed-week streaks, case distribution and cumulative value."""
+    try:
+        analytics = analytics_in_currency(get_user_analytics(current_user.get_id_obj()), current_currency())
+    except Exception as e:
+        print(f"Error computing analytics for user {current_user.id}: {e}")
+        flash(f"Could not load analytics: {e}", "danger")
+        return redirect(url_for('index'))
+    return render_template('analytics.html', analytics=analytics, sparkline_points=sparkline_points)
+
+
+@app.route('/api/analytics', methods=['GET'])
+@login_required
+def analytics_data():
+    try:
+        return jsonify(analytics_in_currency(get_user_analytics(current_user.get_id_obj()), current_currency()))
+    except Exception as e:
+        print(f"Error computing analytics for user {current_user.id}: {e}")
+        return jsonify({"error": "Failed to compute analytics"}), 500
+
+
+@app.route('/case_price_history', methods=['GET'])
+@login_required
+def case_price_history():
+    """Returns one case's price series for charting: {"case_name": ..., "points": [[iso_ts, price], ...], "currency": ...}."""
+    case_name = request.args.get('case_name')
+    if not case_name:
+        return jsonify({"error": "case_name parameter is required"}), 400
+
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        start_utc = datetime.strptime(start, '%Y-%m-%d').replace(tzinfo=timezone.utc) if start else None
+        end_utc = (datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)).replace(tzinfo=timezone.utc) if end else None
     except ValueError:
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD."}), 400
+
+    try:
+        series = get_price_series(price_history_collection, case_name, start_utc, end_utc)
+        currency = current_currency()
+        return jsonify({
+            "case_name": case_name,
+            "points": [[ts.strftime('%Y-%m-%dT%H:%M:%SZ'), currency.convert(price)] for ts, price in series],
+            "currency": currency.to_json(),
+        })
     except Exception as e:
-        print(f"Error fetching week data for '{week_start_str}' for user {current_user.id}: {e}")
-        return jsonify({"error": "Failed to fetch data"}), 500
+        print(f"Error fetching price history for '{case_name}': {e}")
+        return jsonify({"error": "Failed to fetch price history"}), 500
+
+
+@app.route('/export', methods=['GET'])
+@login_required
+def export_history():
+    """Streams the user's progress history: ?format=csv|ndjson&from=YYYY-MM-DD&to=YYYY-MM-DD&gzip=1."""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        start_utc = datetime.strptime(start, '%Y-%m-%d').replace(tzinfo=timezone.utc) if start else None
+        end_utc = datetime.strptime(end, '%Y-%m-%d').replace(tzinfo=timezone.utc) if end else None
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD."}), 400
+    compress = request.args.get('gzip') == '1'
+
+    user_id = current_user.get_id_obj()
+    rows = iter_export_rows(
+        progress_collection, price_history_collection, user_id, load_user_accounts(accounts_collection, user_id),
+        catalog_cache.get().price_map, current_currency(), start=start_utc, end=end_utc
+    )
+    chunks = csv_chunks(rows) if export_format == 'csv' else ndjson_chunks(rows)
+    filename = f"cs2-farming-history.{export_format}"
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = 'application/gzip'
+    else:
+        mimetype = EXPORT_FORMATS[export_format] # Flask adds "; charset=utf-8" to text/csv
+
+    response = app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
 
-        
 @app.route('/edit_tracked_account/<account_id>', methods=['POST'])
 @login_required
 def edit_tracked_account(account_id):
@@ -845,6 +1395,7 @@ def edit_tracked_account(account_id):
              # This case should theoretically be caught by the initial find_one check
              flash("Account not found or you don't have permission to edit it.", "danger")
         elif result.modified_count > 0:
+            on_user_data_changed(user_id)
             flash(f"Account '{new_account_name}' updated successfully.", "success")
         else:
             flash("No changes detected for the account.", "info")
@@ -0,0 +1,273 @@
+"""ASGI entry point with an async read path for the read-heavy endpoints.
+
+    uvicorn async_app:app --workers 2
+
+GET /get_week_data, /get_weeks_range and /api/dashboard run on the event loop
+using the async driver (async_reads.py), so a slow MongoDB round trip no longer
+holds a worker thread. Every other request is handed to the unchanged Flask app
+in a small thread pool, and its responses are streamed chunk by chunk. Users are
+authenticated by Flask-Login itself in a request context on that pool (session
+cookie, remember-me cookie and session protection), so a login made through
+the Flask routes is valid for both.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from flask import session
+from flask_login import current_user
+from werkzeug.http import parse_etags
+
+from app import app as flask_app
+from app import catalog_cache, fx_cache, get_most_recent_wednesday, get_previous_week_start, parse_weeks_range
+from async_reads import get_weeks_range, load_week_progress, value_week_views
+from mongo import get_async_db
+from week_view import progress_stamps, range_in_currency, row_to_json, view_etag, week_etag
+
+ASYNC_APP_WSGI_THREADS = int(os.getenv("ASYNC_APP_WSGI_THREADS", "8")) # Threads for requests passed to Flask
+_wsgi_executor = ThreadPoolExecutor(max_workers=ASYNC_APP_WSGI_THREADS)
+WSGI_STREAM_BUFFER_CHUNKS = 8 # Response chunks a Flask thread may produce ahead of the client
+
+
+# --- Helpers ---
+async def send_json(send, payload, status=200, etag=None, extra_headers=()):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    headers = [(b"content-length", str(len(body)).encode())]
+    if payload is not None:
+        headers.append((b"content-type", b"application/json"))
+    if etag:  # Same headers as app.with_etag
+        headers += [(b"etag", f'W/"{etag}"'.encode()), (b"cache-control", b"private, no-cache")]
+    headers.extend(extra_headers)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _headers(scope):
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope; body is a file-like object holding the request body."""
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in _headers(scope).items():
+        key = name.upper().replace("-", "_")
+        if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[key] = value
+        else:
+            environ[f"HTTP_{key}"] = value
+    return environ
+
+
+def _load_user(environ):
+    """
+    Runs Flask-Login for the request in a Flask request context: session cookie, remember-me cookie,
+    session protection and the user loader (user_cache). Returns (user_id, CurrencyDisplay, Set-Cookie
+    headers) or (None, None, headers). Called on the thread pool, since a cache miss queries MongoDB.
+    """
+    with flask_app.request_context(environ):
+        user = current_user._get_current_object()
+        # A remember-me login (or a session protection reset) changes the session; send it back like Flask would
+        response = flask_app.response_class()
+        flask_app.session_interface.save_session(flask_app, session, response)
+        cookies = [(b"set-cookie", value.encode("latin-1")) for value in response.headers.getlist("Set-Cookie")]
+        if not user.is_authenticated:
+            return None, None, cookies
+        # The rate table is process-cached; at most one small find_one per FX_CACHE_TTL_SECONDS
+        return user.get_id_obj(), fx_cache.display(user.display_currency), cookies
+
+
+async def session_user(scope):
+    """(ObjectId, CurrencyDisplay, Set-Cookie headers) of the logged-in user, or (None, None, headers)."""
+    environ = wsgi_environ(scope, BytesIO())
+    return await asyncio.get_running_loop().run_in_executor(_wsgi_executor, _load_user, environ)
+
+
+# --- Async Read Endpoints ---
+# Each handler returns (payload, status, etag); payload None with status 304 when if_none_match matched.
+async def week_data(user_id, args, currency, if_none_match):
+    week_start_str = args.get("date")
+    if not week_start_str:
+        return {"error": "Date parameter is required"}, 400, None
+    try:
+        week_start_dt = datetime.strptime(week_start_str, '%Y-%m-%d')
+    except ValueError:
+        return {"error": "Invalid date format. Use YYYY-MM-DD."}, 400, None
+    week_start_utc = datetime.combine(week_start_dt.date(), datetime.min.time(), tzinfo=timezone.utc)
+
+    db = get_async_db()
+    accounts, catalog, progress_by_week = await load_week_progress(db, user_id, [week_start_utc], catalog_cache)
+    stamps = progress_stamps(progress_by_week[week_start_utc].values(), accounts, [week_start_utc])
+    etag = week_etag(accounts, week_start_utc, stamps[week_start_utc], catalog, currency)
+    if if_none_match.contains_weak(etag):
+        return None, 304, etag
+
+    views = await value_week_views(db, accounts, catalog, progress_by_week)
+    week_rows, week_total_price = views[week_start_utc]
+    return {
+        "progress": [row_to_json(row, currency) for row in week_rows],
+        "total_value": currency.convert(week_total_price),
+        "currency": currency.to_json(),
+    }, 200, etag
+
+
+async def weeks_range(user_id, args, currency, if_none_match):
+    first_week, last_week, error = parse_weeks_range(args.get("from"), args.get("to"))
+    if error:
+        return {"error": error}, 400, None
+    payload = await get_weeks_range(
+        get_async_db(), user_id, first_week, last_week, catalog_cache, detail=args.get("detail") == "1",
+        etag_for=lambda accounts, catalog, week_start, stamp: week_etag(accounts, week_start, stamp, catalog, currency)
+    )
+    return range_in_currency(payload, currency), 200, None
+
+
+async def dashboard(user_id, args, currency, if_none_match):
+    """The data behind the index page (this week and last week) as JSON."""
+    current_wednesday = get_most_recent_wednesday()
+    last_wednesday = get_previous_week_start(current_wednesday)
+    week_starts = [current_wednesday, last_wednesday]
+    db = get_async_db()
+    accounts, catalog, progress_by_week = await load_week_progress(db, user_id, week_starts, catalog_cache)
+    entries = [entry for week in progress_by_week.values() for entry in week.values()]
+    etag = view_etag(accounts, progress_stamps(entries, accounts, week_starts), catalog, currency, "dashboard")
+    if if_none_match.contains_weak(etag):
+        return None, 304, etag
+
+    views = await value_week_views(db, accounts, catalog, progress_by_week)
+    payload = {
+        "accounts": [{"_id": str(acc['_id']), "name": acc['account_name']} for acc in accounts],
+        "cases": catalog.dropdown,
+        "currency": currency.to_json(),
+    }
+    for key, week_start in (("current_week", current_wednesday), ("last_week", last_wednesday)):
+        rows, total_value = views[week_start]
+        payload[key] = {
+            "week_start": week_start.strftime('%Y-%m-%d'),
+            "progress": [row_to_json(row, currency) for row in rows],
+            "total_value": currency.convert(total_value),
+        }
+    return payload, 200, etag
+
+
+ASYNC_ROUTES = {
+    "/get_week_data": week_data,
+    "/get_weeks_range": weeks_range,
+    "/api/dashboard": dashboard,
+}
+
+
+# --- Everything Else: the Flask app ---
+async def call_flask(scope, receive, send):
+    """
+    Runs one request through the Flask WSGI app in the thread pool. The response iterable is consumed on
+    that thread (so stream_with_context generators keep their context) and streamed to the client through
+    a small bounded queue, so large responses such as /export never sit in memory whole.
+    """
+    body = BytesIO()
+    more_body = True
+    while more_body:
+        message = await receive()
+        body.write(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    body.seek(0)
+    environ = wsgi_environ(scope, body)
+
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=WSGI_STREAM_BUFFER_CHUNKS)
+    stopped = threading.Event() # Set when the client went away; the Flask thread stops iterating
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    def put(chunk):
+        asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+
+    def run():
+        try:
+            result = flask_app(environ, start_response)
+            try:
+                for chunk in result:
+                    if stopped.is_set():
+                        break
+                    if chunk:
+                        put(chunk)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+        finally:
+            if not stopped.is_set():
+                put(None) # End of the response (or an error, raised by awaiting the future)
+
+    producer = loop.run_in_executor(_wsgi_executor, run)
+    try:
+        chunk = await chunks.get()
+        if "status" not in response:
+            await producer # The app failed before starting the response; let the server answer 500
+        await send({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+        while chunk is not None:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await chunks.get()
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if not producer.done():
+            stopped.set()
+            while not chunks.empty(): # Unblock a pending put so the thread can see `stopped`
+                chunks.get_nowait()
+    await producer
+
+
+# --- ASGI Application ---
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    handler = ASYNC_ROUTES.get(scope["path"]) if scope["method"] == "GET" else None
+    if handler is None:
+        await call_flask(scope, receive, send)
+        return
+
+    user_id, currency, cookies = await session_user(scope)
+    if user_id is None:
+        await send_json(send, {"error": "Login required"}, 401, extra_headers=cookies)
+        return
+    args = {key: values[0] for key, values in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+    if_none_match = parse_etags(_headers(scope).get("if-none-match"))
+    try:
+        payload, status, etag = await handler(user_id, args, currency, if_none_match)
+    except Exception as e:
+        print(f"Error in async {scope['path']} for user {user_id}: {e}")
+        payload, status, etag = {"error": "Failed to fetch data"}, 500, None
+    await send_json(send, payload, status, etag, extra_headers=cookies)
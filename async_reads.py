@@ -0,0 +1,99 @@
+"""Async versions of the dashboard/week read queries (pymongo AsyncMongoClient).
+
+Queries that don't depend on each other run concurrently with asyncio.gather:
+accounts, the case catalog (on a cache miss) and the progress rows are fetched
+in parallel, then one history scan values the farmed drops. Progress is
+filtered by user and week only and matched to the tracked accounts in Python,
+so it doesn't have to wait for the accounts query. The returned shapes are the
+ones produced by week_view, so both serving modes render identical data.
+"""
+import asyncio
+
+from pymongo import ASCENDING
+
+from price_history import price_from_timeline
+from week_view import (ACCOUNT_PROJECTION, _build_rows, as_utc, build_weeks_range, farmed_case_names,
+                       range_query, weeks_between)
+
+CATALOG_PROJECTION = {"case_name": 1, "case_price": 1, "release_date": 1}
+
+
+async def load_user_accounts(db, user_id):
+    cursor = db.accounts.find({"user_id": user_id}, ACCOUNT_PROJECTION).sort("sort_number", ASCENDING)
+    return await cursor.to_list(None)
+
+
+async def load_catalog(db, catalog_cache):
+    """CatalogSnapshot from the shared process cache, loading it asynchronously on a miss."""
+    snapshot = catalog_cache.fresh()
+    if snapshot:
+        return snapshot
+    version = catalog_cache.version
+    cases = await db.cases.find({}, CATALOG_PROJECTION).to_list(None)
+    return catalog_cache.store(cases, version)
+
+
+async def get_price_timelines(db, case_names, end):
+    """Async counterpart of price_history.get_price_timelines."""
+    timelines = {}
+    if not case_names:
+        return timelines
+    cursor = db.case_price_history.find(
+        {"case_name": {"$in": list(case_names)}, "ts": {"$lte": end}},
+        {"_id": 0, "case_name": 1, "ts": 1, "price": 1}
+    ).sort([("case_name", ASCENDING), ("ts", ASCENDING)])
+    async for point in cursor:
+        timestamps, prices = timelines.setdefault(point["case_name"], ([], []))
+        timestamps.append(as_utc(point["ts"]))
+        prices.append(point["price"])
+    return timelines
+
+
+async def load_week_progress(db, user_id, week_starts, catalog_cache):
+    """
+    Returns (accounts, catalog snapshot, {week_start: {account_doc_id: entry}}): everything a week
+    view needs except prices, so callers can check an ETag before the history scan.
+    """
+    accounts, catalog, entries = await asyncio.gather(
+        load_user_accounts(db, user_id),
+        load_catalog(db, catalog_cache),
+        db.weekly_progress.find({"user_id": user_id, "week_start": {"$in": week_starts}}).to_list(None),
+    )
+
+    account_ids = {acc['_id'] for acc in accounts}
+    progress_by_week = {week_start: {} for week_start in week_starts}
+    for entry in entries:
+        week_start = as_utc(entry["week_start"])
+        if entry["account_doc_id"] in account_ids and week_start in progress_by_week:
+            progress_by_week[week_start][entry["account_doc_id"]] = entry
+    return accounts, catalog, progress_by_week
+
+
+async def value_week_views(db, accounts, catalog, progress_by_week):
+    """{week_start: (rows, total_value)} for loaded progress, valued with one history scan."""
+    week_starts = list(progress_by_week)
+    farmed = [entry for week in progress_by_week.values() for entry in week.values()]
+    timelines = await get_price_timelines(db, farmed_case_names(farmed), max(week_starts)) if week_starts else {}
+
+    views = {}
+    for week_start in week_starts:
+        week_price_map = {}
+        for case_name in farmed_case_names(progress_by_week[week_start].values()):
+            price = price_from_timeline(timelines.get(case_name), week_start)
+            week_price_map[case_name] = price if price is not None else catalog.price_map.get(case_name, 0.0)
+        views[week_start] = _build_rows(accounts, week_start, progress_by_week[week_start], week_price_map)
+    return views
+
+
+async def get_weeks_range(db, user_id, first_week, last_week, catalog_cache, detail=False, etag_for=None):
+    """Async counterpart of week_view.get_weeks_range; etag_for(accounts, catalog, week_start, stamp) adds per-week etags."""
+    query_filter, projection = range_query(user_id, first_week, last_week, detail)
+    accounts, catalog, entries = await asyncio.gather(
+        load_user_accounts(db, user_id),
+        load_catalog(db, catalog_cache),
+        db.weekly_progress.find(query_filter, projection).to_list(None),
+    )
+    timelines = await get_price_timelines(db, farmed_case_names(entries), last_week)
+    week_etag_for = (lambda week_start, stamp: etag_for(accounts, catalog, week_start, stamp)) if etag_for else None
+    return build_weeks_range(accounts, weeks_between(first_week, last_week), entries, timelines,
+                             catalog.price_map, detail, etag_for=week_etag_for)
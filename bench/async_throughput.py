@@ -0,0 +1,172 @@
+"""Sync vs async throughput for the read endpoints at a fixed worker count.
+
+Needs a local mongod (data goes to MONGO_DB_NAME, default cs2_tracker_bench,
+which is dropped and re-seeded). Both modes run in-process without an HTTP
+server: the sync mode drives the Flask app from N threads (like one worker with
+N threads), the async mode drives async_app from one event loop with N requests
+in flight (like one uvicorn worker).
+
+    python bench/async_throughput.py --workers 8 --seconds 10
+    python bench/async_throughput.py --uri mongodb://127.0.0.1:27017 --output async.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import generate  # noqa: E402
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--db", default="cs2_tracker_bench")
+    parser.add_argument("--workers", type=int, default=8, help="Threads (sync) / in-flight requests (async)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of each run")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--accounts", type=int, default=30, help="Accounts per user")
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def request_paths(weeks, rng, count=200):
+    paths = []
+    for _ in range(count):
+        week = rng.choice(weeks)
+        if rng.random() < 0.7:
+            paths.append(("/get_week_data", f"date={week:%Y-%m-%d}"))
+        else:
+            start = week - timedelta(weeks=4)
+            paths.append(("/get_weeks_range", f"from={start:%Y-%m-%d}&to={week + timedelta(weeks=4):%Y-%m-%d}&detail=1"))
+    return paths
+
+
+def summarise(mode, latencies, seconds, errors):
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        "mode": mode, "requests": len(latencies), "errors": errors,
+        "throughput_rps": round(len(latencies) / seconds, 1),
+        "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def run_sync(flask_app, cookies, paths, workers, seconds):
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        client = flask_app.test_client()
+        client.set_cookie(flask_app.config.get("SESSION_COOKIE_NAME", "session"), cookies[index % len(cookies)])
+        i = index
+        while time.perf_counter() < deadline:
+            path, query = paths[i % len(paths)]
+            i += workers
+            started = time.perf_counter()
+            response = client.get(f"{path}?{query}")
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += response.status_code != 200
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(worker, range(workers)))
+    return summarise("sync", latencies, seconds, errors[0])
+
+
+async def run_async(asgi_app, cookies, paths, workers, seconds):
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + seconds
+
+    async def call(path, query, cookie):
+        scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode(),
+                 "headers": [(b"cookie", f"session={cookie}".encode())], "server": ("bench", 80)}
+        status = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        await asgi_app(scope, receive, send)
+        return status[0]
+
+    async def worker(index):
+        i = index
+        while time.perf_counter() < deadline:
+            path, query = paths[i % len(paths)]
+            i += workers
+            started = time.perf_counter()
+            status = await call(path, query, cookies[index % len(cookies)])
+            latencies.append(time.perf_counter() - started)
+            errors[0] += status != 200
+
+    await asyncio.gather(*(worker(i) for i in range(workers)))
+    return summarise("async", latencies, seconds, errors[0])
+
+
+def main(argv):
+    args = parse_args(argv)
+    os.environ["MONGO_URI"] = args.uri
+    os.environ["MONGO_DB_NAME"] = args.db
+    rng = random.Random(args.seed)
+
+    from pymongo import MongoClient
+
+    dataset = generate(MongoClient(args.uri)[args.db], users=args.users, accounts=args.accounts,
+                       weeks=args.weeks, seed=args.seed)
+    user_ids = dataset["user_ids"]
+    print(f"Seeded {len(user_ids)} users x {args.accounts} accounts x {args.weeks} weeks into {args.db}")
+
+    import async_app
+    from app import app as flask_app
+
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    cookies = [serializer.dumps({"_user_id": str(user_id), "_fresh": True}) for user_id in user_ids]
+    paths = request_paths(dataset["weeks"], rng)
+
+    async def async_runs():
+        # The async client is bound to the event loop it was first used on, so warm up on the same loop
+        await run_async(async_app.app, cookies, paths, 1, 0.5)
+        return await run_async(async_app.app, cookies, paths, args.workers, args.seconds)
+
+    run_sync(flask_app, cookies, paths, 1, 0.5) # Warm-up: client creation, index creation, catalog cache
+    results = {
+        "workers": args.workers, "seconds": args.seconds,
+        "dataset": {"users": args.users, "accounts": args.accounts, "weeks": args.weeks, "seed": args.seed},
+        "runs": [
+            run_sync(flask_app, cookies, paths, args.workers, args.seconds),
+            asyncio.run(async_runs()),
+        ],
+    }
+    sync_rps, async_rps = (run["throughput_rps"] for run in results["runs"])
+    results["async_speedup"] = round(async_rps / sync_rps, 2) if sync_rps else None
+    for run in results["runs"]:
+        print(f"{run['mode']:>5}: {run['throughput_rps']:8.1f} req/s  p50 {run['p50_ms']} ms  "
+              f"p95 {run['p95_ms']} ms  p99 {run['p99_ms']} ms  errors {run['errors']}")
+    print(f"async/sync throughput: {results['async_speedup']}x")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+"""Seeded synthetic dataset for the benchmarks.
+
+generate() fills a database with a case catalog (with price history), N users
+x M tracked accounts and W weeks of weekly_progress. The same seed always
+produces the same documents, so results from different commits are comparable.
+It also stores a freshly fetched fx_rates table, so runs never call Frankfurter.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+from werkzeug.security import generate_password_hash
+
+FIRST_WEEK = datetime(2024, 1, 3, tzinfo=timezone.utc)  # A Wednesday
+COLLECTIONS = ("users", "accounts", "weekly_progress", "weekly_totals", "cases", "case_price_history", "fx_rates")
+FX_RATES = {"USD": 1.0, "INR": 83.1, "EUR": 0.92, "GBP": 0.79}
+BENCH_PASSWORD = "bench"
+INSERT_CHUNK = 5000
+
+
+def _insert_chunked(collection, docs):
+    for start in range(0, len(docs), INSERT_CHUNK):
+        collection.insert_many(docs[start:start + INSERT_CHUNK], ordered=False)
+
+
+def generate(db, users=20, accounts=30, weeks=52, cases=40, farm_rate=0.8, seed=42):
+    """
+    Drops and re-seeds the benchmark collections. Returns a summary dict with the ids and
+    week range the scenarios need (user_ids, account_ids per user, case_names, weeks).
+    """
+    rng = random.Random(seed)
+    for name in COLLECTIONS:
+        db[name].drop()
+
+    case_names = [f"Bench Case {i}" for i in range(cases)]
+    db.cases.insert_many([
+        {"case_name": name, "case_price": round(rng.uniform(5, 500), 2),
+         "release_date": datetime(2013, 8, 14) + timedelta(days=90 * i),
+         "link": f"https://steamcommunity.com/market/search?q={name.replace(' ', '+')}"}
+        for i, name in enumerate(case_names)
+    ])
+    _insert_chunked(db.case_price_history, [
+        {"case_name": name, "ts": FIRST_WEEK + timedelta(weeks=w, hours=rng.randrange(24 * 7)),
+         "price": round(rng.uniform(5, 500), 2)}
+        for name in case_names for w in range(0, weeks, 4)
+    ])
+
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    user_ids = db.users.insert_many([
+        {"username": f"bench{u}", "password_hash": password_hash, "user_type": "user"} for u in range(users)
+    ]).inserted_ids
+
+    account_ids = {}
+    progress = []
+    for user_id in user_ids:
+        account_ids[user_id] = db.accounts.insert_many([
+            {"user_id": user_id, "account_name": f"acc{a}", "steamid": str(76561190000000000 + a), "sort_number": a}
+            for a in range(accounts)
+        ]).inserted_ids
+        for w in range(weeks):
+            for account_id in account_ids[user_id]:
+                farmed = rng.random() < farm_rate
+                progress.append({
+                    "user_id": user_id, "account_doc_id": account_id, "week_start": FIRST_WEEK + timedelta(weeks=w),
+                    "drop_farmed": farmed, "case_name": rng.choice(case_names) if farmed else None,
+                    "additional_drop": rng.choice([None, None, "Graffiti", "Sticker"]) if farmed else None,
+                    "last_updated": FIRST_WEEK + timedelta(weeks=w, days=1),
+                })
+    _insert_chunked(db.weekly_progress, progress)
+    # Fresh within FX_RATES_TTL_HOURS, so FxRateCache reads it instead of refreshing from the network
+    db.fx_rates.insert_one({"_id": "USD", "rates": dict(FX_RATES), "fetched_at": datetime.now(timezone.utc)})
+
+    return {
+        "user_ids": list(user_ids),
+        "account_ids": account_ids,
+        "case_names": case_names,
+        "weeks": [FIRST_WEEK + timedelta(weeks=w) for w in range(weeks)],
+        "progress_rows": len(progress),
+    }
+
+
+def market_page_html(price_usd, results=10):
+    """A Steam market search page shaped like the real one (result_0 holds the listing we parse)."""
+    rows = []
+    for i in range(results):
+        rows.append(
+            f'<a class="market_listing_row_link" href="#"><div class="market_listing_row market_recent_listing_row" id="result_{i}">'
+            f'<img src="https://community.akamai.steamstatic.com/economy/image/{i}" class="market_listing_item_img">'
+            '<div class="market_listing_right_cell market_listing_their_price">'
+            f'<span class="market_table_value normal_price">Starting at:<br><span class="normal_price" data-price="{i}">$0.00 USD</span></span></div>'
+            '<div class="market_listing_price_listings_block">'
+            f'<div class="market_listing_right_cell market_listing_num_listings"><span class="market_table_value"><span class="market_listing_num_listings_qty">{1000 + i}</span></span></div>'
+            '<div class="market_listing_right_cell market_listing_their_price"><span class="market_table_value normal_price">'
+            f'<span class="normal_price">${price_usd + i:.2f} USD</span><span class="sale_price">${price_usd + i - 0.01:.2f} USD</span>'
+            '</span></div></div>'
+            f'<div class="market_listing_item_name_block"><span class="market_listing_item_name">Bench Case {i}</span></div>'
+            '</div></a>'
+        )
+    filler = '<div class="responsive_page_menu">' + '<a href="#" class="menuitem">Menu</a>' * 60 + '</div>'
+    return (
+        '<!DOCTYPE html><html><head><title>Steam Community Market :: Search</title>'
+        + '<script type="text/javascript">var g_rgAppContextData = {};</script>' * 20
+        + f'</head><body>{filler}<div id="searchResultsRows">{"".join(rows)}</div></body></html>'
+    )
@@ -0,0 +1,94 @@
+"""Compares the market price extractors (price_extractors.py) on saved responses.
+
+Every extractor parses every fixture of its kind (HTML search pages or JSON
+endpoint responses) listed in the fixture manifest. A parse counts as a
+success when it returns the expected price, or None for fixtures that hold
+no price. Reports success rate and per-parse p50/p95 time.
+
+    python bench/extractors.py
+    python bench/extractors.py --iterations 2000 --output bench/results/extractors.json
+    python bench/extractors.py --fixtures /path/to/saved/pages   # needs its own manifest.json
+
+manifest.json maps file names to {"kind": "html" | "json", "expected": price or null}.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from price_extractors import EXTRACTORS  # noqa: E402
+
+DEFAULT_FIXTURES = os.path.join(BENCH_DIR, "fixtures", "market")
+EXTRACTOR_KINDS = {"json": "json", "html_fast": "html", "html_soup": "html"}
+
+
+def load_fixtures(directory):
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    fixtures = []
+    for file_name, meta in sorted(manifest.items()):
+        with open(os.path.join(directory, file_name), "rb") as f:
+            fixtures.append((file_name, meta["kind"], meta.get("expected"), f.read()))
+    return fixtures
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run_extractor(extractor, fixtures, iterations):
+    timings_us, successes, failures = [], 0, []
+    for file_name, _, expected, content in fixtures:
+        price = extractor.parse(content)  # Warm-up; also the result that is scored
+        ok = price == expected if expected is None else price is not None and abs(price - expected) < 0.005
+        successes += ok
+        if not ok:
+            failures.append(file_name)
+        for _ in range(iterations):
+            started = time.perf_counter()
+            extractor.parse(content)
+            timings_us.append((time.perf_counter() - started) * 1e6)
+    timings_us.sort()
+    return {
+        "fixtures": len(fixtures),
+        "success_rate": round(successes / len(fixtures), 3),
+        "failed_fixtures": failures,
+        "p50_us": round(percentile(timings_us, 0.50), 1),
+        "p95_us": round(percentile(timings_us, 0.95), 1),
+        "mean_us": round(sum(timings_us) / len(timings_us), 1),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Directory with manifest.json and saved responses")
+    parser.add_argument("--iterations", type=int, default=500, help="Timed parses per fixture")
+    parser.add_argument("--output", help="Optional JSON results file")
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures(args.fixtures)
+    results = {}
+    for name, extractor in EXTRACTORS.items():
+        applicable = [fixture for fixture in fixtures if fixture[1] == EXTRACTOR_KINDS[name]]
+        if not applicable:
+            continue
+        stats = run_extractor(extractor, applicable, args.iterations)
+        results[name] = stats
+        failed = f"  failed: {', '.join(stats['failed_fixtures'])}" if stats["failed_fixtures"] else ""
+        print(f"{name:10} {stats['fixtures']} fixtures  success {stats['success_rate']:6.1%}  "
+              f"p50 {stats['p50_us']:9.1f} us  p95 {stats['p95_us']:9.1f} us{failed}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"iterations": args.iterations, "extractors": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
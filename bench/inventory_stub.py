@@ -0,0 +1,150 @@
+"""Local stand-in for Steam's inventory endpoint, for exercising inventory_sync.py.
+
+Serves /inventory/<steamid>/730/2 from <steamid>.json files in a directory,
+each holding {"assets": [...], "descriptions": [...]} with assets newest
+first, as Steam returns them. Files are re-read on every request, so items
+can be added while a sync runs. Supports count/start_assetid paging, ETag
+with If-None-Match (304), and answers 403 for SteamIDs without a file, like
+a private inventory. Every request is logged, so you can check how many
+pages each run downloads.
+
+    python bench/inventory_stub.py --dir /tmp/inventories --port 8001
+    STEAM_INVENTORY_BASE_URL=http://127.0.0.1:8001 python inventory_sync.py
+
+Tests start it in a thread with start_server(directory, port=0).
+
+--generate N writes N synthetic inventories (SteamIDs 76561190000000000 + i)
+holding a few containers and graffiti named after the bench catalog cases
+("Bench Case <n>", see datagen.py).
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIRST_STEAMID = 76561190000000000
+
+
+def item(assetid, classid, name, type_tag, type_text):
+    asset = {"appid": 730, "contextid": "2", "assetid": str(assetid), "classid": str(classid), "instanceid": "0", "amount": "1"}
+    description = {"classid": str(classid), "instanceid": "0", "market_hash_name": name, "name": name,
+                   "type": type_text, "tags": [{"category": "Type", "internal_name": type_tag}]}
+    return asset, description
+
+
+def generate(directory, inventories, cases=40, seed=42):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    assetid = 30000000000
+    for i in range(inventories):
+        assets, descriptions = [], {}
+        for _ in range(rng.randint(5, 40)):
+            assetid += rng.randint(1, 1000)
+            if rng.random() < 0.6:
+                case_number = rng.randrange(cases)
+                asset, description = item(assetid, 1000 + case_number, f"Bench Case {case_number}",
+                                          "CSGO_Type_WeaponCase", "Base Grade Container")
+            else:
+                asset, description = item(assetid, 5000, "Sealed Graffiti | Stub (Shark White)",
+                                          "CSGO_Type_Spray", "Base Grade Graffiti")
+            assets.append(asset)
+            descriptions[description["classid"]] = description
+        assets.reverse()  # Newest first
+        with open(os.path.join(directory, f"{FIRST_STEAMID + i}.json"), "w") as f:
+            json.dump({"assets": assets, "descriptions": list(descriptions.values())}, f)
+
+
+class InventoryHandler(BaseHTTPRequestHandler):
+    directory = "."
+    # Request counters shared by every handler of a server; see start_server
+    state = None
+
+    def _count(self, status):
+        if self.state is not None:
+            with self.state["lock"]:
+                self.state["requests"] += 1
+                self.state["by_status"][status] = self.state["by_status"].get(status, 0) + 1
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        segments = parts.path.strip("/").split("/")
+        if len(segments) != 4 or segments[0] != "inventory":
+            self._count(404)
+            self.send_error(404)
+            return
+        path = os.path.join(self.directory, f"{segments[1]}.json")
+        if not os.path.exists(path):
+            self._count(403)
+            self.send_error(403)  # What Steam answers for private profiles
+            return
+        with open(path, "rb") as f:
+            raw = f.read()
+        etag = '"' + hashlib.sha1(raw).hexdigest() + '"'
+        query = parse_qs(parts.query)
+        start_assetid = query.get("start_assetid", [None])[0]
+        if not start_assetid and self.headers.get("If-None-Match") == etag:
+            self._count(304)
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        inventory = json.loads(raw)
+        assets = inventory.get("assets", [])
+        count = int(query.get("count", ["2000"])[0])
+        start = 0
+        if start_assetid:
+            start = next((i + 1 for i, asset in enumerate(assets) if asset["assetid"] == start_assetid), len(assets))
+        page = assets[start:start + count]
+        used = {(asset["classid"], asset["instanceid"]) for asset in page}
+        body = {
+            "assets": page,
+            "descriptions": [d for d in inventory.get("descriptions", []) if (d["classid"], d["instanceid"]) in used],
+            "total_inventory_count": len(assets),
+            "success": 1,
+        }
+        if start + count < len(assets):
+            body.update(more_items=1, last_assetid=page[-1]["assetid"])
+        payload = json.dumps(body).encode()
+        self._count(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if not start_assetid:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_server(directory, port=0):
+    """Serves `directory` on 127.0.0.1:port (0 picks a free port) from a daemon thread. Returns (server, handler class)."""
+    handler = type("ConfiguredInventoryHandler", (InventoryHandler,), {
+        "directory": directory,
+        "state": {"lock": threading.Lock(), "requests": 0, "by_status": {}},
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="inventory-stub", daemon=True).start()
+    return server, handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default="inventories")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--generate", type=int, default=0, help="Write this many synthetic inventories first")
+    args = parser.parse_args()
+    if args.generate:
+        generate(args.dir, args.generate)
+        print(f"Wrote {args.generate} inventories to {args.dir}")
+    InventoryHandler.directory = args.dir
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), InventoryHandler)
+    print(f"Serving inventories from {args.dir} on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Local stand-in for the Steam market, for exercising price_refresh.py.
+
+Serves the recorded responses in bench/fixtures/market for the URLs the
+price extractors request (price_extractors.py):
+
+    /market/priceoverview/           priceoverview.json
+    /market/search/render/           search_render.json
+    /market/search, /market/listings/730/<name>   search_page.html
+
+Cases named in --no-price get the failed/empty responses instead, like an item
+without listings. --fail-first N answers 429 (with Retry-After) to the first N
+requests for every URL, and --throttle-every N to every Nth request overall,
+so the refresh's retry/backoff path runs against a real HTTP server. Every
+request is logged, so you can check how many a refresh makes.
+
+    python bench/market_stub.py --port 8000 --fail-first 1
+    STEAM_MARKET_BASE_URL=http://127.0.0.1:8000 python price_jobs.py --mode full
+
+Tests start it in a thread with start_server(port=0).
+"""
+import argparse
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "market")
+LISTING_PREFIX = "/market/listings/730/"
+
+
+class MarketHandler(BaseHTTPRequestHandler):
+    fixtures = DEFAULT_FIXTURES
+    no_price = frozenset()
+    fail_first = 0
+    throttle_every = 0
+    retry_after = "0"
+    # Shared by every handler of a server; see start_server
+    state = None
+
+    def _fixture_for(self, path, query):
+        """(file name, content type) for a market URL, or (None, None) for unknown paths."""
+        if path == "/market/priceoverview/":
+            name = query.get("market_hash_name", [""])[0]
+            return ("priceoverview_failed.json" if name in self.no_price else "priceoverview.json"), "application/json"
+        if path == "/market/search/render/":
+            name = query.get("query", [""])[0]
+            return ("search_render_empty.json" if name in self.no_price else "search_render.json"), "application/json"
+        if path.rstrip("/") == "/market/search":
+            name = query.get("q", [""])[0]
+        elif path.startswith(LISTING_PREFIX):
+            name = unquote(path[len(LISTING_PREFIX):])
+        else:
+            return None, None
+        return ("search_page_no_results.html" if name in self.no_price else "search_page.html"), "text/html"
+
+    def _should_throttle(self):
+        with self.state["lock"]:
+            self.state["requests"] += 1
+            seen = self.state["per_url"].get(self.path, 0)
+            self.state["per_url"][self.path] = seen + 1
+            throttle = seen < self.fail_first or (
+                self.throttle_every and self.state["requests"] % self.throttle_every == 0)
+            if throttle:
+                self.state["throttled"] += 1
+            return throttle
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        file_name, content_type = self._fixture_for(parts.path, parse_qs(parts.query))
+        if file_name is None:
+            self.send_error(404)
+            return
+        if self._should_throttle():
+            self.send_response(429)
+            self.send_header("Retry-After", self.retry_after)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with open(os.path.join(self.fixtures, file_name), "rb") as f:
+            payload = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_handler(fixtures=DEFAULT_FIXTURES, no_price=(), fail_first=0, throttle_every=0, retry_after="0"):
+    """A MarketHandler subclass with its own settings and request counters (handler.state)."""
+    return type("ConfiguredMarketHandler", (MarketHandler,), {
+        "fixtures": fixtures,
+        "no_price": frozenset(no_price),
+        "fail_first": fail_first,
+        "throttle_every": throttle_every,
+        "retry_after": str(retry_after),
+        "state": {"lock": threading.Lock(), "requests": 0, "throttled": 0, "per_url": {}},
+    })
+
+
+def start_server(port=0, **settings):
+    """Serves on 127.0.0.1:port (0 picks a free port) from a daemon thread. Returns (server, handler class)."""
+    handler = make_handler(**settings)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="market-stub", daemon=True).start()
+    return server, handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--no-price", action="append", default=[], help="Case name served without a price (repeatable)")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer 429 to the first N requests for each URL")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer 429 to every Nth request")
+    parser.add_argument("--retry-after", default="1", help="Retry-After header sent with each 429 (seconds)")
+    args = parser.parse_args()
+    handler = make_handler(args.fixtures, args.no_price, args.fail_first, args.throttle_every, args.retry_after)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    print(f"Serving market pages from {args.fixtures} on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Benchmark suite for the request paths and the price-parsing step.
+
+Seeds a synthetic dataset (bench/datagen.py) into a local mongod or an
+in-memory mongomock database, drives the Flask app in-process and reports
+p50/p95/p99 latency and database operations per request for each scenario.
+Results are written as JSON so runs from different commits can be compared.
+
+    python bench/run.py                                   # local mongod, default sizes
+    python bench/run.py --backend mongomock --iterations 100
+    python bench/run.py --output bench/results/after.json --compare bench/results/before.json
+
+Scenarios: index, get_week_data, update_account_order, add_progress, price_parse.
+A run in which any request fails is marked invalid and exits non-zero.
+Scenarios listed in MONGOD_ONLY are skipped on the mongomock backend.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from datagen import generate, market_page_html  # noqa: E402
+
+SCENARIOS = ("index", "get_week_data", "update_account_order", "add_progress", "price_parse")
+REGRESSION_THRESHOLD = 1.25  # --compare fails when a p95 grows by more than this factor
+# Scenarios that need a real mongod, with the reason they cannot run on mongomock
+MONGOD_ONLY = {
+    "update_account_order": "mongomock cannot run pymongo's UpdateOne objects in bulk_write",
+}
+
+
+class CountingCollection:
+    """Forwards to a collection and counts every method call as one database operation."""
+
+    def __init__(self, counter, collection):
+        self._counter = counter
+        self._collection = collection
+
+    def __getattr__(self, attr):
+        value = getattr(self._collection, attr)
+        if not callable(value):
+            return value
+
+        def counted(*args, **kwargs):
+            self._counter.operations += 1
+            return value(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    """Database wrapper installed with mongo.use_database() so scenarios can report queries per request."""
+
+    def __init__(self, db):
+        self._db = db
+        self.operations = 0
+
+    def __getitem__(self, name):
+        return CountingCollection(self, self._db[name])
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("mongod", "mongomock"), default="mongod")
+    parser.add_argument("--uri", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--db", default="cs2_tracker_bench", help="Dropped and re-seeded on every run")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--accounts", type=int, default=30, help="Accounts per user")
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--cases", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset to run")
+    parser.add_argument("--output", help="JSON results file (default bench/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file; exit non-zero on a p95 regression")
+    return parser.parse_args(argv)
+
+
+def open_database(args):
+    if args.backend == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("The mongomock backend needs `pip install -r requirements-dev.txt`.")
+        return mongomock.MongoClient()[args.db]
+    from pymongo import MongoClient
+    return MongoClient(args.uri)[args.db]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def measure(name, step, counter, iterations, warmup):
+    """Runs step(i) warmup + iterations times; step returns True on success."""
+    for i in range(warmup):
+        step(i)
+    latencies, operations, errors = [], [], 0
+    for i in range(iterations):
+        before = counter.operations if counter else 0
+        started = time.perf_counter()
+        try:
+            ok = step(warmup + i)
+        except Exception as e:
+            print(f"  {name}: iteration {i} failed: {e}")
+            ok = False
+        latencies.append((time.perf_counter() - started) * 1000)
+        operations.append((counter.operations - before) if counter else 0)
+        errors += not ok
+    latencies.sort()
+    return {
+        "iterations": iterations, "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "queries_per_request": round(sum(operations) / len(operations), 2) if counter else None,
+    }
+
+
+def build_scenarios(flask_app, dataset, rng):
+    user_id = dataset["user_ids"][0]
+    account_ids = dataset["account_ids"][user_id]
+    weeks = dataset["weeks"]
+    client = flask_app.test_client()
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    client.set_cookie(flask_app.config.get("SESSION_COOKIE_NAME", "session"),
+                      serializer.dumps({"_user_id": str(user_id), "_fresh": True}))
+    pages = [market_page_html(round(rng.uniform(0.5, 50), 2)) for _ in range(20)]
+
+    def index(i):
+        return client.get("/").status_code == 200
+
+    def get_week_data(i):
+        return client.get(f"/get_week_data?date={weeks[i % len(weeks)]:%Y-%m-%d}").status_code == 200
+
+    def update_account_order(i):
+        ordered = [str(account_id) for account_id in account_ids]
+        random.Random(i).shuffle(ordered)
+        return client.post("/update_account_order", json={"ordered_ids": ordered}).status_code == 200
+
+    def add_progress(i):
+        response = client.post("/add_progress", data={
+            "account_doc_id": str(account_ids[i % len(account_ids)]),
+            "week_start": f"{weeks[(i // len(account_ids)) % len(weeks)]:%Y-%m-%d}",
+            "drop_farmed": "on" if i % 3 else "",
+            "case_name": dataset["case_names"][i % len(dataset["case_names"])],
+        })
+        return response.status_code == 302
+
+    def price_parse(i):
+        from price_refresh import parse_market_price
+        return parse_market_price(pages[i % len(pages)]) is not None
+
+    return {"index": index, "get_week_data": get_week_data, "update_account_order": update_account_order,
+            "add_progress": add_progress, "price_parse": price_parse}
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}):")
+    for name, stats in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before or not before.get("p95_ms") or before.get("errors") or "p95_ms" not in stats:
+            continue
+        ratio = stats["p95_ms"] / before["p95_ms"]
+        flag = "REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+        print(f"  {name:22} p95 {before['p95_ms']:9.3f} -> {stats['p95_ms']:9.3f} ms ({ratio:5.2f}x)  "
+              f"queries {before.get('queries_per_request')} -> {stats.get('queries_per_request')} {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv):
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    os.environ.setdefault("MONGO_URI", args.uri)
+    os.environ["MONGO_DB_NAME"] = args.db
+    rng = random.Random(args.seed)
+
+    raw_db = open_database(args)
+    started = time.perf_counter()
+    dataset = generate(raw_db, users=args.users, accounts=args.accounts, weeks=args.weeks,
+                       cases=args.cases, seed=args.seed)
+    print(f"Seeded {args.users} users x {args.accounts} accounts x {args.weeks} weeks "
+          f"({dataset['progress_rows']} progress rows) in {time.perf_counter() - started:.1f}s")
+
+    import mongo
+    from indexes import ensure_indexes
+
+    ensure_indexes(raw_db)
+    counter = CountingDatabase(raw_db)
+    mongo.use_database(counter)
+    from app import app as flask_app
+
+    steps = build_scenarios(flask_app, dataset, rng)
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "dataset": {"users": args.users, "accounts": args.accounts, "weeks": args.weeks,
+                    "cases": args.cases, "seed": args.seed},
+        "scenarios": {},
+    }
+    for name in scenarios:
+        if args.backend == "mongomock" and name in MONGOD_ONLY:
+            results["scenarios"][name] = {"skipped": MONGOD_ONLY[name]}
+            print(f"{name:22} skipped on mongomock: {MONGOD_ONLY[name]}")
+            continue
+        stats = measure(name, steps[name], None if name == "price_parse" else counter, args.iterations, args.warmup)
+        results["scenarios"][name] = stats
+        print(f"{name:22} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms  "
+              f"queries/request {stats['queries_per_request']}  errors {stats['errors']}")
+    failed = [name for name, stats in results["scenarios"].items() if stats.get("errors")]
+    results["valid"] = not failed
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if failed:
+        # Failed requests return early, so their latencies and query counts are not comparable
+        print(f"INVALID RUN: requests failed in {', '.join(failed)}; fix them before reading the numbers.")
+        return 1
+    if args.compare:
+        regressions = compare(results, args.compare)
+        if regressions:
+            print(f"p95 regressed by more than {REGRESSION_THRESHOLD}x: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
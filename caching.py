@@ -0,0 +1,145 @@
+"""Small in-process caches used on the hot request paths.
+
+These live per worker process. Writers in the same process invalidate them
+directly; a TTL bounds how long other processes (e.g. other Vercel instances)
+can serve stale data.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+class CatalogSnapshot:
+    """Immutable view of the cases collection: price lookup plus the pre-sorted dropdown list."""
+
+    def __init__(self, version, cases, loaded_at):
+        self.version = version
+        self.loaded_at = loaded_at
+        self.price_map = {case['case_name']: case.get('case_price', 0.0) for case in cases}
+        # For dropdowns (newest release first)
+        sorted_cases = sorted(cases, key=lambda x: x.get('release_date') or datetime.min, reverse=True)
+        self.dropdown = [{"name": case['case_name']} for case in sorted_cases]
+        # Content hash for ETags: `version` only counts invalidations in this process
+        self.digest = hashlib.sha1(repr((sorted(self.price_map.items()), [case["name"] for case in self.dropdown]))
+                                   .encode()).hexdigest()[:16]
+
+
+class CatalogCache:
+    """
+    Process-level cache of the case catalog.
+    A version stamp is bumped by invalidate() whenever prices change (admin edits, price refresh);
+    the next get() then reloads. ttl_seconds is a backstop for changes made by other processes.
+    """
+
+    def __init__(self, loader, ttl_seconds=300, clock=time.monotonic):
+        self._loader = loader  # Callable returning the list of case documents
+        self._ttl = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def fresh(self):
+        """The cached snapshot if it is still valid, otherwise None. Never loads."""
+        snapshot = self._snapshot
+        if snapshot and snapshot.version == self._version and self._clock() - snapshot.loaded_at < self._ttl:
+            return snapshot
+        return None
+
+    def _build(self, cases, version):
+        for case in cases:  # pymongo returns naive datetimes; normalise so sorting never mixes kinds
+            release_date = case.get('release_date')
+            if isinstance(release_date, datetime) and release_date.tzinfo is not None:
+                case['release_date'] = release_date.astimezone(timezone.utc).replace(tzinfo=None)
+        return CatalogSnapshot(version, cases, self._clock())
+
+    def store(self, cases, version):
+        """
+        Caches case documents loaded outside get() (e.g. by an async driver). `version` must be the
+        value of .version read before the load started, so a concurrent invalidate() is not lost.
+        """
+        snapshot = self._build(cases, version)
+        with self._lock:
+            if version == self._version:
+                self._snapshot = snapshot
+        return snapshot
+
+    def get(self):
+        snapshot = self.fresh()
+        if snapshot:
+            return snapshot
+        with self._lock:
+            snapshot = self.fresh()
+            if snapshot:
+                return snapshot  # Another thread reloaded while we waited
+            snapshot = self._build(self._loader(), self._version)
+            self._snapshot = snapshot
+            return snapshot
+
+
+class LRUTTLCache:
+    """Bounded, thread-safe LRU cache whose entries also expire after ttl_seconds. Tracks hit/miss counts."""
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=1024, ttl_seconds=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is not self._MISSING:
+                expires_at, value = entry
+                if self._clock() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]  # Expired
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,191 @@
+"""Install-wide drop statistics for admins (the drop_stats collection).
+
+One document per week, holding counts only:
+    {week_start, logged_count, farmed_count, user_count, case_counts: {case_key: n}, updated_at}
+
+Every weekly_progress write sets last_updated, so compaction only rebuilds
+the weeks that have a row updated since the last checkpoint (stored in
+rollup_checkpoints). Those weeks are regrouped with one aggregation over the
+week_start index, in batches. Values are not stored. They are computed when
+the stats are read, from the case counts and the price valid at each week.
+A price change therefore never makes a rollup stale.
+
+The first build scans every week, so it is a deploy step, like indexes.py:
+run --rebuild once before the admin page is used (and after restoring a
+backup). The admin page then only compacts the weeks changed since the
+checkpoint before reading, so it is at most one small incremental run behind;
+without a checkpoint it shows nothing rather than scanning every week. A
+scheduler can also run --compact.
+
+farmed_rate is the share of logged progress rows marked as farmed.
+
+Usage:
+    python drop_stats.py --compact   # rebuild weeks changed since the last checkpoint
+    python drop_stats.py --rebuild   # rebuild every week (required once at deploy time)
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReplaceOne
+
+from price_history import get_price_timelines, price_from_timeline
+from week_view import as_utc
+from weekly_totals import case_key, case_name_from_key
+
+CHECKPOINT_ID = "drop_stats"
+COMPACT_BATCH_WEEKS = 100
+# Rows committed slightly after their last_updated timestamp are picked up by the next run
+CHECKPOINT_SAFETY = timedelta(seconds=60)
+
+
+def changed_weeks(progress_collection, since):
+    """Week starts with a progress row updated after `since` (every week when since is None)."""
+    pipeline = [{"$group": {"_id": "$week_start"}}]
+    if since is not None:
+        pipeline.insert(0, {"$match": {"last_updated": {"$gt": since}}})
+    return sorted(as_utc(row["_id"]) for row in progress_collection.aggregate(pipeline) if row["_id"])
+
+
+def _week_docs(progress_collection, week_starts):
+    """drop_stats documents for the given weeks, grouped by (week, farmed case) in MongoDB."""
+    pipeline = [
+        {"$match": {"week_start": {"$in": week_starts}}},
+        {"$group": {
+            "_id": {"week": "$week_start", "case": {"$cond": ["$drop_farmed", "$case_name", None]}},
+            "logged": {"$sum": 1},
+            "farmed": {"$sum": {"$cond": ["$drop_farmed", 1, 0]}},
+            "users": {"$addToSet": "$user_id"},
+        }},
+    ]
+    docs, users = {}, {}
+    for week_start in week_starts:
+        docs[week_start] = {"week_start": week_start, "logged_count": 0, "farmed_count": 0, "user_count": 0,
+                            "case_counts": {}}
+        users[week_start] = set()
+    for row in progress_collection.aggregate(pipeline):
+        week_start = as_utc(row["_id"]["week"])
+        doc = docs.get(week_start)
+        if doc is None:
+            continue
+        doc["logged_count"] += row["logged"]
+        doc["farmed_count"] += row["farmed"]
+        users[week_start].update(row["users"])
+        case_name = row["_id"].get("case")
+        if case_name and row["farmed"]:
+            key = case_key(case_name)
+            doc["case_counts"][key] = doc["case_counts"].get(key, 0) + row["farmed"]
+    for week_start, doc in docs.items():
+        doc["user_count"] = len(users[week_start])
+    return docs
+
+
+def compact(stats_collection, progress_collection, checkpoints_collection, full=False, incremental_only=False,
+            now=None):
+    """
+    Rebuilds the drop_stats documents of weeks changed since the checkpoint (all weeks if full or
+    no checkpoint exists yet), then moves the checkpoint. Returns the number of weeks rebuilt.
+    With incremental_only, a missing checkpoint rebuilds nothing (the --rebuild deploy step has not run).
+    """
+    now = now or datetime.now(timezone.utc)
+    checkpoint = None if full else checkpoints_collection.find_one({"_id": CHECKPOINT_ID})
+    if incremental_only and not full and checkpoint is None:
+        return 0
+    since = checkpoint.get("last_updated") if checkpoint else None
+    weeks = changed_weeks(progress_collection, since)
+
+    for i in range(0, len(weeks), COMPACT_BATCH_WEEKS):
+        docs = _week_docs(progress_collection, weeks[i:i + COMPACT_BATCH_WEEKS])
+        operations = []
+        for week_start, doc in docs.items():
+            doc["updated_at"] = now
+            operations.append(ReplaceOne({"week_start": week_start}, doc, upsert=True))
+        stats_collection.bulk_write(operations, ordered=False)
+
+    checkpoints_collection.update_one(
+        {"_id": CHECKPOINT_ID},
+        {"$set": {"last_updated": now - CHECKPOINT_SAFETY, "last_run_at": now, "weeks_rebuilt": len(weeks)}},
+        upsert=True
+    )
+    return len(weeks)
+
+
+def read_drop_stats(stats_collection, history_collection, case_price_map, recent_weeks=26):
+    """
+    Install-wide totals plus per-week rows for the most recent `recent_weeks` weeks, with values in USD
+    (each drop at the price valid when its week started, like the user views).
+    """
+    docs = list(stats_collection.find({}, {"_id": 0}).sort("week_start", -1))
+    case_names = {case_name_from_key(key) for doc in docs for key in doc.get("case_counts", {})}
+    latest_week = as_utc(docs[0]["week_start"]) if docs else None
+    timelines = get_price_timelines(history_collection, case_names, latest_week) if latest_week else {}
+
+    totals = {"weeks": len(docs), "logged_count": 0, "farmed_count": 0, "total_value": 0.0, "case_counts": {}}
+    weeks = []
+    for position, doc in enumerate(docs):
+        week_start = as_utc(doc["week_start"])
+        week_value = 0.0
+        cases = []
+        for key, count in (doc.get("case_counts") or {}).items():
+            case_name = case_name_from_key(key)
+            price = price_from_timeline(timelines.get(case_name), week_start)
+            value = count * (price if price is not None else case_price_map.get(case_name, 0.0))
+            week_value += value
+            cases.append({"name": case_name, "count": count, "value": round(value, 2)})
+            totals["case_counts"][case_name] = totals["case_counts"].get(case_name, 0) + count
+        totals["logged_count"] += doc.get("logged_count", 0)
+        totals["farmed_count"] += doc.get("farmed_count", 0)
+        totals["total_value"] += week_value
+        if position < recent_weeks:
+            logged = doc.get("logged_count", 0)
+            weeks.append({
+                "week_start": week_start.strftime('%Y-%m-%d'),
+                "logged_count": logged,
+                "farmed_count": doc.get("farmed_count", 0),
+                "farmed_rate": round(doc.get("farmed_count", 0) / logged, 4) if logged else 0.0,
+                "user_count": doc.get("user_count", 0),
+                "total_value": round(week_value, 2),
+                "cases": sorted(cases, key=lambda case: case["count"], reverse=True),
+            })
+    totals["total_value"] = round(totals["total_value"], 2)
+    totals["farmed_rate"] = round(totals["farmed_count"] / totals["logged_count"], 4) if totals["logged_count"] else 0.0
+    totals["case_counts"] = dict(sorted(totals["case_counts"].items(), key=lambda item: item[1], reverse=True))
+    return {"totals": totals, "weeks": weeks}
+
+
+def drop_stats_in_currency(payload, currency):
+    """Copy of a read_drop_stats payload with values in `currency` (fx.CurrencyDisplay)."""
+    return dict(
+        payload,
+        totals=dict(payload["totals"], total_value=currency.convert(payload["totals"]["total_value"])),
+        weeks=[
+            dict(week, total_value=currency.convert(week["total_value"]),
+                 cases=[dict(case, value=currency.convert(case["value"])) for case in week["cases"]])
+            for week in payload["weeks"]
+        ],
+        currency=currency.to_json(),
+    )
+
+
+def main(argv):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    from indexes import DB_NAME
+
+    if "--compact" not in argv and "--rebuild" not in argv:
+        print(__doc__)
+        return 2
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("CRITICAL ERROR: MONGO_URI environment variable not set.")
+        return 2
+    db = MongoClient(mongo_uri)[DB_NAME]
+    weeks = compact(db.drop_stats, db.weekly_progress, db.rollup_checkpoints, full="--rebuild" in argv)
+    print(f"Rebuilt drop stats for {weeks} week(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
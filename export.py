@@ -0,0 +1,106 @@
+"""Streaming export of a user's farming history as CSV or NDJSON.
+
+Progress rows are read from a batched cursor in (week_start, account) order,
+which the user_week_account_unique index serves without an in-memory sort,
+and written out as they arrive, so memory use stays flat however long the
+history is. Account names come from the user's accounts (loaded once) and
+drops are valued at the price valid when their week started, from one scan
+of the catalog cases' price history. Output is produced in ~64 KB chunks and
+can be gzipped on the fly.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING
+
+from price_history import get_price_timelines, price_from_timeline
+from week_view import as_utc
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))  # Progress rows per cursor batch
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_FIELDS = ["week_start", "account_name", "steamid", "drop_farmed", "case_name", "additional_drop",
+                 "case_value", "currency"]
+
+
+def iter_export_rows(progress_collection, history_collection, user_id, accounts, case_price_map, currency,
+                     start=None, end=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields one dict per progress row (EXPORT_FIELDS), oldest week first, optionally limited to
+    week_start in [start, end]. Rows of accounts that are no longer tracked keep empty names.
+    case_value is in `currency` (fx.CurrencyDisplay), valued like the week views.
+    """
+    query = {"user_id": user_id}
+    week_range = {}
+    if start:
+        week_range["$gte"] = start
+    if end:
+        week_range["$lte"] = end
+    if week_range:
+        query["week_start"] = week_range
+
+    accounts_by_id = {acc['_id']: acc for acc in accounts}
+    timelines = get_price_timelines(history_collection, case_price_map.keys(), end or datetime.now(timezone.utc))
+    cursor = progress_collection.find(
+        query, {"_id": 0, "account_doc_id": 1, "week_start": 1, "drop_farmed": 1, "case_name": 1, "additional_drop": 1}
+    ).sort([("week_start", ASCENDING), ("account_doc_id", ASCENDING)]).batch_size(batch_size)
+
+    for entry in cursor:
+        week_start = as_utc(entry["week_start"])
+        account = accounts_by_id.get(entry["account_doc_id"], {})
+        case_name = entry.get("case_name")
+        case_value = 0.0
+        if entry.get("drop_farmed") and case_name:
+            price = price_from_timeline(timelines.get(case_name), week_start)
+            case_value = currency.convert(price if price is not None else case_price_map.get(case_name, 0.0))
+        yield {
+            "week_start": week_start.strftime('%Y-%m-%d'),
+            "account_name": account.get("account_name", ""),
+            "steamid": account.get("steamid", ""),
+            "drop_farmed": bool(entry.get("drop_farmed")),
+            "case_name": case_name or "",
+            "additional_drop": entry.get("additional_drop") or "",
+            "case_value": case_value,
+            "currency": currency.code,
+        }
+
+
+def csv_chunks(rows):
+    """CSV text (header first) in chunks of about EXPORT_CHUNK_BYTES."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows):
+    """One JSON object per line, in chunks of about EXPORT_CHUNK_BYTES."""
+    lines, size = [], 0
+    for row in rows:
+        line = json.dumps(row, ensure_ascii=False) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(lines)
+            lines, size = [], 0
+    yield "".join(lines)
+
+
+def gzip_chunks(chunks):
+    """Compresses text chunks into a gzip stream without buffering the whole output."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
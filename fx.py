@@ -0,0 +1,267 @@
+"""USD exchange rates for showing prices in each user's display currency.
+
+Case prices and price history are stored in USD only. Conversion happens when
+a page or JSON response is rendered, using one cached rate table:
+
+    fx_rates: {_id: "USD", rates: {"INR": 83.1, "EUR": 0.92, ...}, fetched_at}
+
+The table is refreshed from Frankfurter at most once per FX_RATES_TTL_HOURS
+(by the price refresh job, or in the background when a request notices it is
+stale). A failed refresh keeps the last good table, so display currencies
+never silently fall back to USD while any rates were ever fetched; until the
+first successful fetch, amounts are shown in USD and labelled as such.
+
+Usage:
+    python fx.py --refresh                        # fetch rates now
+    python fx.py --convert-legacy-prices [RATE]   # one-off: INR-era case prices/history -> USD
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+FX_RATES_TTL_HOURS = float(os.getenv("FX_RATES_TTL_HOURS", "12"))
+FX_CACHE_TTL_SECONDS = int(os.getenv("FX_CACHE_TTL_SECONDS", "300"))  # How often a process re-reads the stored table
+DEFAULT_DISPLAY_CURRENCY = os.getenv("DEFAULT_DISPLAY_CURRENCY", "INR").upper()
+FX_API_URL = "https://api.frankfurter.app/latest?from=USD"
+RATES_DOC_ID = "USD"
+
+# Display currencies offered to users (all published by Frankfurter) and their symbols
+CURRENCY_SYMBOLS = {
+    "USD": "$", "INR": "₹", "EUR": "€", "GBP": "£", "CAD": "CA$", "AUD": "A$",
+    "BRL": "R$", "PLN": "zł", "TRY": "₺", "CNY": "¥", "JPY": "¥", "SEK": "kr",
+}
+
+
+def normalise_currency(code):
+    """Upper-cased supported currency code, or None."""
+    code = (code or "").strip().upper()
+    return code if code in CURRENCY_SYMBOLS else None
+
+
+def fetch_usd_rates(session=None, timeout=10):
+    """Returns {currency: units per USD} from Frankfurter. Raises on network or format errors."""
+    if session is None:
+        import requests
+        session = requests
+    response = session.get(FX_API_URL, timeout=timeout)
+    response.raise_for_status()
+    rates = response.json()["rates"]
+    parsed = {code: float(rate) for code, rate in rates.items() if float(rate) > 0}
+    if not parsed:
+        raise ValueError("Frankfurter returned no rates")
+    parsed["USD"] = 1.0
+    return parsed
+
+
+def _is_fresh(doc, now, ttl=None):
+    ttl = ttl if ttl is not None else timedelta(hours=FX_RATES_TTL_HOURS)
+    fetched_at = doc.get("fetched_at") if doc else None
+    if fetched_at is None:
+        return False
+    if fetched_at.tzinfo is None:  # pymongo returns naive UTC datetimes
+        fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+    return now - fetched_at < ttl
+
+
+def refresh_rates(fx_collection, session=None, force=False, now=None):
+    """
+    Fetches new rates unless the stored table is younger than FX_RATES_TTL_HOURS.
+    Returns (rates document or None, error message or None). On failure the last good
+    document is returned unchanged together with the error.
+    """
+    now = now or datetime.now(timezone.utc)
+    doc = fx_collection.find_one({"_id": RATES_DOC_ID})
+    if doc and not force and _is_fresh(doc, now):
+        return doc, None
+    try:
+        print("Fetching USD exchange rates from Frankfurter.app...")
+        rates = fetch_usd_rates(session)
+    except Exception as e:
+        print(f"Error fetching exchange rates from Frankfurter: {e}")
+        message = "Could not refresh exchange rates"
+        message += "; keeping the last good rates." if doc else "; prices are shown in USD until a fetch succeeds."
+        return doc, f"{message} ({e})"
+    doc = {"_id": RATES_DOC_ID, "rates": rates, "fetched_at": now}
+    fx_collection.replace_one({"_id": RATES_DOC_ID}, doc, upsert=True)
+    print(f"Stored exchange rates for {len(rates)} currencies")
+    return doc, None
+
+
+class CurrencyDisplay:
+    """A user's display currency with the rate used for this request."""
+
+    __slots__ = ("code", "symbol", "rate", "requested")
+
+    def __init__(self, code, rate, requested=None):
+        self.code = code
+        self.symbol = CURRENCY_SYMBOLS.get(code, code)
+        self.rate = rate
+        self.requested = requested or code  # Differs from code when the requested rate is unavailable
+
+    def convert(self, amount_usd):
+        return round((amount_usd or 0.0) * self.rate, 2)
+
+    def to_json(self):
+        return {"code": self.code, "symbol": self.symbol, "rate": self.rate}
+
+
+class FxRateCache:
+    """
+    Process-level copy of the stored rate table, re-read every ttl_seconds.
+    When the stored table is older than FX_RATES_TTL_HOURS (or missing), one background
+    thread per process refreshes it; requests keep using the table they have meanwhile.
+    """
+
+    def __init__(self, fx_collection, ttl_seconds=FX_CACHE_TTL_SECONDS, clock=time.monotonic,
+                 refresh_in_background=True):
+        self._collection = fx_collection
+        self._ttl = ttl_seconds
+        self._clock = clock
+        self._background = refresh_in_background
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._doc = None
+        self._refreshing = False
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def rates(self):
+        """{currency: units per USD}, {"USD": 1.0} until rates were fetched once."""
+        loaded_at = self._loaded_at
+        if loaded_at is None or self._clock() - loaded_at >= self._ttl:
+            with self._lock:
+                if self._loaded_at is None or self._clock() - self._loaded_at >= self._ttl:
+                    try:
+                        self._doc = self._collection.find_one({"_id": RATES_DOC_ID}) or self._doc
+                    except Exception as e:
+                        print(f"Error loading exchange rates: {e}")
+                    self._loaded_at = self._clock()
+                    if self._background and not _is_fresh(self._doc, datetime.now(timezone.utc)):
+                        self._start_refresh()
+        return (self._doc or {}).get("rates") or {"USD": 1.0}
+
+    def _start_refresh(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                doc, _ = refresh_rates(self._collection)
+                if doc:
+                    with self._lock:
+                        self._doc = doc
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="fx-refresh", daemon=True).start()
+
+    def display(self, currency):
+        """CurrencyDisplay for a currency code, falling back to USD when no rate is known for it."""
+        requested = normalise_currency(currency) or DEFAULT_DISPLAY_CURRENCY
+        rate = self.rates().get(requested)
+        if rate:
+            return CurrencyDisplay(requested, rate)
+        return CurrencyDisplay("USD", 1.0, requested=requested)
+
+
+def _legacy_rate_at(jobs, ts, default_rate):
+    """INR rate a legacy price written at ts was stored with: the refresh job running then, else default_rate."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    for started_at, finished_at, rate in jobs:
+        if started_at <= ts <= finished_at:
+            return rate  # 0.0: that job fell back to storing USD
+    return default_rate
+
+
+def convert_legacy_prices(db, default_rate):
+    """
+    Converts prices stored before the switch to USD (documents without currency: "USD").
+    Market refresh jobs recorded the INR rate they used (0 when they stored USD), so points
+    written by a job use that job's rate; everything else (manual edits) uses default_rate.
+    Returns (history points converted, cases converted).
+    """
+    def aware(value):
+        return value.replace(tzinfo=timezone.utc) if value and value.tzinfo is None else value
+
+    jobs = [
+        (aware(job["started_at"]), aware(job["finished_at"]), job.get("usd_to_inr_rate") or 0.0)
+        for job in db.price_refresh_jobs.find(
+            {"started_at": {"$ne": None}, "finished_at": {"$ne": None}},
+            {"started_at": 1, "finished_at": 1, "usd_to_inr_rate": 1}
+        )
+    ]
+
+    from pymongo import UpdateOne
+
+    def to_usd(price, rate):
+        return round(price / rate, 2) if rate else price
+
+    history_ops = []
+    latest_usd = {}
+    for point in db.case_price_history.find({"currency": {"$ne": "USD"}}).sort("ts", 1):
+        price_usd = to_usd(point.get("price") or 0.0, _legacy_rate_at(jobs, point["ts"], default_rate))
+        history_ops.append(UpdateOne({"_id": point["_id"]}, {"$set": {"price": price_usd, "currency": "USD"}}))
+        latest_usd[point["case_name"]] = price_usd
+    if history_ops:
+        db.case_price_history.bulk_write(history_ops, ordered=False)
+
+    case_ops = []
+    for case_doc in db.cases.find({"currency": {"$ne": "USD"}}, {"case_name": 1, "case_price": 1, "last_price_check": 1}):
+        if case_doc.get("case_name") in latest_usd:
+            price_usd = latest_usd[case_doc["case_name"]]
+        elif case_doc.get("last_price_check"):
+            price_usd = to_usd(case_doc.get("case_price") or 0.0, _legacy_rate_at(jobs, case_doc["last_price_check"], default_rate))
+        else:
+            price_usd = to_usd(case_doc.get("case_price") or 0.0, default_rate)
+        case_ops.append(UpdateOne({"_id": case_doc["_id"]}, {"$set": {"case_price": price_usd, "currency": "USD"}}))
+    if case_ops:
+        db.cases.bulk_write(case_ops, ordered=False)
+    return len(history_ops), len(case_ops)
+
+
+def main(argv):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    from indexes import DB_NAME
+
+    if "--refresh" not in argv and "--convert-legacy-prices" not in argv:
+        print(__doc__)
+        return 2
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("CRITICAL ERROR: MONGO_URI environment variable not set.")
+        return 2
+    db = MongoClient(mongo_uri)[DB_NAME]
+
+    if "--refresh" in argv:
+        doc, error = refresh_rates(db.fx_rates, force=True)
+        if error:
+            print(error)
+            return 1
+        return 0
+
+    position = argv.index("--convert-legacy-prices")
+    if len(argv) > position + 1:
+        default_rate = float(argv[position + 1])
+    else:
+        doc, error = refresh_rates(db.fx_rates)
+        default_rate = ((doc or {}).get("rates") or {}).get("INR")
+        if not default_rate:
+            print(f"No INR rate available ({error}); pass the rate explicitly.")
+            return 1
+    history_points, cases = convert_legacy_prices(db, default_rate)
+    print(f"Converted {history_points} history point(s) and {cases} case price(s) to USD "
+          f"(default rate {default_rate} INR/USD). Now run `python weekly_totals.py --rebuild`.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,77 @@
+"""Cold-start import budget for app.py, measured with `python -X importtime`.
+
+Imports app in a fresh interpreter, reports the cumulative import time and the
+slowest direct imports, and fails when the total exceeds the budget or when a
+module that should only load on the admin price paths (scraper/FX
+dependencies) is imported at startup.
+
+Usage:
+    python import_budget.py               # budget from IMPORT_BUDGET_MS (default 600)
+    python import_budget.py --budget 400  # explicit budget in milliseconds
+"""
+import os
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "600"))
+# Only needed by the background price refresh; must not load on a cold start
+LAZY_MODULES = ("requests", "bs4", "forex_python")
+TOP_N = 10
+
+
+def measure_imports(module="app"):
+    """Returns [(depth, module_name, self_us, cumulative_us)] for a fresh `import module`."""
+    env = dict(os.environ)
+    env.setdefault("MONGO_URI", "mongodb://127.0.0.1:27017") # Never contacted: the client is created lazily
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main(argv):
+    budget_ms = DEFAULT_BUDGET_MS
+    if "--budget" in argv:
+        budget_ms = float(argv[argv.index("--budget") + 1])
+
+    rows = measure_imports()
+    app_row = next((row for row in rows if row[1] == "app" and row[0] == 0), None)
+    if app_row is None:
+        print("Could not find app in the importtime output.")
+        return 2
+    total_ms = app_row[3] / 1000
+
+    # Direct imports of app are listed right before it at depth 1
+    app_index = rows.index(app_row)
+    direct = []
+    for depth, name, _, cumulative_us in reversed(rows[:app_index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct.append((cumulative_us / 1000, name))
+    print(f"import app: {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+    for cumulative_ms, name in sorted(direct, reverse=True)[:TOP_N]:
+        print(f"  {cumulative_ms:8.1f} ms  {name}")
+
+    loaded = {name.split(".")[0] for _, name, _, _ in rows}
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        print(f"FAIL: imported at startup but only needed by the price refresh: {', '.join(eager)}")
+    if total_ms > budget_ms:
+        print(f"FAIL: import time {total_ms:.1f} ms is over the {budget_ms:.0f} ms budget")
+    return 1 if eager or total_ms > budget_ms else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,313 @@
+"""Bulk import of tracked accounts and historical weekly progress (CSV, NDJSON or JSON).
+
+Rows are read as a stream and handled in chunks of IMPORT_CHUNK_SIZE. Each
+chunk is validated in one pass against lookups loaded once per import (the
+user's accounts and the case catalog) and written with one unordered
+bulk_write of upserts, so re-running an import updates rows instead of
+duplicating them. With dry_run=True nothing is written and the report says
+what would have happened.
+
+Columns:
+    accounts: account_name, steamid
+    progress: week_start (YYYY-MM-DD, snapped back to its Wednesday), steamid or account_name,
+              drop_farmed, case_name, additional_drop
+Files written by /export import as progress unchanged (extra columns are ignored).
+
+Usage:
+    python importer.py --user NAME accounts FILE [--dry-run]
+    python importer.py --user NAME progress FILE [--dry-run]
+"""
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from itertools import islice
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from week_view import week_start_of
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))  # Rows validated and written per bulk_write
+IMPORT_MAX_REPORTED_ERRORS = 100
+IMPORT_FORMATS = ("csv", "ndjson", "json")
+IMPORT_KINDS = ("accounts", "progress")
+
+_TRUE_VALUES = {"1", "true", "yes", "y", "on", "x"}
+_FALSE_VALUES = {"0", "false", "no", "n", "off", ""}
+
+
+def detect_format(filename):
+    """Import format from a file name's extension (csv by default)."""
+    extension = (filename or "").lower().rsplit(".", 1)[-1]
+    if extension in ("ndjson", "jsonl"):
+        return "ndjson"
+    return "json" if extension == "json" else "csv"
+
+
+def read_rows(stream, file_format):
+    """Yields (line number, row dict) from a binary stream without loading CSV/NDJSON input whole."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == "ndjson":
+        for line_number, line in enumerate(text, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+    else:
+        data = json.load(text)
+        for index, row in enumerate(data if isinstance(data, list) else [], start=1):
+            yield index, row
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _new_report(kind, dry_run):
+    return {"kind": kind, "dry_run": dry_run, "rows": 0, "valid": 0, "invalid": 0,
+            "inserted": 0, "updated": 0, "failed": 0, "errors": [], "errors_truncated": False}
+
+
+def _add_error(report, line, error):
+    report["invalid"] += 1
+    if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+        report["errors"].append({"line": line, "error": error})
+    else:
+        report["errors_truncated"] = True
+
+
+def _text(row, field):
+    value = row.get(field)
+    return "" if value is None else str(value).strip()
+
+
+def _parse_bool(value, default):
+    if isinstance(value, bool):
+        return value
+    text = "" if value is None else str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return default if text == "" else False
+    raise ValueError(f"Invalid drop_farmed value '{value}'.")
+
+
+def is_valid_steamid(steamid):
+    return steamid.isdigit() and len(steamid) == 17
+
+
+def _write_chunk(collection, operations, op_lines, report):
+    """One unordered bulk_write; per-operation failures are reported against their input lines."""
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        upserted, failed = result.upserted_count, {}
+    except BulkWriteError as bwe:
+        upserted = len(bwe.details.get("upserted", []))
+        failed = {error["index"]: error.get("errmsg", "Write failed.") for error in bwe.details.get("writeErrors", [])}
+    report["inserted"] += upserted
+    report["updated"] += len(operations) - upserted - len(failed)
+    report["failed"] += len(failed)
+    for index, message in failed.items():
+        if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": op_lines[index], "error": message})
+
+
+def import_accounts(accounts_collection, user_id, rows, dry_run=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Upserts accounts keyed on (user_id, steamid): new SteamIDs are appended after the current last
+    account, known ones get the imported name. `rows` yields (line, dict). Returns the report dict.
+    """
+    report = _new_report("accounts", dry_run)
+    existing = {}
+    next_sort_number = 0
+    for acc in accounts_collection.find({"user_id": user_id}, {"steamid": 1, "sort_number": 1}):
+        existing[acc.get("steamid")] = acc["_id"]
+        next_sort_number = max(next_sort_number, acc.get("sort_number", -1) + 1)
+    seen = set()
+    now = datetime.now(timezone.utc)
+
+    for chunk in _chunks(rows, chunk_size):
+        operations, op_lines = [], []
+        for line, row in chunk:
+            report["rows"] += 1
+            if not isinstance(row, dict):
+                _add_error(report, line, "Row is not an object.")
+                continue
+            account_name, steamid = _text(row, "account_name"), _text(row, "steamid")
+            if not account_name or not steamid:
+                _add_error(report, line, "account_name and steamid are required.")
+                continue
+            if not is_valid_steamid(steamid):
+                _add_error(report, line, f"Invalid SteamID64 '{steamid}'. Must be 17 digits.")
+                continue
+            if steamid in seen:
+                _add_error(report, line, f"SteamID {steamid} appears more than once.")
+                continue
+            seen.add(steamid)
+            report["valid"] += 1
+            is_new = steamid not in existing
+            if dry_run:
+                report["inserted" if is_new else "updated"] += 1
+                continue
+            on_insert = {"user_id": user_id, "steamid": steamid, "added_at": now}
+            if is_new:
+                on_insert["sort_number"] = next_sort_number
+                next_sort_number += 1
+            operations.append(UpdateOne(
+                {"user_id": user_id, "steamid": steamid},
+                {"$set": {"account_name": account_name}, "$setOnInsert": on_insert},
+                upsert=True
+            ))
+            op_lines.append(line)
+        if operations:
+            _write_chunk(accounts_collection, operations, op_lines, report)
+    return report
+
+
+def import_progress(progress_collection, accounts_collection, user_id, rows, case_names, dry_run=False,
+                    chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Upserts weekly_progress rows keyed on (user_id, account_doc_id, week_start). Accounts must already
+    exist (matched by steamid, else by unique account_name); case names are matched case-insensitively
+    against `case_names` (the catalog). Returns (report, {week_start written}); the caller rebuilds
+    the weekly_totals of those weeks.
+    """
+    report = _new_report("progress", dry_run)
+    by_steamid, by_name, ambiguous_names = {}, {}, set()
+    for acc in accounts_collection.find({"user_id": user_id}, {"steamid": 1, "account_name": 1}):
+        by_steamid[acc.get("steamid")] = acc["_id"]
+        name = (acc.get("account_name") or "").strip().lower()
+        if name in by_name:
+            ambiguous_names.add(name)
+        by_name[name] = acc["_id"]
+    cases = {name.lower(): name for name in case_names if name}
+    seen = set()
+    weeks = set()
+
+    for chunk in _chunks(rows, chunk_size):
+        operations, op_lines = [], []
+        now = datetime.now(timezone.utc)
+        for line, row in chunk:
+            report["rows"] += 1
+            if not isinstance(row, dict):
+                _add_error(report, line, "Row is not an object.")
+                continue
+            try:
+                week_start = week_start_of(datetime.strptime(_text(row, "week_start")[:10], '%Y-%m-%d'))
+            except ValueError:
+                _add_error(report, line, f"Invalid week_start '{_text(row, 'week_start')}'. Use YYYY-MM-DD.")
+                continue
+
+            steamid, account_name = _text(row, "steamid"), _text(row, "account_name").lower()
+            if steamid:
+                account_doc_id = by_steamid.get(steamid)
+                if account_doc_id is None:
+                    _add_error(report, line, f"No tracked account with SteamID {steamid}.")
+                    continue
+            elif account_name and account_name not in ambiguous_names and account_name in by_name:
+                account_doc_id = by_name[account_name]
+            else:
+                _add_error(report, line, "Unknown or ambiguous account; give its steamid.")
+                continue
+
+            case_text = _text(row, "case_name")
+            case_name = None
+            if case_text and case_text.upper() != "N/A":
+                case_name = cases.get(case_text.lower())
+                if case_name is None:
+                    _add_error(report, line, f"Unknown case '{case_text}'.")
+                    continue
+            try:
+                drop_farmed = _parse_bool(row.get("drop_farmed"), default=case_name is not None)
+            except ValueError as e:
+                _add_error(report, line, str(e))
+                continue
+
+            key = (account_doc_id, week_start)
+            if key in seen:
+                _add_error(report, line, "Account and week appear more than once.")
+                continue
+            seen.add(key)
+            report["valid"] += 1
+            if dry_run:
+                continue
+            additional_drop = _text(row, "additional_drop")
+            operations.append(UpdateOne(
+                {"user_id": user_id, "account_doc_id": account_doc_id, "week_start": week_start},
+                {
+                    "$set": {
+                        "drop_farmed": drop_farmed,
+                        "case_name": case_name if drop_farmed else None,
+                        "additional_drop": (additional_drop if additional_drop not in ("", "-") else None) if drop_farmed else None,
+                        "last_updated": now
+                    },
+                    "$setOnInsert": {"user_id": user_id, "account_doc_id": account_doc_id, "week_start": week_start}
+                },
+                upsert=True
+            ))
+            op_lines.append(line)
+            weeks.add(week_start)
+        if operations:
+            _write_chunk(progress_collection, operations, op_lines, report)
+    return report, weeks
+
+
+def main(argv):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    from indexes import DB_NAME
+    from weekly_totals import recompute_weeks
+
+    if "--user" not in argv or len(argv) < 4:
+        print(__doc__)
+        return 2
+    position = argv.index("--user")
+    username = argv[position + 1]
+    kind, path = [arg for i, arg in enumerate(argv) if i not in (position, position + 1) and arg != "--dry-run"][:2]
+    if kind not in IMPORT_KINDS:
+        print(__doc__)
+        return 2
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("CRITICAL ERROR: MONGO_URI environment variable not set.")
+        return 2
+    db = MongoClient(mongo_uri)[DB_NAME]
+    user = db.users.find_one({"username": username}, {"_id": 1})
+    if not user:
+        print(f"Unknown user '{username}'.")
+        return 1
+
+    dry_run = "--dry-run" in argv
+    with open(path, "rb") as stream:
+        rows = read_rows(stream, detect_format(path))
+        if kind == "accounts":
+            report = import_accounts(db.accounts, user["_id"], rows, dry_run=dry_run)
+        else:
+            catalog = list(db.cases.find({}, {"case_name": 1, "case_price": 1}))
+            report, weeks = import_progress(db.weekly_progress, db.accounts, user["_id"], rows,
+                                            [case.get("case_name") for case in catalog], dry_run=dry_run)
+            if weeks:
+                price_map = {case["case_name"]: case.get("case_price", 0.0) for case in catalog}
+                recompute_weeks(db.weekly_totals, db.weekly_progress, db.case_price_history, price_map,
+                                [(user["_id"], week_start) for week_start in weeks])
+    print(json.dumps(report, indent=2))
+    return 0 if not report["invalid"] and not report["failed"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,156 @@
+"""Index declarations for every collection, plus a verifier for the hot queries.
+
+Usage:
+    python indexes.py            # create/ensure all indexes
+    python indexes.py --verify   # ensure, then explain() each hot query and fail on COLLSCAN
+
+Run it at deploy time, before the new version takes traffic. It exits
+non-zero if any index cannot be built, which should fail the deploy. The
+unique indexes are what keeps accounts (user_id, steamid), usernames and
+weekly_progress (user_id, week_start, account_doc_id) free of duplicates, so
+they must exist before the app accepts writes. With
+ENSURE_INDEXES_ON_STARTUP=1 every new process also ensures them and refuses
+to start if that fails.
+"""
+import os
+import sys
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from price_history import PRICE_HISTORY_INDEX
+
+DB_NAME = "cs2_tracker_db"
+
+INDEX_SPECS = {
+    "weekly_progress": [
+        # Week views query (user_id, week_start, account_doc_id $in) and add_progress upserts on the same key
+        IndexModel([("user_id", ASCENDING), ("week_start", ASCENDING), ("account_doc_id", ASCENDING)],
+                   name="user_week_account_unique", unique=True),
+        # Cross-user scans by week (case popularity for incremental price refresh)
+        IndexModel([("week_start", ASCENDING)], name="week_start"),
+        # Weeks holding a case, for the targeted weekly_totals recompute after a price change
+        IndexModel([("case_name", ASCENDING), ("week_start", ASCENDING)], name="case_week"),
+        # Weeks changed since the drop_stats compaction checkpoint
+        IndexModel([("last_updated", ASCENDING)], name="last_updated"),
+    ],
+    "drop_stats": [
+        IndexModel([("week_start", ASCENDING)], name="week_start_unique", unique=True),
+    ],
+    "weekly_totals": [
+        IndexModel([("user_id", ASCENDING), ("week_start", ASCENDING)], name="user_week_unique", unique=True),
+    ],
+    "accounts": [
+        IndexModel([("user_id", ASCENDING), ("sort_number", ASCENDING)], name="user_sort_number"),
+        IndexModel([("user_id", ASCENDING), ("steamid", ASCENDING)], name="user_steamid_unique", unique=True),
+        # Prefix search on manage_accounts (anchored regex on account_name)
+        IndexModel([("user_id", ASCENDING), ("account_name", ASCENDING)], name="user_account_name"),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "case_price_history": [
+        IndexModel(PRICE_HISTORY_INDEX, name="case_name_ts"),
+    ],
+    "price_refresh_jobs": [
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created_at"),
+        # At most one queued/running job; only active jobs carry active_key
+        IndexModel([("active_key", ASCENDING)], name="active_key_unique", unique=True, sparse=True),
+    ],
+}
+
+
+def _hot_queries():
+    """(label, collection, filter, sort) for every query that runs on a request path."""
+    some_id = ObjectId()
+    some_date = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        ("week progress", "weekly_progress",
+         {"user_id": some_id, "week_start": some_date, "account_doc_id": {"$in": [some_id]}}, None),
+        ("progress upsert", "weekly_progress",
+         {"user_id": some_id, "account_doc_id": some_id, "week_start": some_date}, None),
+        ("case popularity", "weekly_progress",
+         {"week_start": {"$gte": some_date}, "drop_farmed": True}, None),
+        ("changed weeks", "weekly_progress", {"last_updated": {"$gt": some_date}}, None),
+        ("drop stats by week", "drop_stats", {}, [("week_start", DESCENDING)]),
+        ("weekly totals", "weekly_totals", {"user_id": some_id, "week_start": {"$gte": some_date}}, None),
+        ("accounts by order", "accounts", {"user_id": some_id}, [("sort_number", ASCENDING)]),
+        ("account by steamid", "accounts", {"user_id": some_id, "steamid": "76561190000000000"}, None),
+        ("account prefix search", "accounts",
+         {"user_id": some_id, "$or": [{"account_name": {"$regex": "^Main"}}, {"steamid": {"$regex": "^Main"}}]},
+         [("sort_number", ASCENDING)]),
+        ("user by username", "users", {"username": "someone"}, None),
+        ("price at time", "case_price_history",
+         {"case_name": "Some Case", "ts": {"$lte": some_date}}, [("ts", DESCENDING)]),
+        ("active price job", "price_refresh_jobs", {"active_key": "price_refresh"}, None),
+    ]
+
+
+def ensure_indexes(db):
+    """Creates every declared index (no-op for existing ones). Returns a list of error strings."""
+    errors = []
+    for collection_name, models in INDEX_SPECS.items():
+        try:
+            db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # Typically existing duplicate data blocking a unique index; report every collection, callers fail on errors
+            errors.append(f"{collection_name}: {e}")
+            print(f"ERROR: could not create indexes on {collection_name}: {e}")
+    return errors
+
+
+def _plan_stages(plan):
+    """Yields every 'stage' name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def verify_indexes(db):
+    """Runs explain() for each hot query. Returns [(label, stages)] for queries that fall back to COLLSCAN."""
+    failures = []
+    for label, collection_name, query_filter, sort in _hot_queries():
+        cursor = db[collection_name].find(query_filter)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(winning_plan))
+        if "COLLSCAN" in stages:
+            failures.append((label, stages))
+        print(f"{'FAIL' if 'COLLSCAN' in stages else 'ok  '} {label}: {' <- '.join(stages)}")
+    return failures
+
+
+def main(argv):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("CRITICAL ERROR: MONGO_URI environment variable not set.")
+        return 2
+    db = MongoClient(mongo_uri)[DB_NAME]
+
+    errors = ensure_indexes(db)
+    if errors:
+        print(f"ERROR: {len(errors)} collection(s) failed index creation; fix the data (e.g. remove duplicates) and rerun.")
+        return 1
+    print("Indexes ensured.")
+    if "--verify" in argv:
+        failures = verify_indexes(db)
+        if failures:
+            print(f"{len(failures)} hot query(ies) fall back to a COLLSCAN.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
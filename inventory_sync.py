@@ -0,0 +1,265 @@
+"""Detects weekly drops from the tracked accounts' public CS2 inventories.
+
+A pool of worker threads pulls inventories from Steam's inventory endpoint,
+sharing one token bucket with the same rate/retry handling as the market
+price refresh (price_refresh.py). Per account, inventory_sync_state keeps the
+newest asset id seen and the response ETag, so a run stays incremental:
+    * the first page is requested with If-None-Match, and a 304 costs no body;
+    * Steam lists newest assets first, so paging stops at the first page that
+      reaches an already-seen asset id. An unchanged inventory costs one small page.
+Asset ids only grow, so the new items are the ones above the stored newest id.
+New containers are matched by name against the cases collection and new
+graffiti become the additional drop. Both are upserted into weekly_progress for
+the week the sync runs in, without overwriting a case or additional drop that
+was already logged. An account's first sync only records the baseline.
+The changed weeks' weekly_totals are rebuilt at the end of the run.
+
+Usage:
+    python inventory_sync.py [--user NAME] [--dry-run]
+
+Set STEAM_INVENTORY_BASE_URL (e.g. http://127.0.0.1:8001) to sync against a
+local stub server instead of Steam (see bench/inventory_stub.py).
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import requests
+from pymongo import UpdateOne
+
+from price_refresh import PRICE_FETCH_MAX_RETRIES, TokenBucket, fetch_with_retries, rewrite_market_url
+from week_view import week_start_of
+
+# --- Configuration (overridable through the environment) ---
+INVENTORY_FETCH_RATE = float(os.getenv("INVENTORY_FETCH_RATE", "0.5"))  # Requests per second across all workers
+INVENTORY_FETCH_BURST = int(os.getenv("INVENTORY_FETCH_BURST", "2"))
+INVENTORY_SYNC_WORKERS = int(os.getenv("INVENTORY_SYNC_WORKERS", "4"))
+# Items per inventory page. The first page of an unchanged inventory is all a run downloads, so keep it small
+INVENTORY_PAGE_SIZE = int(os.getenv("INVENTORY_PAGE_SIZE", "100"))
+INVENTORY_MAX_PAGES = int(os.getenv("INVENTORY_MAX_PAGES", "50"))  # Safety cap per account and run
+STEAM_INVENTORY_BASE_URL = os.getenv("STEAM_INVENTORY_BASE_URL")
+
+INVENTORY_URL = "https://steamcommunity.com/inventory/{steamid}/730/2?l=english&count={count}"
+CASE_TYPE_TAGS = {"CSGO_Type_WeaponCase"}
+GRAFFITI_TYPE_TAGS = {"CSGO_Type_Spray"}
+
+
+def classify_item(description):
+    """'case', 'graffiti' or None for an inventory item description (by its Type tag, else its type text)."""
+    for tag in description.get("tags") or []:
+        if tag.get("category") == "Type":
+            if tag.get("internal_name") in CASE_TYPE_TAGS:
+                return "case"
+            if tag.get("internal_name") in GRAFFITI_TYPE_TAGS:
+                return "graffiti"
+            return None
+    type_text = (description.get("type") or "").lower()
+    if type_text.endswith("container"):
+        return "case"
+    if type_text.endswith("graffiti"):
+        return "graffiti"
+    return None
+
+
+def fetch_new_items(session, bucket, steamid, newest_assetid=None, etag=None, base_url=STEAM_INVENTORY_BASE_URL,
+                    max_retries=PRICE_FETCH_MAX_RETRIES, page_size=INVENTORY_PAGE_SIZE, max_pages=INVENTORY_MAX_PAGES):
+    """
+    Pages through one inventory until it reaches newest_assetid (or its end, when None).
+    Returns {"status": "unchanged" | "ok", "items": [(assetid, description)] newer than newest_assetid,
+    "newest_assetid": ..., "etag": ..., "pages": n}. HTTP errors (403 for private inventories) propagate.
+    """
+    seen_up_to = int(newest_assetid) if newest_assetid else None
+    url = rewrite_market_url(INVENTORY_URL.format(steamid=steamid, count=page_size), base_url)
+    items, newest, first_etag, pages, start_assetid = [], seen_up_to, etag, 0, None
+
+    while pages < max_pages:
+        page_url = url + (f"&start_assetid={start_assetid}" if start_assetid else "")
+        headers = {"If-None-Match": etag} if etag and pages == 0 else None
+        response = fetch_with_retries(session, page_url, bucket, max_retries=max_retries, headers=headers)
+        pages += 1
+        if response.status_code == 304:
+            return {"status": "unchanged", "items": [], "newest_assetid": newest_assetid, "etag": etag, "pages": pages}
+        if pages == 1:
+            first_etag = response.headers.get("ETag")
+        data = response.json() or {}
+        descriptions = {(d.get("classid"), d.get("instanceid")): d for d in data.get("descriptions") or []}
+
+        reached_seen = False
+        for asset in data.get("assets") or []:
+            assetid = int(asset["assetid"])
+            newest = assetid if newest is None else max(newest, assetid)
+            if seen_up_to is not None and assetid <= seen_up_to:
+                reached_seen = True
+                continue
+            items.append((asset["assetid"], descriptions.get((asset.get("classid"), asset.get("instanceid")), {})))
+        if reached_seen or not data.get("more_items") or not data.get("last_assetid"):
+            break
+        start_assetid = data["last_assetid"]
+
+    status = "unchanged" if newest == seen_up_to else "ok"
+    return {"status": status, "items": items, "newest_assetid": str(newest) if newest is not None else None,
+            "etag": first_etag, "pages": pages}
+
+
+def _sync_account(session, bucket, account, state, base_url, max_retries):
+    """Worker task: returns (account, fetch result or None, error message or None)."""
+    try:
+        result = fetch_new_items(session, bucket, account["steamid"], state.get("newest_assetid"), state.get("etag"),
+                                 base_url=base_url, max_retries=max_retries)
+        return account, result, None
+    except requests.exceptions.HTTPError as e:
+        status_code = e.response.status_code if e.response is not None else None
+        return account, None, "Inventory is private" if status_code == 403 else str(e)
+    except Exception as e:
+        print(f"Inventory fetch failed for {account.get('steamid')}: {e}")
+        return account, None, str(e)
+
+
+def _detected_drop(items, case_names):
+    """(case_name or None, graffiti name or None, unmatched container names) from new inventory items."""
+    case_name, graffiti, unmatched = None, None, []
+    for _, description in reversed(items):  # Oldest new item first
+        kind = classify_item(description)
+        name = description.get("market_hash_name") or description.get("name")
+        if kind == "case" and name:
+            matched = case_names.get(name.lower())
+            if matched is None:
+                unmatched.append(name)
+            elif case_name is None:
+                case_name = matched
+        elif kind == "graffiti" and name and graffiti is None:
+            graffiti = name
+    return case_name, graffiti, unmatched
+
+
+def sync_inventories(accounts_collection, progress_collection, cases_collection, state_collection, user_id=None,
+                     session=None, bucket=None, max_workers=INVENTORY_SYNC_WORKERS, base_url=STEAM_INVENTORY_BASE_URL,
+                     max_retries=PRICE_FETCH_MAX_RETRIES, dry_run=False, now=None):
+    """
+    Syncs every tracked account (or one user's) and upserts detected drops into weekly_progress.
+    Returns (summary, {(user_id, week_start)} of progress rows written) so the caller can rebuild
+    weekly_totals. The summary counts accounts synced/unchanged/baselined/failed, drops written,
+    inventory pages downloaded, per-account errors and containers not found in the case catalog.
+    """
+    now = now or datetime.now(timezone.utc)
+    week_start = week_start_of(now)
+    account_filter = {"user_id": user_id} if user_id is not None else {}
+    accounts = list(accounts_collection.find(account_filter, {"user_id": 1, "steamid": 1, "account_name": 1}))
+    states = {state["_id"]: state for state in state_collection.find({"_id": {"$in": [acc["_id"] for acc in accounts]}})}
+    case_names = {case["case_name"].lower(): case["case_name"]
+                  for case in cases_collection.find({}, {"case_name": 1}) if case.get("case_name")}
+    summary = {"accounts": len(accounts), "synced": 0, "unchanged": 0, "baselined": 0, "failed": 0, "drops": 0,
+               "pages": 0, "errors": [], "unmatched_cases": [], "dry_run": dry_run}
+    if not accounts:
+        return summary, set()
+
+    session = session or requests.Session()
+    bucket = bucket or TokenBucket(INVENTORY_FETCH_RATE, INVENTORY_FETCH_BURST)
+    detected, state_operations = {}, []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [
+            executor.submit(_sync_account, session, bucket, acc, states.get(acc["_id"], {}), base_url, max_retries)
+            for acc in accounts
+        ]
+        for future in as_completed(futures):
+            account, result, error = future.result()
+            state_update = {"user_id": account["user_id"], "steamid": account["steamid"], "last_synced_at": now}
+            if error:
+                summary["failed"] += 1
+                summary["errors"].append({"steamid": account["steamid"], "error": error})
+                state_operations.append(UpdateOne({"_id": account["_id"]}, {"$set": dict(state_update, last_error=error)},
+                                                  upsert=True))
+                continue
+
+            summary["pages"] += result["pages"]
+            is_baseline = not states.get(account["_id"], {}).get("newest_assetid")
+            if result["status"] == "unchanged":
+                summary["unchanged"] += 1
+            elif is_baseline:
+                summary["baselined"] += 1
+            else:
+                summary["synced"] += 1
+                case_name, graffiti, unmatched = _detected_drop(result["items"], case_names)
+                summary["unmatched_cases"].extend(unmatched)
+                if case_name or graffiti:
+                    detected[account["_id"]] = (account, case_name, graffiti)
+            state_operations.append(UpdateOne(
+                {"_id": account["_id"]},
+                {"$set": dict(state_update, newest_assetid=result["newest_assetid"], etag=result["etag"], last_error=None)},
+                upsert=True
+            ))
+
+    progress_operations, weeks = [], set()
+    existing = {row["account_doc_id"]: row for row in progress_collection.find(
+        {"week_start": week_start, "account_doc_id": {"$in": list(detected)}},
+        {"account_doc_id": 1, "user_id": 1, "drop_farmed": 1, "case_name": 1, "additional_drop": 1}
+    )} if detected else {}
+    for account_doc_id, (account, case_name, graffiti) in detected.items():
+        row = existing.get(account_doc_id, {})
+        if row and row.get("user_id") != account["user_id"]:
+            continue
+        update = {}
+        if case_name and not (row.get("drop_farmed") and row.get("case_name")):
+            update["case_name"] = case_name
+        if graffiti and not row.get("additional_drop"):
+            update["additional_drop"] = graffiti
+        if not update:
+            continue  # Already logged by hand
+        update.update(drop_farmed=True, last_updated=now)
+        progress_operations.append(UpdateOne(
+            {"user_id": account["user_id"], "account_doc_id": account_doc_id, "week_start": week_start},
+            {"$set": update,
+             "$setOnInsert": {"user_id": account["user_id"], "account_doc_id": account_doc_id, "week_start": week_start}},
+            upsert=True
+        ))
+        weeks.add((account["user_id"], week_start))
+
+    summary["drops"] = len(progress_operations)
+    if dry_run:
+        return summary, set()
+    if progress_operations:
+        progress_collection.bulk_write(progress_operations, ordered=False)
+    if state_operations:
+        state_collection.bulk_write(state_operations, ordered=False)
+    return summary, weeks
+
+
+def main(argv):
+    import json
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    from indexes import DB_NAME
+    from weekly_totals import recompute_weeks
+
+    if "--help" in argv or "-h" in argv:
+        print(__doc__)
+        return 0
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("CRITICAL ERROR: MONGO_URI environment variable not set.")
+        return 2
+    db = MongoClient(mongo_uri)[DB_NAME]
+    user_id = None
+    if "--user" in argv:
+        username = argv[argv.index("--user") + 1]
+        user = db.users.find_one({"username": username}, {"_id": 1})
+        if not user:
+            print(f"Unknown user '{username}'.")
+            return 1
+        user_id = user["_id"]
+
+    summary, weeks = sync_inventories(db.accounts, db.weekly_progress, db.cases, db.inventory_sync_state,
+                                      user_id=user_id, dry_run="--dry-run" in argv)
+    if weeks:
+        price_map = {case["case_name"]: case.get("case_price", 0.0) for case in db.cases.find({}, {"case_name": 1, "case_price": 1})}
+        recompute_weeks(db.weekly_totals, db.weekly_progress, db.case_price_history, price_map, weeks)
+    print(json.dumps(summary, indent=2))
+    return 0 if not summary["failed"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
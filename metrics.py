@@ -0,0 +1,210 @@
+"""Per-request timing: MongoDB commands, template rendering and password hashing.
+
+A pymongo CommandListener adds every command's duration to the stats of the
+request that issued it (tracked in a ContextVar, so it works for threads and
+asyncio tasks alike). Flask hooks time the whole request and template
+rendering. Each response gets a Server-Timing header, and per-route
+histograms are kept in memory for the admin /admin/metrics endpoint.
+Commands issued outside a request (e.g. background price refresh jobs) are not
+attributed to any route.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+COMMAND_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+
+class RequestStats:
+    __slots__ = ("started", "db_commands", "db_ms", "render_ms", "hash_ms")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_commands = 0
+        self.db_ms = 0.0
+        self.render_ms = 0.0
+        self.hash_ms = 0.0
+
+    def server_timing(self, total_ms):
+        return (f'db;dur={self.db_ms:.1f};desc="{self.db_commands} commands", '
+                f'render;dur={self.render_ms:.1f}, hash;dur={self.hash_ms:.1f}, total;dur={total_ms:.1f}')
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+@contextmanager
+def timed(field):
+    """Adds the block's duration to a RequestStats field of the current request, e.g. timed("hash_ms")."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _current.get()
+        if stats is not None:
+            setattr(stats, field, getattr(stats, field) + (time.perf_counter() - started) * 1000)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Attributes MongoDB command durations to the current request."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats.db_commands += 1
+            stats.db_ms += event.duration_micros / 1000
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last bucket is +Inf
+        self.total = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None for the +Inf bucket or no data)."""
+        count = sum(self.counts)
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+    def to_json(self):
+        """Cumulative-free bucket counts as [[upper_bound, count], ...], ending with ["+Inf", count]."""
+        return [[bound, count] for bound, count in zip(list(self.bounds) + ["+Inf"], self.counts)]
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.db_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.render_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.db_commands = Histogram(COMMAND_BUCKETS)
+        self.hash_ms_total = 0.0
+
+    def to_json(self):
+        def mean(total):
+            return round(total / self.requests, 2) if self.requests else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": {"mean": mean(self.latency_ms.total), "p50_le": self.latency_ms.quantile(0.5),
+                           "p95_le": self.latency_ms.quantile(0.95), "histogram": self.latency_ms.to_json()},
+            "db_ms": {"mean": mean(self.db_ms.total), "histogram": self.db_ms.to_json()},
+            "db_commands": {"mean": mean(self.db_commands.total), "histogram": self.db_commands.to_json()},
+            "render_ms": {"mean": mean(self.render_ms.total), "histogram": self.render_ms.to_json()},
+            "hash_ms": {"mean": mean(self.hash_ms_total)},
+        }
+
+
+class MetricsRegistry:
+    """Per-route aggregates for this worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self.started_at = time.time()
+
+    def observe(self, route, status_code, total_ms, stats):
+        with self._lock:
+            metrics = self._routes.setdefault(route, RouteMetrics())
+            metrics.requests += 1
+            metrics.errors += status_code >= 500
+            metrics.latency_ms.observe(total_ms)
+            metrics.db_ms.observe(stats.db_ms)
+            metrics.render_ms.observe(stats.render_ms)
+            metrics.db_commands.observe(stats.db_commands)
+            metrics.hash_ms_total += stats.hash_ms
+
+    def to_json(self):
+        with self._lock:
+            routes = {route: metrics.to_json() for route, metrics in sorted(self._routes.items())}
+        return {"uptime_seconds": round(time.time() - self.started_at, 1), "routes": routes}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self.started_at = time.time()
+
+
+registry = MetricsRegistry()
+_listener_registered = False
+
+
+def init_app(app):
+    """Registers the command listener (before any MongoClient exists) and the Flask hooks."""
+    global _listener_registered
+    from flask import before_render_template, request, template_rendered
+
+    if not _listener_registered:
+        monitoring.register(CommandTimer())
+        _listener_registered = True
+
+    @app.before_request
+    def _start_request_stats():
+        request.environ["metrics.token"] = _current.set(RequestStats())
+
+    @app.after_request
+    def _finish_request_stats(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        response.headers["Server-Timing"] = stats.server_timing(total_ms)
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        registry.observe(f"{request.method} {route}", response.status_code, total_ms, stats)
+        return response
+
+    @app.teardown_request
+    def _clear_request_stats(exc):
+        token = request.environ.pop("metrics.token", None)
+        if token is not None:
+            _current.reset(token)
+
+    def _render_started(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            request.environ["metrics.render_started"] = time.perf_counter()
+
+    def _render_finished(sender, template, context, **extra):
+        stats = _current.get()
+        render_started = request.environ.pop("metrics.render_started", None)
+        if stats is not None and render_started is not None:
+            stats.render_ms += (time.perf_counter() - render_started) * 1000
+
+    before_render_template.connect(_render_started, app, weak=False)
+    template_rendered.connect(_render_finished, app, weak=False)
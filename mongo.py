@@ -0,0 +1,84 @@
+"""Lazily created MongoDB client, shared by every request of this process.
+
+Nothing connects at import time: the client is created on the first database
+access and then reused for the lifetime of the process (i.e. across warm
+serverless invocations). Pages that never touch the database, such as the
+login form, therefore don't wait for a connection on a cold start.
+
+get_async_db() is the AsyncMongoClient counterpart used by the async read
+path (async_app.py); it must only be used from the server's event loop.
+Set MONGO_DB_NAME to point both at another database (e.g. for benchmarks).
+"""
+import os
+import threading
+
+from pymongo import MongoClient
+
+from indexes import DB_NAME, ensure_indexes
+
+_lock = threading.Lock()
+_client = None
+_db = None
+_async_db = None
+
+
+def _db_name():
+    return os.getenv("MONGO_DB_NAME", DB_NAME)
+
+
+def _mongo_uri():
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise RuntimeError("MONGO_URI environment variable not set.")
+    return mongo_uri
+
+
+def get_db():
+    """Returns the application database, creating the client on first use."""
+    global _client, _db
+    if _db is not None:
+        return _db
+    with _lock:
+        if _db is None:
+            _client = MongoClient(_mongo_uri())
+            db = _client[_db_name()]
+            # Off by default: `python indexes.py` runs at deploy time instead of 8 createIndexes per cold start
+            if os.getenv("ENSURE_INDEXES_ON_STARTUP", "0") == "1":
+                errors = ensure_indexes(db)
+                if errors:
+                    # The unique indexes are the only duplicate protection for accounts, usernames and progress
+                    _client.close()
+                    raise RuntimeError(f"Refusing to start, MongoDB index creation failed: {'; '.join(errors)}")
+            print("MongoDB client created.")
+            _db = db
+    return _db
+
+
+def use_database(db):
+    """Makes get_db() return `db` (a pymongo Database or compatible object), e.g. for benchmarks."""
+    global _db
+    with _lock:
+        _db = db
+
+
+def get_async_db():
+    """Returns the database on a lazily created AsyncMongoClient. Indexes come from the `python indexes.py` deploy step."""
+    global _async_db
+    if _async_db is None:
+        from pymongo import AsyncMongoClient
+
+        _async_db = AsyncMongoClient(_mongo_uri())[_db_name()]
+    return _async_db
+
+
+class LazyCollection:
+    """Stands in for a pymongo Collection and resolves it on first attribute access."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
@@ -0,0 +1,179 @@
+"""Pluggable market price extractors.
+
+Each extractor knows which URL to request for a case's market link and how to
+read a USD price out of the response. price_refresh tries them in the order
+given by PRICE_EXTRACTORS (default "json,html_fast,html_soup"):
+
+* json      - Steam's structured endpoints: priceoverview for listing links,
+              search/render?norender=1 for search links. No HTML at all.
+* html_fast - finds result_0 in the search page by string search and reads the
+              first normal_price span after its price block with a regex;
+              never builds a DOM.
+* html_soup - the original BeautifulSoup parse of the whole page (last resort).
+
+Extractors that share a URL share one request, so the HTML fallbacks cost at
+most one extra market request per case.
+"""
+import json
+import os
+import re
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit, urlunsplit
+
+STEAM_APP_ID = "730"
+DEFAULT_EXTRACTORS = "json,html_fast,html_soup"
+RESULT_WINDOW = 16384  # Characters after id="result_0" searched by html_fast
+
+
+def clean_price_text(price_text):
+    """'$1,234.56 USD' / '0,45€' -> float, or None."""
+    if not price_text:
+        return None
+    value = price_text.replace('USD', '').replace('$', '').replace('€', '').replace('₹', '').strip()
+    value = value.split(' ')[0]
+    if ',' in value and '.' in value:
+        value = value.replace(',', '')  # Thousands separator
+    else:
+        value = value.replace(',', '.')
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _market_parts(link):
+    """(scheme, netloc, kind, name) for a market link; kind is 'listing', 'search' or None."""
+    parts = urlsplit(link)
+    path = parts.path.rstrip('/')
+    listing_prefix = f"/market/listings/{STEAM_APP_ID}/"
+    if path.startswith(listing_prefix):
+        return parts.scheme, parts.netloc, "listing", unquote(path[len(listing_prefix):])
+    if path.endswith("/market/search"):
+        query = parse_qs(parts.query).get("q", [None])[0]
+        return parts.scheme, parts.netloc, "search", query
+    return parts.scheme, parts.netloc, None, None
+
+
+class JsonExtractor:
+    name = "json"
+
+    def url_for(self, link):
+        scheme, netloc, kind, market_name = _market_parts(link)
+        if not market_name:
+            return None
+        if kind == "listing":
+            path = "/market/priceoverview/"
+            query = {"appid": STEAM_APP_ID, "currency": "1", "market_hash_name": market_name}
+        else:
+            path = "/market/search/render/"
+            query = {"query": market_name, "appid": STEAM_APP_ID, "start": "0", "count": "1",
+                     "search_descriptions": "0", "norender": "1"}
+        return urlunsplit((scheme, netloc, path, urlencode(query, quote_via=quote), ""))
+
+    def parse(self, content):
+        try:
+            data = json.loads(content)
+        except (ValueError, TypeError):
+            return None
+        if not isinstance(data, dict) or not data.get("success"):
+            return None
+        if "results" in data:  # search/render
+            results = data.get("results") or []
+            if not results:
+                return None
+            first = results[0]
+            if isinstance(first.get("sell_price"), (int, float)) and first["sell_price"] > 0:
+                return first["sell_price"] / 100
+            return clean_price_text(first.get("sell_price_text"))
+        return clean_price_text(data.get("lowest_price") or data.get("median_price"))  # priceoverview
+
+
+class FastHtmlExtractor:
+    name = "html_fast"
+    _result_marker = re.compile(r'id\s*=\s*["\']result_0["\']')
+    _next_result = re.compile(r'id\s*=\s*["\']result_\d+["\']')
+    _normal_price = re.compile(r'<span[^>]*class\s*=\s*["\'][^"\']*\bnormal_price\b[^"\']*["\'][^>]*>([^<]*)</span>')
+
+    def url_for(self, link):
+        return link
+
+    def parse(self, content):
+        text = content.decode('utf-8', 'replace') if isinstance(content, bytes) else content
+        marker = self._result_marker.search(text)
+        if not marker:
+            return None
+        window = text[marker.end():marker.end() + RESULT_WINDOW]
+        next_result = self._next_result.search(window)
+        if next_result:
+            window = window[:next_result.start()]
+        block = window.find('market_listing_price_listings_block')
+        if block >= 0:
+            window = window[block:]
+        for match in self._normal_price.finditer(window):
+            price = clean_price_text(match.group(1))
+            if price is not None:
+                return price
+        return None
+
+
+class SoupHtmlExtractor:
+    name = "html_soup"
+
+    def url_for(self, link):
+        return link
+
+    def parse(self, content):
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(content, 'html.parser')
+        first_result_div = soup.find('div', id='result_0')
+        if not first_result_div:
+            return None
+        price_elements = first_result_div.select('div.market_listing_row div.market_listing_price_listings_block span.market_table_value span.normal_price')
+        if not price_elements:  # Fallback to another common structure
+            price_elements = first_result_div.select('div > div:nth-of-type(2) > span:nth-of-type(1) > span:nth-of-type(1)')
+        if not price_elements:
+            return None
+        return clean_price_text(price_elements[0].get_text(strip=True))
+
+
+EXTRACTORS = {extractor.name: extractor for extractor in (JsonExtractor(), FastHtmlExtractor(), SoupHtmlExtractor())}
+
+
+def get_extractors(names=None):
+    """Extractors in the configured order; unknown names raise ValueError."""
+    names = names or os.getenv("PRICE_EXTRACTORS", DEFAULT_EXTRACTORS)
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(",") if name.strip()]
+    unknown = [name for name in names if name not in EXTRACTORS]
+    if unknown:
+        raise ValueError(f"Unknown price extractor(s): {', '.join(unknown)}")
+    return [EXTRACTORS[name] for name in names]
+
+
+def extract_price(fetch, link, extractors):
+    """
+    Tries each extractor in order; fetch(url) returns the response body (bytes/str).
+    Returns (price_usd, extractor name) or (None, None). Responses are reused between
+    extractors that request the same URL; fetch errors of one extractor move on to the next,
+    and are re-raised if no extractor succeeds.
+    """
+    responses = {}
+    last_error = None
+    for extractor in extractors:
+        url = extractor.url_for(link)
+        if not url:
+            continue
+        if url not in responses:
+            try:
+                responses[url] = fetch(url)
+            except Exception as e:
+                responses[url] = None
+                last_error = e
+        if responses[url] is None:
+            continue
+        price = extractor.parse(responses[url])
+        if price is not None:
+            return price, extractor.name
+    if last_error is not None and not any(body is not None for body in responses.values()):
+        raise last_error
+    return None, None
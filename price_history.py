@@ -0,0 +1,128 @@
+"""Append-only case price history.
+
+Every price refresh (and every manual admin edit) appends one small document
+per case whose price actually changed: {case_name, ts, price, currency}, with
+prices in USD. Documents are never updated (apart from the one-off legacy
+conversion in fx.py), so the collection doubles as an audit trail. The compound index
+on (case_name, ts) makes "price valid at time T" a single backwards range seek
+and lets the chart API read one case's series without touching other cases.
+"""
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING
+
+PRICE_HISTORY_INDEX = [("case_name", ASCENDING), ("ts", DESCENDING)]  # Created by indexes.ensure_indexes
+
+
+def get_latest_prices(history_collection, case_names, at=None):
+    """
+    Returns {case_name: last recorded price} for the given cases (one index-backed aggregation),
+    or the price valid at `at` when given. Cases without such a point are left out.
+    """
+    if not case_names:
+        return {}
+    match = {"case_name": {"$in": list(case_names)}}
+    if at is not None:
+        match["ts"] = {"$lte": at}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"case_name": 1, "ts": -1}},
+        {"$group": {"_id": "$case_name", "price": {"$first": "$price"}}},
+    ]
+    return {row["_id"]: row["price"] for row in history_collection.aggregate(pipeline)}
+
+
+def record_prices(history_collection, prices, ts=None):
+    """
+    Appends a history point for every case in `prices` ({case_name: USD price}) whose price differs
+    from its last recorded point. Returns {case_name: price} for the points written.
+    """
+    if not prices:
+        return {}
+    ts = ts or datetime.now(timezone.utc)
+    latest = get_latest_prices(history_collection, prices.keys())
+    new_points = [
+        {"case_name": case_name, "ts": ts, "price": price, "currency": "USD"}
+        for case_name, price in prices.items()
+        if case_name and latest.get(case_name) != price
+    ]
+    if new_points:
+        history_collection.insert_many(new_points, ordered=False)
+    return {point["case_name"]: point["price"] for point in new_points}
+
+
+_NO_POINT = "no-point"  # Cached marker: the case has no history at or before that week
+
+
+def get_week_price_map(history_collection, case_names, week_start, fallback_price_map, cache=None):
+    """
+    Values each case at the price valid on week_start. Cases without history that old
+    fall back to fallback_price_map (normally the current catalog price).
+    Points are only ever appended with ts=now, so the answer for a week that has already
+    started never changes; pass an LRUTTLCache as `cache` to memoise those lookups.
+    """
+    cacheable = cache is not None and week_start <= datetime.now(timezone.utc)
+    week_prices = {}
+    for case_name in set(case_names):
+        if case_name:
+            week_prices[case_name] = cache.get((case_name, week_start)) if cacheable else None
+
+    missing = [case_name for case_name, price in week_prices.items() if price is None]
+    if missing:
+        # Every cache miss of the week in one aggregation
+        found = get_latest_prices(history_collection, missing, at=week_start)
+        for case_name in missing:
+            price = found.get(case_name)
+            if cacheable:
+                cache.set((case_name, week_start), _NO_POINT if price is None else price)
+            week_prices[case_name] = price
+
+    for case_name, price in week_prices.items():
+        if price is None or price == _NO_POINT:
+            week_prices[case_name] = fallback_price_map.get(case_name, 0.0)
+    return week_prices
+
+
+def get_price_timelines(history_collection, case_names, end):
+    """
+    Loads every point up to `end` for the given cases in one index range scan.
+    Returns {case_name: ([ts, ...], [price, ...])} with timestamps ascending, for use with price_from_timeline.
+    """
+    timelines = {}
+    if not case_names:
+        return timelines
+    cursor = history_collection.find(
+        {"case_name": {"$in": list(case_names)}, "ts": {"$lte": end}},
+        {"_id": 0, "case_name": 1, "ts": 1, "price": 1}
+    ).sort([("case_name", ASCENDING), ("ts", ASCENDING)])
+    for point in cursor:
+        ts = point["ts"] if point["ts"].tzinfo else point["ts"].replace(tzinfo=timezone.utc)
+        timestamps, prices = timelines.setdefault(point["case_name"], ([], []))
+        timestamps.append(ts)
+        prices.append(point["price"])
+    return timelines
+
+
+def price_from_timeline(timeline, at):
+    """Price valid at `at` from a get_price_timelines entry, or None if the timeline starts later."""
+    if not timeline:
+        return None
+    timestamps, prices = timeline
+    position = bisect_right(timestamps, at)
+    return prices[position - 1] if position else None
+
+
+def get_price_series(history_collection, case_name, start=None, end=None, limit=1000):
+    """Returns up to `limit` most recent [(ts, price), ...] for one case in ascending time order, optionally bounded by [start, end]."""
+    query = {"case_name": case_name}
+    ts_range = {}
+    if start:
+        ts_range["$gte"] = start
+    if end:
+        ts_range["$lte"] = end
+    if ts_range:
+        query["ts"] = ts_range
+    # Walk the index backwards so `limit` keeps the most recent points, then return them oldest first
+    cursor = history_collection.find(query, {"_id": 0, "ts": 1, "price": 1}).sort("ts", DESCENDING).limit(limit)
+    return [(point["ts"], point["price"]) for point in reversed(list(cursor))]
@@ -0,0 +1,258 @@
+"""Market price refresh jobs with a persisted progress document.
+
+Serverless workers may be frozen or recycled as soon as a response is sent, so
+nothing runs in the background. The admin POST only inserts a job document.
+The job then advances one chunk of cases per call to advance_price_refresh_job:
+the admin page calls it on every progress poll, and `python price_jobs.py`
+drives a job to completion from cron. Each job stores the ids of the cases it
+still has to fetch, so any process can pick it up where the last one stopped.
+
+Only one job can be active. Active jobs carry active_key, which has a unique
+sparse index (indexes.py), so two admins starting a refresh at the same time
+get the same job. Each chunk is run under a short lease taken with
+find_one_and_update, so overlapping polls never fetch the same chunk twice.
+
+price_refresh (requests) is only imported when a chunk runs, so
+importing this module for the status endpoints stays cheap.
+
+Usage:
+    python price_jobs.py                  # start (or resume) an incremental refresh and run it to the end
+    python price_jobs.py --mode full      # refresh every case with a market link
+"""
+import os
+import sys
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+ACTIVE_STATUSES = ("queued", "running")
+REFRESH_MODES = ("incremental", "full")
+ACTIVE_KEY = "price_refresh"
+# An active job nobody advanced for this long is failed, so a new refresh can start
+STALE_JOB_AFTER = timedelta(hours=1)
+# A chunk not finished within the lease (e.g. the worker was killed) is retried by the next call
+CHUNK_LEASE = timedelta(minutes=2)
+# Cases fetched per call; keep a chunk well inside the serverless function timeout
+PRICE_JOB_CHUNK_CASES = int(os.getenv("PRICE_JOB_CHUNK_CASES", "4"))
+MAX_STORED_ERRORS = 200
+
+
+def job_to_json(job_doc):
+    """Serialises a job document for the progress endpoint (no ObjectIds/datetimes)."""
+    if not job_doc:
+        return None
+
+    def iso(value):
+        return value.isoformat() if value else None
+
+    return {
+        "job_id": str(job_doc["_id"]),
+        "status": job_doc.get("status"),
+        "mode": job_doc.get("mode", "full"),
+        "total": job_doc.get("total", 0),
+        "processed": job_doc.get("processed", 0),
+        "updated": job_doc.get("updated", 0),
+        "failed": job_doc.get("failed", 0),
+        "skipped_no_link": job_doc.get("skipped_no_link", 0),
+        "skipped_fresh": job_doc.get("skipped_fresh", 0),
+        "fx_message": job_doc.get("fx_message"),
+        "errors": job_doc.get("errors", []),
+        "error": job_doc.get("error"),
+        "created_at": iso(job_doc.get("created_at")),
+        "started_at": iso(job_doc.get("started_at")),
+        "finished_at": iso(job_doc.get("finished_at")),
+    }
+
+
+def find_active_job(jobs_collection):
+    """Returns the queued/running job, or None."""
+    return jobs_collection.find_one({"active_key": ACTIVE_KEY})
+
+
+def expire_stale_jobs(jobs_collection, now=None):
+    """Fails active jobs nobody advanced within STALE_JOB_AFTER. Returns how many were failed."""
+    now = now or datetime.now(timezone.utc)
+    result = jobs_collection.update_many(
+        {"active_key": ACTIVE_KEY, "heartbeat_at": {"$lt": now - STALE_JOB_AFTER}},
+        {"$set": {"status": "failed", "error": "Job stopped making progress.", "finished_at": now},
+         "$unset": {"active_key": "", "pending": "", "lease_until": ""}}
+    )
+    return result.modified_count
+
+
+def start_price_refresh_job(jobs_collection, started_by=None, mode="incremental"):
+    """
+    Creates a queued job document; the cases are fetched by advance_price_refresh_job.
+    Returns (job_id, created); if a job is already active its id is returned with created=False.
+    """
+    if mode not in REFRESH_MODES:
+        raise ValueError(f"Unknown refresh mode: {mode}")
+
+    expire_stale_jobs(jobs_collection)
+    for _ in range(2):
+        now = datetime.now(timezone.utc)
+        try:
+            job_id = jobs_collection.insert_one({
+                "status": "queued",
+                "active_key": ACTIVE_KEY,
+                "mode": mode,
+                "started_by": started_by,
+                "created_at": now,
+                "heartbeat_at": now,
+                "total": 0,
+                "processed": 0,
+                "updated": 0,
+                "failed": 0,
+                "skipped_no_link": 0,
+                "skipped_fresh": 0,
+                "errors": [],
+            }).inserted_id
+            return job_id, True
+        except DuplicateKeyError:
+            active_job = find_active_job(jobs_collection)
+            if active_job:
+                return active_job["_id"], False
+            # The active job finished between the insert and the lookup; try again
+    raise RuntimeError("Could not claim the price refresh job.")
+
+
+def _plan_job(jobs_collection, cases_collection, job, progress_collection, fx_collection):
+    """Refreshes FX rates and stores the cases the job has to fetch. Returns the updated job document."""
+    from price_refresh import PRICE_POPULARITY_WEEKS, get_case_log_counts, select_stale_cases
+
+    fx_message = None
+    if fx_collection is not None:
+        from fx import refresh_rates
+        _, fx_message = refresh_rates(fx_collection)
+    cases = list(cases_collection.find({}, {"case_name": 1, "link": 1, "last_price_check": 1}))
+    cases_with_links = [case_doc for case_doc in cases if case_doc.get("link")]
+    if job.get("mode") == "incremental" and progress_collection is not None:
+        since = datetime.now(timezone.utc) - timedelta(weeks=PRICE_POPULARITY_WEEKS)
+        cases_to_fetch = select_stale_cases(cases_with_links, get_case_log_counts(progress_collection, since))
+    else:
+        cases_to_fetch = cases_with_links
+    return jobs_collection.find_one_and_update({"_id": job["_id"]}, {"$set": {
+        "status": "running",
+        "started_at": datetime.now(timezone.utc),
+        "pending": [case_doc["_id"] for case_doc in cases_to_fetch],
+        "total": len(cases_to_fetch),
+        "skipped_no_link": len(cases) - len(cases_with_links),
+        "skipped_fresh": len(cases_with_links) - len(cases_to_fetch),
+        "fx_message": fx_message,
+    }}, return_document=ReturnDocument.AFTER)
+
+
+def advance_price_refresh_job(jobs_collection, cases_collection, job_id, progress_collection=None,
+                              on_complete=None, fx_collection=None, chunk_size=PRICE_JOB_CHUNK_CASES,
+                              **refresh_kwargs):
+    """
+    Fetches the next chunk of a job's cases in the current request and returns the job document.
+    The first call plans the job: in incremental mode only stale cases are fetched (see
+    price_refresh.select_stale_cases), and when fx_collection is given the exchange rate table is
+    refreshed too if it is older than its TTL (fx.refresh_rates). Prices are stored in USD.
+    Returns the job unchanged if it is finished or another call holds the chunk lease.
+    on_complete(changed_prices) is called after each chunk that wrote prices (e.g. to invalidate the
+    catalog cache); changed_prices maps the cases that got a new history point to their new price.
+    """
+    now = datetime.now(timezone.utc)
+    job = jobs_collection.find_one_and_update(
+        {"_id": job_id, "active_key": ACTIVE_KEY,
+         "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}]},
+        {"$set": {"lease_until": now + CHUNK_LEASE, "heartbeat_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job is None:
+        return jobs_collection.find_one({"_id": job_id})
+
+    try:
+        from price_refresh import refresh_case_prices
+
+        if job.get("status") == "queued":
+            job = _plan_job(jobs_collection, cases_collection, job, progress_collection, fx_collection)
+        pending = job.get("pending", [])
+        chunk_ids, remaining = pending[:max(1, chunk_size)], pending[max(1, chunk_size):]
+        updated = 0
+        if chunk_ids:
+            chunk = list(cases_collection.find({"_id": {"$in": chunk_ids}}, {"case_name": 1, "link": 1}))
+
+            def on_result(case_name, error):
+                update = {"$inc": {"processed": 1, "failed": 1 if error else 0}}
+                if error:
+                    update["$push"] = {"errors": {"$each": [{"case_name": case_name, "error": error}], "$slice": -MAX_STORED_ERRORS}}
+                jobs_collection.update_one({"_id": job_id}, update)
+
+            summary = refresh_case_prices(cases_collection, cases=chunk, on_result=on_result, **refresh_kwargs)
+            updated = summary["updated"]
+            if on_complete and updated:
+                on_complete(summary.get("changed_prices", {}))
+            # Cases deleted or unlinked since the job was planned still count as processed
+            unfetched = len(chunk_ids) - summary["processed"]
+        else:
+            unfetched = 0
+
+        update = {
+            "$set": {"pending": remaining, "heartbeat_at": datetime.now(timezone.utc)},
+            "$inc": {"updated": updated, "processed": unfetched},
+            "$unset": {"lease_until": ""},
+        }
+        if not remaining:
+            update["$set"].update(status="completed", finished_at=datetime.now(timezone.utc))
+            update["$unset"].update(active_key="", pending="")
+            del update["$set"]["pending"]
+        job = jobs_collection.find_one_and_update({"_id": job_id}, update, return_document=ReturnDocument.AFTER)
+        if not remaining:
+            print(f"Price refresh job {job_id} completed: {job.get('updated', 0)} updated, {job.get('failed', 0)} failed")
+        return job
+    except Exception as e:
+        print(f"Price refresh job {job_id} failed: {e}")
+        traceback.print_exc()
+        return jobs_collection.find_one_and_update({"_id": job_id}, {
+            "$set": {"status": "failed", "error": str(e), "finished_at": datetime.now(timezone.utc)},
+            "$unset": {"active_key": "", "pending": "", "lease_until": ""},
+        }, return_document=ReturnDocument.AFTER)
+
+
+def main(argv):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    from indexes import DB_NAME
+    from weekly_totals import recompute_for_price_change
+
+    mode = argv[argv.index("--mode") + 1] if "--mode" in argv[:-1] else "incremental"
+    if mode not in REFRESH_MODES:
+        print(__doc__)
+        return 2
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("CRITICAL ERROR: MONGO_URI environment variable not set.")
+        return 2
+    db = MongoClient(mongo_uri)[DB_NAME]
+
+    def on_complete(changed_prices):
+        if changed_prices:
+            case_price_map = {case['case_name']: case.get('case_price', 0.0) for case in db.cases.find({}, {"case_name": 1, "case_price": 1})}
+            recompute_for_price_change(db.weekly_totals, db.weekly_progress, db.case_price_history,
+                                       case_price_map, changed_prices.keys())
+
+    job_id, created = start_price_refresh_job(db.price_refresh_jobs, started_by="cli", mode=mode)
+    print(f"{'Started' if created else 'Resuming'} price refresh job {job_id}")
+    job = db.price_refresh_jobs.find_one({"_id": job_id})
+    while job and job.get("status") in ACTIVE_STATUSES:
+        job = advance_price_refresh_job(
+            db.price_refresh_jobs, db.cases, job_id, db.weekly_progress, on_complete=on_complete,
+            fx_collection=db.fx_rates, history_collection=db.case_price_history
+        )
+        if job and job.get("lease_until"):
+            time.sleep(2) # Another process holds the chunk lease; wait for it instead of spinning
+    print(f"Price refresh job {job_id}: {job.get('status') if job else 'missing'}")
+    return 0 if job and job.get("status") == "completed" else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,264 @@
+"""Concurrent, rate-limited market price refresh for the cases collection.
+
+A small pool of worker threads fetches Steam market prices. Every outbound
+request (including retries) first takes a token from one shared token bucket,
+so the total runtime is governed by the configured request rate rather than a
+fixed sleep between cases. Prices are read by the extractors configured in
+PRICE_EXTRACTORS (price_extractors.py): the JSON endpoints first, the search
+page HTML only as a fallback. All successful prices are written back with a
+single unordered bulk_write.
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from pymongo import UpdateOne
+
+from price_extractors import EXTRACTORS, extract_price, get_extractors
+from price_history import record_prices
+
+# --- Configuration (overridable through the environment) ---
+PRICE_FETCH_RATE = float(os.getenv("PRICE_FETCH_RATE", "0.5"))  # Requests per second across all workers
+PRICE_FETCH_BURST = int(os.getenv("PRICE_FETCH_BURST", "2"))  # Token bucket capacity
+PRICE_FETCH_WORKERS = int(os.getenv("PRICE_FETCH_WORKERS", "4"))
+PRICE_FETCH_MAX_RETRIES = int(os.getenv("PRICE_FETCH_MAX_RETRIES", "3"))
+# Longest wait before one retry, whatever Retry-After asks for; keeps a job chunk well inside its lease
+PRICE_FETCH_MAX_RETRY_DELAY = float(os.getenv("PRICE_FETCH_MAX_RETRY_DELAY", "10"))
+# Incremental mode: only cases whose last_price_check is older than the staleness window are fetched
+PRICE_STALE_AFTER_HOURS = float(os.getenv("PRICE_STALE_AFTER_HOURS", "24"))
+# Cases nobody logged within the popularity window ("cold" cases) get a longer staleness window
+PRICE_COLD_STALE_MULTIPLIER = float(os.getenv("PRICE_COLD_STALE_MULTIPLIER", "7"))
+PRICE_POPULARITY_WEEKS = int(os.getenv("PRICE_POPULARITY_WEEKS", "8"))
+# Optional cap on market requests per incremental refresh (0 = no cap)
+PRICE_REFRESH_MAX_CASES = int(os.getenv("PRICE_REFRESH_MAX_CASES", "0"))
+# Point this at a local stub server (e.g. http://127.0.0.1:8000) to replay recorded market pages
+STEAM_MARKET_BASE_URL = os.getenv("STEAM_MARKET_BASE_URL")
+
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket. acquire() blocks until a token is available."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            self._sleep(wait_seconds)
+
+
+class RetryableHTTPError(Exception):
+    """Raised when a market request keeps failing with 429/5xx after all retries."""
+
+
+def rewrite_market_url(url, base_url=None):
+    """Swaps the scheme/host of a market link for base_url (used to target a stub server)."""
+    if not base_url:
+        return url
+    base = urlsplit(base_url)
+    parts = urlsplit(url)
+    return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, parts.fragment))
+
+
+def _retry_delay(response, attempt, backoff_base, max_delay=PRICE_FETCH_MAX_RETRY_DELAY):
+    """Honours a numeric Retry-After header, otherwise uses exponential backoff; never waits over max_delay."""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(max_delay, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return min(max_delay, backoff_base * (2 ** attempt))
+
+
+def fetch_with_retries(session, url, bucket, max_retries=PRICE_FETCH_MAX_RETRIES, backoff_base=1.0,
+                       timeout=20, sleep=time.sleep, headers=None):
+    """
+    GETs url, retrying with backoff on 429/5xx and connection errors. Every attempt costs one token.
+    headers are sent on top of REQUEST_HEADERS (e.g. If-None-Match; a 304 is returned as-is).
+    """
+    request_headers = dict(REQUEST_HEADERS, **headers) if headers else REQUEST_HEADERS
+    last_error = None
+    for attempt in range(max_retries + 1):
+        bucket.acquire()
+        response = None
+        try:
+            response = session.get(url, headers=request_headers, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            last_error = e
+        else:
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()  # Other 4xx errors are not worth retrying
+                return response
+            last_error = RetryableHTTPError(f"HTTP {response.status_code} from {url}")
+
+        if attempt < max_retries:
+            sleep(_retry_delay(response, attempt, backoff_base))
+
+    raise RetryableHTTPError(f"Giving up after {max_retries + 1} attempts: {last_error}")
+
+
+def parse_market_price(html):
+    """Extracts the first listing price (as a float) from a Steam market search page, or None."""
+    for extractor in (EXTRACTORS["html_fast"], EXTRACTORS["html_soup"]):
+        price = extractor.parse(html)
+        if price is not None:
+            return price
+    return None
+
+
+def get_case_log_counts(progress_collection, since):
+    """Returns {case_name: number of farmed drops logged since `since`} from weekly_progress."""
+    pipeline = [
+        {"$match": {"week_start": {"$gte": since}, "drop_farmed": True, "case_name": {"$nin": [None, ""]}}},
+        {"$group": {"_id": "$case_name", "count": {"$sum": 1}}},
+    ]
+    return {row["_id"]: row["count"] for row in progress_collection.aggregate(pipeline)}
+
+
+def select_stale_cases(cases, case_log_counts, now=None, stale_after=timedelta(hours=PRICE_STALE_AFTER_HOURS),
+                       cold_multiplier=PRICE_COLD_STALE_MULTIPLIER, max_cases=PRICE_REFRESH_MAX_CASES):
+    """
+    Picks the cases an incremental refresh should fetch, most urgent first.
+    A case is due once its last_price_check is older than stale_after (or stale_after * cold_multiplier
+    for cases nobody logged recently). Due cases are ordered by how many windows overdue they are,
+    weighted by how often users log them; never-checked cases come first.
+    """
+    now = now or datetime.now(timezone.utc)
+    due = []
+    for case_doc in cases:
+        if not case_doc.get("link"):
+            continue
+        log_count = case_log_counts.get(case_doc.get("case_name"), 0)
+        window = stale_after if log_count > 0 else stale_after * cold_multiplier
+        last_check = case_doc.get("last_price_check")
+        if last_check is None:
+            due.append((math.inf, case_doc))
+            continue
+        if last_check.tzinfo is None:  # pymongo returns naive UTC datetimes by default
+            last_check = last_check.replace(tzinfo=timezone.utc)
+        age = now - last_check
+        if age < window:
+            continue
+        overdue_windows = age / window
+        due.append((overdue_windows * (1 + math.log1p(log_count)), case_doc))
+
+    due.sort(key=lambda item: item[0], reverse=True)
+    selected = [case_doc for _, case_doc in due]
+    if max_cases and max_cases > 0:
+        selected = selected[:max_cases]
+    return selected
+
+
+def _fetch_case_price(session, bucket, case_doc, base_url, max_retries, extractors):
+    """Worker task: returns (case_doc, price_usd or None, extractor name or None, error message or None)."""
+    case_name = case_doc.get("case_name", "Unknown Case")
+
+    def fetch(url):
+        return fetch_with_retries(session, rewrite_market_url(url, base_url), bucket, max_retries=max_retries).content
+
+    try:
+        price_usd, extractor_name = extract_price(fetch, case_doc["link"], extractors)
+        if price_usd is None:
+            return case_doc, None, None, "Could not find/parse price element"
+        return case_doc, price_usd, extractor_name, None
+    except Exception as e:
+        print(f"Price fetch failed for {case_name}: {e}")
+        return case_doc, None, None, str(e)
+
+
+def refresh_case_prices(cases_collection, cases=None, session=None, bucket=None,
+                        max_workers=PRICE_FETCH_WORKERS, base_url=STEAM_MARKET_BASE_URL,
+                        max_retries=PRICE_FETCH_MAX_RETRIES, on_result=None, history_collection=None,
+                        extractors=None):
+    """
+    Fetches market prices for every case with a 'link' and stores them in one bulk_write.
+    Prices are stored in USD; display currencies are applied at render time (see fx.py).
+    When history_collection is given, changed prices are also appended to the price history.
+    extractors (names or extractor objects) default to the PRICE_EXTRACTORS setting.
+    on_result(case_name, error) is called as each case finishes (error is None on success).
+    Returns a summary dict with processed/updated/failed/skipped_no_link counts, per-case errors,
+    changed_prices ({case_name: price} for the cases that got a new history point) and
+    extractors ({extractor name: cases priced by it}, so a markup change shows up as a shift to the fallbacks).
+    """
+    if cases is None:
+        cases = list(cases_collection.find({}, {"case_name": 1, "link": 1}))
+    cases_with_links = [case_doc for case_doc in cases if case_doc.get("link")]
+    summary = {
+        "processed": len(cases_with_links),
+        "updated": 0,
+        "failed": 0,
+        "skipped_no_link": len(cases) - len(cases_with_links),
+        "errors": [],
+        "changed_prices": {},
+        "extractors": {},
+    }
+    if not cases_with_links:
+        return summary
+
+    if extractors is None or all(isinstance(extractor, str) for extractor in extractors):
+        extractors = get_extractors(extractors)
+
+    session = session or requests.Session()
+    bucket = bucket or TokenBucket(PRICE_FETCH_RATE, PRICE_FETCH_BURST)
+    bulk_operations = []
+    fetched_prices = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [
+            executor.submit(_fetch_case_price, session, bucket, case_doc, base_url, max_retries, extractors)
+            for case_doc in cases_with_links
+        ]
+        for future in as_completed(futures):
+            case_doc, price_usd, extractor_name, error = future.result()
+            case_name = case_doc.get("case_name", "Unknown Case")
+            if on_result:
+                on_result(case_name, error)
+            if error:
+                summary["failed"] += 1
+                summary["errors"].append({"case_name": case_name, "error": error})
+                continue
+
+            summary["extractors"][extractor_name] = summary["extractors"].get(extractor_name, 0) + 1
+            final_price = round(price_usd, 2)
+            print(f"Fetched {case_name} ({extractor_name}): ${final_price:.2f} USD")
+            fetched_prices[case_name] = final_price
+            bulk_operations.append(UpdateOne(
+                {"_id": case_doc["_id"]},
+                {"$set": {"case_price": final_price, "currency": "USD", "last_price_check": datetime.now(timezone.utc)}}
+            ))
+
+    if bulk_operations:
+        result = cases_collection.bulk_write(bulk_operations, ordered=False)
+        summary["updated"] = result.matched_count
+        if history_collection is not None:
+            summary["changed_prices"] = record_prices(history_collection, fetched_prices)
+    return summary
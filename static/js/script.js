@@ -32,91 +32,352 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // --- Other Weeks Fetch Logic (MODIFY TO ADD EDIT BUTTONS) ---
     const fetchButton = document.getElementById('fetch-other-week');
+    const prevWeekButton = document.getElementById('prev-other-week');
+    const nextWeekButton = document.getElementById('next-other-week');
     const otherWeekDateInput = document.getElementById('other_week_date');
     const otherWeekTbody = document.getElementById('other-week-tbody');
     const otherWeekError = document.getElementById('other-week-error');
     const otherWeekTfoot = document.getElementById('other-week-tfoot'); // Get the tfoot
-const otherWeekTotalValueCell = document.getElementById('other-week-total-value'); // Get the cell for total
+    const otherWeekTotalValueCell = document.getElementById('other-week-total-value'); // Get the cell for total
 
-if (fetchButton && otherWeekDateInput && otherWeekTbody && otherWeekError && otherWeekTfoot && otherWeekTotalValueCell) {
-        fetchButton.addEventListener('click', function() {
-            const selectedDate = otherWeekDateInput.value;
-            if (!selectedDate) {
-                showError('Please select a date first.');
-                return;
+    // --- Week cache + neighbour prefetch (filled from /get_weeks_range) ---
+    const weekCache = new Map(); // 'YYYY-MM-DD' -> {data: {progress: [...], total_value}, etag, revalidate}
+    const PREFETCH_WEEKS = 4; // Weeks fetched on each side of the selected week
+    const prefetchedRanges = new Set();
+
+    function shiftWeek(dateStr, weeks) {
+        const dateObj = new Date(dateStr + 'T00:00:00Z');
+        dateObj.setUTCDate(dateObj.getUTCDate() + weeks * 7);
+        return dateObj.toISOString().slice(0, 10);
+    }
+
+    // Converts the columnar range payload into the per-week shape returned by /get_week_data
+    function rangeToWeeks(data) {
+        data.weeks.forEach((weekStart, col) => {
+            const progress = data.accounts.map((acc, row) => {
+                const farmed = data.farmed[row][col];
+                const caseIdx = data.case_idx[row][col];
+                return {
+                    account_name: acc.name,
+                    steamid: acc.steamid,
+                    week_start: weekStart,
+                    drop_farmed: farmed === 1,
+                    case_name: caseIdx >= 0 ? data.cases[caseIdx] : (farmed === null ? 'N/A' : null),
+                    additional_drop: farmed === null ? '-' : data.additional_drops[row][col],
+                    progress_id: data.progress_ids[row][col],
+                    case_value: data.values[row][col]
+                };
+            });
+            // Just fetched, so the first view uses it as is; later views revalidate with the week's ETag
+            weekCache.set(weekStart, {
+                data: { progress: progress, total_value: data.week_totals[col] },
+                etag: data.etags ? data.etags[col] : null,
+                revalidate: false
+            });
+        });
+    }
+
+    function prefetchAround(dateStr) {
+        const from = shiftWeek(dateStr, -PREFETCH_WEEKS);
+        const to = shiftWeek(dateStr, PREFETCH_WEEKS);
+        const key = `${from}:${to}`;
+        if (prefetchedRanges.has(key)) return;
+        prefetchedRanges.add(key);
+        fetch(`/get_weeks_range?from=${from}&to=${to}&detail=1`)
+            .then(response => response.ok ? response.json() : Promise.reject(new Error(`HTTP error! Status: ${response.status}`)))
+            .then(rangeToWeeks)
+            .catch(error => {
+                prefetchedRanges.delete(key);
+                console.warn('Prefetch of neighbouring weeks failed:', error);
+            });
+    }
+
+    function loadWeek(dateStr) {
+        const cached = weekCache.get(dateStr);
+        if (cached && !cached.revalidate) {
+            cached.revalidate = true;
+            return Promise.resolve(cached.data);
+        }
+        const headers = {};
+        if (cached && cached.etag) {
+            headers['If-None-Match'] = `W/"${cached.etag}"`;
+        }
+        return fetch(`/get_week_data?date=${dateStr}`, { headers: headers })
+            .then(response => {
+                if (response.status === 304 && cached) {
+                    return cached.data; // Unchanged since we last saw it
+                }
+                if (!response.ok) {
+                     return response.json().then(err => { throw new Error(err.error || `HTTP error! Status: ${response.status}`) });
+                }
+                const etag = (response.headers.get('ETag') || '').replace(/^W\//, '').replace(/"/g, '');
+                return response.json().then(data => {
+                    weekCache.set(dateStr, { data: data, etag: etag || null, revalidate: true });
+                    return data;
+                });
+            });
+    }
+
+    // Fills a table row with one progress entry (the /get_week_data shape), with the same markup as the
+    // index.html rows; also used to patch rows after a save. Values only ever go in through textContent.
+    function mutedSpan(text, extraClass) {
+        const span = document.createElement('span');
+        span.className = extraClass ? `text-muted ${extraClass}` : 'text-muted';
+        span.textContent = text;
+        return span;
+    }
+
+    function fillProgressRow(row, entry) {
+        row.replaceChildren();
+        row.dataset.steamid = entry.steamid;
+
+        const accountCell = row.insertCell();
+        if (entry.steamid) {
+            const link = document.createElement('a');
+            link.href = `https://steamcommunity.com/profiles/${encodeURIComponent(entry.steamid)}/inventory/`;
+            link.target = '_blank';
+            link.textContent = entry.account_name;
+            accountCell.appendChild(link);
+        } else {
+            accountCell.append(`${entry.account_name} `, mutedSpan('(Account maybe deleted)'));
+        }
+
+        const farmedCell = row.insertCell();
+        if (entry.progress_id) {
+            farmedCell.textContent = entry.drop_farmed ? 'Yes' : 'No';
+        } else {
+            farmedCell.appendChild(mutedSpan('No')); // No entry exists yet
+        }
+        row.insertCell().textContent = entry.case_name || 'N/A';
+        row.insertCell().textContent = entry.additional_drop || '-';
+        row.insertCell().textContent = entry.case_value ? parseFloat(entry.case_value).toFixed(2) : '-';
+
+        const actionsCell = row.insertCell();
+        if (entry.progress_id) {
+            const button = document.createElement('button');
+            button.className = 'btn btn-outline-info btn-sm edit-btn';
+            Object.assign(button.dataset, {
+                bsToggle: 'modal',
+                bsTarget: '#editProgressModal',
+                progressId: entry.progress_id,
+                accountName: entry.account_name,
+                weekStart: entry.week_start,
+                dropFarmed: entry.drop_farmed ? 'true' : 'false',
+                caseName: entry.case_name || '',
+                additionalDrop: entry.additional_drop || '',
+            });
+            const icon = document.createElement('i');
+            icon.className = 'bi bi-pencil-square';
+            button.append(icon, ' Edit');
+            actionsCell.appendChild(button);
+        } else {
+            actionsCell.appendChild(mutedSpan('-', 'fst-italic'));
+        }
+    }
+
+    function renderOtherWeek(data) {
+        otherWeekTbody.innerHTML = ''; // Clear loading/previous data
+        if (!data.progress || data.progress.length === 0) {
+            otherWeekTbody.innerHTML = '<tr><td colspan="6" class="text-center">No progress found for this week.</td></tr>'; // Colspan 6
+            otherWeekTfoot.style.display = 'none';
+            return;
+        }
+        data.progress.forEach(entry => {
+            fillProgressRow(otherWeekTbody.insertRow(), entry);
+        });
+
+        // Display total value
+        otherWeekTotalValueCell.textContent = parseFloat(data.total_value).toFixed(2);
+        otherWeekTfoot.style.display = ''; // Show footer
+    }
+
+    function showSelectedWeek() {
+        const selectedDate = otherWeekDateInput.value;
+        if (!selectedDate) {
+            showError('Please select a date first.');
+            return;
+        }
+        const dateObj = new Date(selectedDate + 'T00:00:00Z'); // Treat as UTC
+        if (dateObj.getUTCDay() !== 3) {
+            showError('Please select a Wednesday.');
+            return;
+        }
+
+        hideError();
+        if (!weekCache.has(selectedDate)) {
+            otherWeekTbody.innerHTML = '<tr><td colspan="6" class="text-center">Loading...</td></tr>';
+            otherWeekTfoot.style.display = 'none';
+        }
+
+        otherWeekTbody.closest('table').dataset.weekStart = selectedDate;
+        loadWeek(selectedDate)
+            .then(data => {
+                if (otherWeekDateInput.value === selectedDate) { // Ignore responses for weeks no longer selected
+                    renderOtherWeek(data);
+                }
+                prefetchAround(selectedDate);
+            })
+            .catch(error => {
+                console.error('Error fetching other week data:', error);
+                showError(`Failed to fetch data: ${error.message}`);
+                otherWeekTbody.innerHTML = '<tr><td colspan="6" class="text-center text-danger">Error loading data.</td></tr>';
+            });
+    }
+
+    // --- Saving progress without a page reload: the JSON answer holds the saved row and the week's new total ---
+    function patchProgressRow(data) {
+        const entry = data.row;
+        document.querySelectorAll(`table[data-week-start="${data.week_start}"]`).forEach(table => {
+            const row = table.querySelector(`tbody tr[data-steamid="${CSS.escape(String(entry.steamid))}"]`);
+            if (row) {
+                fillProgressRow(row, entry);
             }
-            const dateObj = new Date(selectedDate + 'T00:00:00Z'); // Treat as UTC
-            if (dateObj.getUTCDay() !== 3) {
-                showError('Please select a Wednesday.');
-                return;
+            const totalCell = table.querySelector('.week-total-value');
+            if (totalCell) {
+                totalCell.textContent = parseFloat(data.total_value).toFixed(2);
             }
+        });
 
-            hideError();
-            otherWeekTbody.innerHTML = '<tr><td colspan="5" class="text-center">Loading...</td></tr>'; // Colspan 6
-            otherWeekTfoot.style.display = 'none';
+        const cached = weekCache.get(data.week_start);
+        if (cached) {
+            cached.data.progress = cached.data.progress.map(item => item.steamid === entry.steamid ? entry : item);
+            cached.data.total_value = data.total_value;
+            cached.revalidate = true; // Its ETag is outdated now, so the next view gets a fresh copy
+        }
+    }
 
-            fetch(`/get_week_data?date=${selectedDate}`)
-                .then(response => {
-                    if (!response.ok) {
-                         return response.json().then(err => { throw new Error(err.error || `HTTP error! Status: ${response.status}`) });
-                    }
-                    return response.json();
+    const progressStatus = document.getElementById('progressStatus');
+    function showProgressStatus(message, level) {
+        if (!progressStatus) return;
+        progressStatus.className = `alert alert-${level}`;
+        progressStatus.textContent = message;
+    }
+
+    function submitProgressForm(form, onSaved) {
+        form.addEventListener('submit', function(event) {
+            event.preventDefault();
+            const submitButton = form.querySelector('button[type="submit"]');
+            if (submitButton) submitButton.disabled = true;
+            fetch(form.action, { method: 'POST', headers: { 'Accept': 'application/json' }, body: new FormData(form) })
+                .then(response => response.json().then(data => {
+                    if (!response.ok) throw new Error(data.message || data.error || `HTTP error! Status: ${response.status}`);
+                    return data;
+                }))
+                .then(data => {
+                    patchProgressRow(data);
+                    showProgressStatus(data.message, data.category);
+                    if (data.status !== 'unchanged') loadTotals();
+                    if (onSaved) onSaved();
                 })
+                .catch(error => showProgressStatus(`Failed to save progress: ${error.message}`, 'danger'))
+                .finally(() => { if (submitButton) submitButton.disabled = false; });
+        });
+    }
+
+    const addProgressForm = document.getElementById('addProgressForm');
+    if (addProgressForm) {
+        submitProgressForm(addProgressForm);
+    }
+    const editProgressForm = document.getElementById('editProgressForm');
+    if (editProgressForm && editModal) {
+        submitProgressForm(editProgressForm, () => bootstrap.Modal.getOrCreateInstance(editModal).hide());
+    }
+
+    if (fetchButton && otherWeekDateInput && otherWeekTbody && otherWeekError && otherWeekTfoot && otherWeekTotalValueCell) {
+        fetchButton.addEventListener('click', showSelectedWeek);
+
+        // Step one week back/forward; neighbouring weeks are usually already prefetched
+        [[prevWeekButton, -1], [nextWeekButton, 1]].forEach(([button, step]) => {
+            if (!button) return;
+            button.addEventListener('click', function() {
+                if (!otherWeekDateInput.value) return;
+                otherWeekDateInput.value = shiftWeek(otherWeekDateInput.value, step);
+                showSelectedWeek();
+            });
+        });
+    }
+
+    // --- Bulk progress form: every selected account is saved by one /bulk_add_progress request ---
+    const bulkForm = document.getElementById('bulkProgressForm');
+    if (bulkForm) {
+        const bulkRows = Array.from(bulkForm.querySelectorAll('.bulk-row'));
+        const bulkResult = document.getElementById('bulkProgressResult');
+        const bulkSubmit = document.getElementById('bulkProgressSubmit');
+
+        document.getElementById('bulk_select_all').addEventListener('change', function() {
+            bulkRows.forEach(tr => { tr.querySelector('.bulk-select').checked = this.checked; });
+        });
+
+        document.getElementById('bulk_apply_case').addEventListener('change', function() {
+            if (!this.value) return;
+            bulkRows.filter(tr => tr.querySelector('.bulk-select').checked).forEach(tr => {
+                tr.querySelector('.bulk-case').value = this.value;
+                tr.querySelector('.bulk-farmed').checked = true;
+            });
+        });
+
+        function showBulkResult(message, level) {
+            bulkResult.className = `alert alert-${level}`;
+            bulkResult.textContent = message;
+        }
+
+        bulkForm.addEventListener('submit', function(event) {
+            event.preventDefault();
+            const selected = bulkRows.filter(tr => tr.querySelector('.bulk-select').checked);
+            if (selected.length === 0) {
+                showBulkResult('Select at least one account.', 'warning');
+                return;
+            }
+            const rows = selected.map(tr => ({
+                account_doc_id: tr.dataset.accountDocId,
+                drop_farmed: tr.querySelector('.bulk-farmed').checked,
+                case_name: tr.querySelector('.bulk-case').value,
+                additional_drop: tr.querySelector('.bulk-additional').value
+            }));
+
+            bulkSubmit.disabled = true;
+            fetch('/bulk_add_progress', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+                body: JSON.stringify({ week_start: document.getElementById('bulk_week_start').value, rows: rows })
+            })
+                .then(response => response.json().then(data => {
+                    if (!response.ok) throw new Error(data.error || `HTTP error! Status: ${response.status}`);
+                    return data;
+                }))
                 .then(data => {
-                    otherWeekTbody.innerHTML = ''; // Clear loading/previous data
-                    otherWeekTbody.innerHTML = '';
-                if (!data.progress || data.progress.length === 0) {
-                    otherWeekTbody.innerHTML = '<tr><td colspan="6" class="text-center">No progress found for this week.</td></tr>'; // Colspan 6
-                    otherWeekTfoot.style.display = 'none';
-                } else {
-                    data.progress.forEach(entry => {
-                        const row = otherWeekTbody.insertRow();
-                            const farmedText = entry.drop_farmed ? 'Yes' : 'No';
-                            const caseNameText = entry.case_name || 'N/A';
-                            const additionalDropText = entry.additional_drop || '-';
-                            const accountLink = `<a href="https://steamcommunity.com/profiles/${entry.steamid}" target="_blank">${entry.account_name}</a>`;
-                            const priceText = entry.case_value ? parseFloat(entry.case_value).toFixed(2) : '-';
-
-                            let actionsCellContent = '<span class="text-muted fst-italic">-</span>';
-                        if (entry.progress_id) {
-                            actionsCellContent = `
-                                <button class="btn btn-outline-info btn-sm edit-btn"
-                                        data-bs-toggle="modal" data-bs-target="#editProgressModal"
-                                        data-progress-id="${entry.progress_id}"
-                                        data-account-name="${entry.account_name}"
-                                        data-week-start="${entry.week_start}" 
-                                        data-drop-farmed="${entry.drop_farmed ? 'true' : 'false'}"
-                                        data-case-name="${entry.case_name || ''}"
-                                        data-additional-drop="${entry.additional_drop || ''}">
-                                    <i class="bi bi-pencil-square"></i> Edit
-                                </button>
-                            `;
-                        }
-
-
-                        row.innerHTML = `
-                        <td>${accountLink}</td>
-                        <td>${entry.drop_farmed ? 'Yes' : 'No'}</td>
-                        <td>${entry.case_name || 'N/A'}</td>
-                        <td>${entry.additional_drop || '-'}</td>
-                        <td>${priceText}</td>
-                        <td>${actionsCellContent}</td>
-                    `;
-                        });
-
-                        // Display total value
-                    otherWeekTotalValueCell.textContent = parseFloat(data.total_value).toFixed(2);
-                    otherWeekTfoot.style.display = ''; // Show footer
+                    // Patch the saved rows and the week total in place, like a single-row save
+                    data.rows.forEach(row => patchProgressRow({ row: row, week_start: data.week_start, total_value: data.total_value }));
+                    const problems = data.results.filter(r => r.status === 'invalid' || r.status === 'failed');
+                    if (problems.length === 0) {
+                        showBulkResult(`${data.results.length} saved.`, 'success');
+                        return;
                     }
+                    const names = problems.map(r => `${selected[r.index].cells[1].textContent}: ${r.error}`);
+                    showBulkResult(`${data.results.length - problems.length} saved, ${problems.length} failed. ${names.join('; ')}`, 'warning');
                 })
-                .catch(error => {
-                    console.error('Error fetching other week data:', error);
-                    showError(`Failed to fetch data: ${error.message}`);
-                     otherWeekTbody.innerHTML = '<tr><td colspan="5" class="text-center text-danger">Error loading data.</td></tr>'; // Colspan 5
-                });
+                .catch(error => showBulkResult(`Failed to save progress: ${error.message}`, 'danger'))
+                .finally(() => { bulkSubmit.disabled = false; });
         });
     }
 
+    // --- Lifetime / season totals (read from the weekly_totals rollup) ---
+    const totalsCard = document.getElementById('totals-card');
+    function loadTotals() {
+        if (!totalsCard) return;
+        fetch('/get_totals')
+            .then(response => response.ok ? response.json() : Promise.reject(new Error(`HTTP error! Status: ${response.status}`)))
+            .then(data => {
+                document.getElementById('season-start').textContent = data.season.start;
+                document.getElementById('season-farmed').textContent = data.season.farmed_count;
+                document.getElementById('season-value').textContent = parseFloat(data.season.total_value).toFixed(2);
+                document.getElementById('lifetime-farmed').textContent = data.lifetime.farmed_count;
+                document.getElementById('lifetime-value').textContent = parseFloat(data.lifetime.total_value).toFixed(2);
+            })
+            .catch(error => console.warn('Could not load totals:', error));
+    }
+    loadTotals();
+
     function showError(message) { /* ... (no change) ... */ }
     function hideError() { /* ... (no change) ... */ }
 });
\ No newline at end of file
@@ -0,0 +1,33 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+from pymongo import ReplaceOne
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    """Fresh in-memory database per test (mongomock)."""
+    return mongomock.MongoClient()["cs2_tracker_test"]
+
+
+@pytest.fixture
+def bulk_writes(monkeypatch):
+    """
+    Records every bulk_write and applies it one operation at a time, since mongomock cannot run
+    pymongo 4.9+ UpdateOne/ReplaceOne objects itself.
+    """
+    calls = []
+
+    def bulk_write(collection, operations, ordered=True):
+        calls.append(list(operations))
+        matched = sum((collection.replace_one if isinstance(op, ReplaceOne) else collection.update_one)(
+            op._filter, op._doc, upsert=op._upsert).matched_count for op in operations)
+        return SimpleNamespace(matched_count=matched)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write)
+    return calls
@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from analytics import compute_account_analytics
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_non_wednesday_rows_count_towards_their_week(db):
+    user_id, account_id = ObjectId(), ObjectId()
+    accounts = [{"_id": account_id, "account_name": "main", "steamid": "76561190000000000"}]
+    rows = [
+        (datetime(2024, 12, 30), "Alpha Case"),  # Monday, logged through the date picker: week of 2024-12-25
+        (datetime(2025, 1, 8), "Alpha Case"),    # Wednesday
+    ]
+    for week_start, case_name in rows:
+        db.weekly_progress.insert_one({"user_id": user_id, "account_doc_id": account_id, "week_start": week_start,
+                                       "drop_farmed": True, "case_name": case_name})
+
+    payload = compute_account_analytics(db.weekly_progress, db.case_price_history, user_id, accounts,
+                                        {"Alpha Case": 2.0}, utc(2025, 1, 8))
+
+    assert payload["weeks"] == ["2024-12-25", "2025-01-01", "2025-01-08"]
+    row = payload["accounts"][0]
+    assert row["first_week"] == "2024-12-25"
+    assert row["weeks_tracked"] == 3
+    assert row["farmed_weeks"] == 2
+    assert row["longest_missed_streak"] == 1
+    assert row["current_missed_streak"] == 0
+    assert row["total_value"] == 4.0
+    assert row["cases"] == [{"name": "Alpha Case", "count": 2}]
+    assert payload["cumulative_value"] == [2.0, 2.0, 4.0]
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from flask_login.utils import encode_cookie
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+from datagen import generate  # noqa: E402
+
+import mongo  # noqa: E402
+from app import app as flask_app  # noqa: E402
+from app import user_cache  # noqa: E402
+from async_app import call_flask, session_user  # noqa: E402
+from fx import DEFAULT_DISPLAY_CURRENCY  # noqa: E402
+
+
+@pytest.fixture
+def dataset(db):
+    data = generate(db, users=1, accounts=30, weeks=40, cases=5, seed=7)
+    mongo.use_database(db)
+    user_cache.clear()
+    yield data
+    mongo.use_database(None)
+
+
+def http_scope(path, cookie="", query=b""):
+    return {"type": "http", "method": "GET", "path": path, "query_string": query, "scheme": "http",
+            "server": ("testserver", 80), "client": ("127.0.0.1", 5000),
+            "headers": [(b"cookie", cookie.encode()), (b"user-agent", b"pytest")]}
+
+
+def session_cookie(user_id):
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    return "session=" + serializer.dumps({"_user_id": str(user_id), "_fresh": True})
+
+
+def test_remember_me_cookie_authenticates_without_a_session(dataset):
+    user_id = dataset["user_ids"][0]
+    with flask_app.app_context():
+        cookie = "remember_token=" + encode_cookie(str(user_id))
+
+    found_id, currency, cookies = asyncio.run(session_user(http_scope("/get_week_data", cookie)))
+
+    assert found_id == user_id
+    assert currency.code == DEFAULT_DISPLAY_CURRENCY
+    # The restored login is sent back as a session cookie, as the Flask routes would
+    assert any(value.startswith(b"session=") for name, value in cookies if name == b"set-cookie")
+
+
+def test_tampered_remember_cookie_is_rejected(dataset):
+    cookie = "remember_token=" + str(dataset["user_ids"][0]) + "|forged"
+    assert asyncio.run(session_user(http_scope("/get_week_data", cookie)))[0] is None
+
+
+def test_flask_responses_are_streamed_in_chunks(dataset):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = http_scope("/export", session_cookie(dataset["user_ids"][0]), b"format=csv")
+    asyncio.run(call_flask(scope, receive, send))
+
+    assert messages[0]["type"] == "http.response.start" and messages[0]["status"] == 200
+    bodies = [message for message in messages[1:] if message.get("body")]
+    assert len(bodies) > 1 and all(message["more_body"] for message in bodies)
+    assert messages[-1] == {"type": "http.response.body", "body": b""}
+    csv_text = b"".join(message["body"] for message in bodies).decode()
+    assert csv_text.startswith("week_start,") and len(csv_text.splitlines()) == 30 * 40 + 1
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from drop_stats import compact, read_drop_stats
+
+WEEK = datetime(2025, 1, 8, tzinfo=timezone.utc)
+
+
+def log_rows(db, week_start, farmed, unfarmed, last_updated):
+    user_id = ObjectId()
+    db.weekly_progress.insert_many(
+        [{"user_id": user_id, "account_doc_id": ObjectId(), "week_start": week_start, "drop_farmed": True,
+          "case_name": "Recoil Case", "last_updated": last_updated} for _ in range(farmed)]
+        + [{"user_id": user_id, "account_doc_id": ObjectId(), "week_start": week_start, "drop_farmed": False,
+            "case_name": None, "last_updated": last_updated} for _ in range(unfarmed)]
+    )
+
+
+def test_farmed_rate_is_farmed_rows_over_logged_rows(db, bulk_writes):
+    log_rows(db, WEEK, farmed=3, unfarmed=1, last_updated=WEEK + timedelta(days=1))
+
+    assert compact(db.drop_stats, db.weekly_progress, db.rollup_checkpoints, full=True) == 1
+    stats = read_drop_stats(db.drop_stats, db.case_price_history, {"Recoil Case": 2.0})
+
+    assert stats["weeks"][0]["farmed_rate"] == 0.75
+    assert stats["totals"]["farmed_rate"] == 0.75
+    assert stats["totals"]["total_value"] == 6.0
+
+
+def test_incremental_compaction_waits_for_the_rebuild_then_catches_up(db, bulk_writes):
+    log_rows(db, WEEK, farmed=1, unfarmed=0, last_updated=WEEK + timedelta(days=1))
+    args = (db.drop_stats, db.weekly_progress, db.rollup_checkpoints)
+
+    assert compact(*args, incremental_only=True) == 0
+    assert db.drop_stats.count_documents({}) == 0
+
+    assert compact(*args, full=True, now=WEEK + timedelta(days=2)) == 1
+    log_rows(db, WEEK + timedelta(weeks=1), farmed=1, unfarmed=0, last_updated=WEEK + timedelta(days=9))
+    assert compact(*args, incremental_only=True, now=WEEK + timedelta(days=10)) == 1
+    assert db.drop_stats.count_documents({}) == 2
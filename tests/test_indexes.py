@@ -0,0 +1,33 @@
+import mongomock
+import pytest
+
+import mongo
+from indexes import INDEX_SPECS, ensure_indexes
+
+
+@pytest.fixture
+def fresh_mongo(monkeypatch):
+    monkeypatch.setattr(mongo, "_db", None)
+    monkeypatch.setenv("MONGO_URI", "mongodb://localhost")
+    monkeypatch.setattr(mongo, "MongoClient", lambda uri: mongomock.MongoClient())
+
+
+def test_startup_does_not_build_indexes_by_default(fresh_mongo, monkeypatch):
+    monkeypatch.delenv("ENSURE_INDEXES_ON_STARTUP", raising=False)
+    monkeypatch.setattr(mongo, "ensure_indexes", lambda db: pytest.fail("indexes built on startup"))
+    assert mongo.get_db() is not None
+
+
+def test_startup_refuses_to_start_when_an_index_fails(fresh_mongo, monkeypatch):
+    monkeypatch.setenv("ENSURE_INDEXES_ON_STARTUP", "1")
+    monkeypatch.setattr(mongo, "ensure_indexes", lambda db: ["accounts: E11000 duplicate key error"])
+    with pytest.raises(RuntimeError, match="duplicate key"):
+        mongo.get_db()
+    assert mongo._db is None
+
+
+def test_duplicates_block_the_unique_index(db):
+    db.users.insert_many([{"username": "same"}, {"username": "same"}])
+    errors = ensure_indexes(db)
+    assert [error.split(":")[0] for error in errors] == ["users"]
+    assert len(errors) < len(INDEX_SPECS)
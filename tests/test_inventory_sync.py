@@ -0,0 +1,110 @@
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+from inventory_sync import sync_inventories
+from price_refresh import TokenBucket
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+from inventory_stub import item, start_server  # noqa: E402
+
+NOW = datetime(2025, 1, 10, 12, tzinfo=timezone.utc)  # A Friday; drops belong to the week of 2025-01-08
+WEEK = datetime(2025, 1, 8, tzinfo=timezone.utc)
+PUBLIC, PRIVATE = "76561190000000001", "76561190000000002"
+
+
+CLASS_IDS = {}  # One classid per item name, as on Steam
+
+
+def case_item(assetid, name):
+    return item(assetid, CLASS_IDS.setdefault(name, 1000 + len(CLASS_IDS)), name, "CSGO_Type_WeaponCase",
+                "Base Grade Container")
+
+
+def graffiti_item(assetid, name):
+    return item(assetid, CLASS_IDS.setdefault(name, 1000 + len(CLASS_IDS)), name, "CSGO_Type_Spray",
+                "Base Grade Graffiti")
+
+
+def write_inventory(directory, steamid, items):
+    """Writes an inventory file for the stub; items are (asset, description) pairs, newest first."""
+    with open(os.path.join(directory, f"{steamid}.json"), "w") as f:
+        json.dump({"assets": [asset for asset, _ in items], "descriptions": [description for _, description in items]}, f)
+
+
+@pytest.fixture
+def inventories(tmp_path):
+    server, handler = start_server(str(tmp_path))
+    yield str(tmp_path), f"http://127.0.0.1:{server.server_address[1]}", handler.state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def tracked(db):
+    user_id = ObjectId()
+    db.accounts.insert_many([
+        {"user_id": user_id, "steamid": PUBLIC, "account_name": "Main"},
+        {"user_id": user_id, "steamid": PRIVATE, "account_name": "Hidden"},
+    ])
+    db.cases.insert_many([{"case_name": "Recoil Case"}, {"case_name": "Dreams & Nightmares Case"}])
+    return user_id
+
+
+def run_sync(db, base_url):
+    return sync_inventories(db.accounts, db.weekly_progress, db.cases, db.inventory_sync_state,
+                            bucket=TokenBucket(1000, 1000), base_url=base_url, max_retries=0, now=NOW)
+
+
+def test_first_sync_records_a_baseline_and_skips_private_inventories(db, tracked, inventories, bulk_writes):
+    directory, base_url, stub = inventories
+    write_inventory(directory, PUBLIC, [case_item(300, "Recoil Case"), graffiti_item(200, "Sealed Graffiti | Old")])
+
+    summary, weeks = run_sync(db, base_url)
+
+    assert (summary["baselined"], summary["failed"], summary["drops"]) == (1, 1, 0)
+    assert summary["errors"] == [{"steamid": PRIVATE, "error": "Inventory is private"}]
+    assert weeks == set()
+    assert db.weekly_progress.count_documents({}) == 0
+    assert stub["by_status"] == {200: 1, 403: 1}
+
+
+def test_unchanged_inventory_is_not_downloaded_again(db, tracked, inventories, bulk_writes):
+    directory, base_url, stub = inventories
+    write_inventory(directory, PUBLIC, [case_item(300, "Recoil Case")])
+    run_sync(db, base_url)
+
+    summary, weeks = run_sync(db, base_url)
+
+    assert (summary["unchanged"], summary["synced"], summary["pages"]) == (1, 0, 1)
+    assert stub["by_status"][304] == 1 and stub["by_status"][200] == 1
+    assert weeks == set()
+
+
+def test_later_sync_logs_only_new_cases_and_graffiti(db, tracked, inventories, bulk_writes):
+    directory, base_url, stub = inventories
+    baseline = [case_item(300, "Recoil Case"), graffiti_item(200, "Sealed Graffiti | Old")]
+    write_inventory(directory, PUBLIC, baseline)
+    run_sync(db, base_url)
+
+    write_inventory(directory, PUBLIC, [
+        graffiti_item(420, "Sealed Graffiti | New"),
+        case_item(410, "Dreams & Nightmares Case"),
+        case_item(400, "Mystery Case"),
+        item(390, 7000, "AK-47 | Safari Mesh (Field-Tested)", "CSGO_Type_Rifle", "Industrial Grade Rifle"),
+    ] + baseline)
+    summary, weeks = run_sync(db, base_url)
+
+    assert (summary["synced"], summary["drops"], summary["failed"]) == (1, 1, 1)
+    assert summary["unmatched_cases"] == ["Mystery Case"]
+    assert weeks == {(tracked, WEEK)}
+    rows = list(db.weekly_progress.find({}, {"_id": 0, "last_updated": 0}))
+    account_id = db.accounts.find_one({"steamid": PUBLIC})["_id"]
+    # MongoDB hands datetimes back as naive UTC
+    assert rows == [{"user_id": tracked, "account_doc_id": account_id, "week_start": WEEK.replace(tzinfo=None), "drop_farmed": True,
+                     "case_name": "Dreams & Nightmares Case", "additional_drop": "Sealed Graffiti | New"}]
+    assert db.inventory_sync_state.find_one({"_id": account_id})["newest_assetid"] == "420"
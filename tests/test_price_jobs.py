@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+
+import price_refresh
+from indexes import INDEX_SPECS
+from price_jobs import (advance_price_refresh_job, expire_stale_jobs, find_active_job,
+                        start_price_refresh_job)
+
+
+def fake_refresh(cases_collection, cases=None, on_result=None, **kwargs):
+    for case_doc in cases:
+        cases_collection.update_one({"_id": case_doc["_id"]}, {"$set": {"case_price": 1.0}})
+        on_result(case_doc["case_name"], None)
+    return {"processed": len(cases), "updated": len(cases), "failed": 0, "changed_prices": {}}
+
+
+def test_second_start_joins_the_active_job(db):
+    db.price_refresh_jobs.create_indexes(INDEX_SPECS["price_refresh_jobs"])
+    first, created = start_price_refresh_job(db.price_refresh_jobs, mode="full")
+    second, created_again = start_price_refresh_job(db.price_refresh_jobs, mode="full")
+    assert created and not created_again
+    assert second == first
+    assert db.price_refresh_jobs.count_documents({}) == 1
+
+
+def test_job_advances_one_chunk_per_call(db, monkeypatch):
+    monkeypatch.setattr(price_refresh, "refresh_case_prices", fake_refresh)
+    db.price_refresh_jobs.create_indexes(INDEX_SPECS["price_refresh_jobs"])
+    db.cases.insert_many([{"case_name": f"Case {i}", "link": f"https://example.com/{i}"} for i in range(5)]
+                         + [{"case_name": "No Link"}])
+    job_id, _ = start_price_refresh_job(db.price_refresh_jobs, mode="full")
+
+    job = advance_price_refresh_job(db.price_refresh_jobs, db.cases, job_id, chunk_size=2)
+    assert (job["status"], job["total"], job["processed"], job["skipped_no_link"]) == ("running", 5, 2, 1)
+    assert "lease_until" not in job
+
+    while job["status"] == "running":
+        job = advance_price_refresh_job(db.price_refresh_jobs, db.cases, job_id, chunk_size=2)
+    assert (job["status"], job["processed"], job["updated"]) == ("completed", 5, 5)
+    assert find_active_job(db.price_refresh_jobs) is None
+    assert start_price_refresh_job(db.price_refresh_jobs)[1]
+
+
+def test_leased_job_is_not_advanced_twice(db, monkeypatch):
+    monkeypatch.setattr(price_refresh, "refresh_case_prices", fake_refresh)
+    db.cases.insert_one({"case_name": "Case", "link": "https://example.com/case"})
+    job_id, _ = start_price_refresh_job(db.price_refresh_jobs, mode="full")
+    db.price_refresh_jobs.update_one({"_id": job_id}, {"$set": {
+        "lease_until": datetime.now(timezone.utc) + timedelta(minutes=1)}})
+
+    job = advance_price_refresh_job(db.price_refresh_jobs, db.cases, job_id)
+    assert (job["status"], job["processed"]) == ("queued", 0)
+
+
+def test_stale_job_is_failed_so_a_new_one_can_start(db):
+    db.price_refresh_jobs.create_indexes(INDEX_SPECS["price_refresh_jobs"])
+    job_id, _ = start_price_refresh_job(db.price_refresh_jobs)
+    db.price_refresh_jobs.update_one({"_id": job_id}, {"$set": {
+        "heartbeat_at": datetime.now(timezone.utc) - timedelta(hours=2)}})
+
+    assert expire_stale_jobs(db.price_refresh_jobs) == 1
+    assert db.price_refresh_jobs.find_one({"_id": job_id})["status"] == "failed"
+    new_id, created = start_price_refresh_job(db.price_refresh_jobs)
+    assert created and new_id != job_id
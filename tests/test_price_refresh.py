@@ -0,0 +1,76 @@
+import os
+import sys
+
+import pytest
+
+from price_refresh import TokenBucket, _retry_delay, refresh_case_prices
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+from market_stub import start_server  # noqa: E402
+
+LISTING = "https://steamcommunity.com/market/listings/730/{}"
+SEARCH = "https://steamcommunity.com/market/search?q={}&appid=730"
+
+
+@pytest.fixture
+def market():
+    servers = []
+
+    def start(**settings):
+        server, handler = start_server(**settings)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}", handler.state
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_refresh_retries_429s_and_writes_prices_in_one_bulk_write(db, market, bulk_writes):
+    base_url, stub = market(fail_first=1, no_price=["Gone Case"])
+    db.cases.insert_many([
+        {"case_name": "Recoil Case", "link": LISTING.format("Recoil%20Case")},
+        {"case_name": "Dreams Case", "link": SEARCH.format("Dreams%20Case")},
+        {"case_name": "Gone Case", "link": LISTING.format("Gone%20Case")},
+        {"case_name": "Unlinked Case"},
+    ])
+
+    summary = refresh_case_prices(
+        db.cases, bucket=TokenBucket(1000, 1000), base_url=base_url, max_retries=2,
+        history_collection=db.case_price_history, max_workers=2
+    )
+
+    assert (summary["processed"], summary["updated"], summary["failed"], summary["skipped_no_link"]) == (3, 2, 1, 1)
+    assert summary["errors"][0]["case_name"] == "Gone Case"
+    assert summary["extractors"] == {"json": 2}
+    assert summary["changed_prices"] == {"Recoil Case": 0.52, "Dreams Case": 0.52}
+    # Every URL was throttled once and retried; "Gone Case" also fell back to its listing page
+    assert stub["throttled"] == len(stub["per_url"]) == 4
+    assert stub["requests"] == 8
+    assert len(bulk_writes) == 1 and len(bulk_writes[0]) == 2
+    prices = {case["case_name"]: case.get("case_price") for case in db.cases.find()}
+    assert prices == {"Recoil Case": 0.52, "Dreams Case": 0.52, "Gone Case": None, "Unlinked Case": None}
+
+
+def test_refresh_gives_up_when_the_market_keeps_throttling(db, market, bulk_writes):
+    base_url, stub = market(fail_first=10)
+    db.cases.insert_one({"case_name": "Recoil Case", "link": LISTING.format("Recoil%20Case")})
+
+    summary = refresh_case_prices(db.cases, bucket=TokenBucket(1000, 1000), base_url=base_url, max_retries=1,
+                                  extractors=["json"])
+
+    assert (summary["updated"], summary["failed"]) == (0, 1)
+    assert "Giving up after 2 attempts" in summary["errors"][0]["error"]
+    assert stub["requests"] == 2
+    assert bulk_writes == []
+
+
+def test_retry_delay_caps_long_retry_after_headers():
+    class Throttled:
+        def __init__(self, retry_after):
+            self.headers = {"Retry-After": retry_after}
+
+    assert _retry_delay(Throttled("3"), 0, 1.0, max_delay=10) == 3.0
+    assert _retry_delay(Throttled("3600"), 0, 1.0, max_delay=10) == 10
+    assert _retry_delay(Throttled("soon"), 5, 1.0, max_delay=10) == 10
@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from week_view import fetch_week_entries, get_week_views, progress_stamps
+
+WEEK = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class CountingCollection:
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        self.calls = 0
+
+    def __getattr__(self, attr):
+        self.calls += 1
+        return getattr(self.collection, attr)
+
+
+def test_etag_and_views_share_one_progress_query(db):
+    user_id, account_ids = ObjectId(), [ObjectId(), ObjectId(), ObjectId()]
+    accounts = [{"_id": account_id, "account_name": f"acc{i}", "steamid": str(i)} for i, account_id in enumerate(account_ids)]
+    db.weekly_progress.insert_many([
+        {"user_id": user_id, "account_doc_id": account_id, "week_start": WEEK, "drop_farmed": True,
+         "case_name": name, "last_updated": WEEK}
+        for account_id, name in zip(account_ids, ["Case A", "Case B", "Case C"])
+    ])
+    db.case_price_history.insert_many([
+        {"case_name": "Case A", "ts": datetime(2024, 12, 1, tzinfo=timezone.utc), "price": 1.5},
+        {"case_name": "Case B", "ts": datetime(2024, 12, 1, tzinfo=timezone.utc), "price": 2.5},
+        {"case_name": "Case B", "ts": datetime(2025, 2, 1, tzinfo=timezone.utc), "price": 9.0},
+    ])
+    progress, history = CountingCollection(db.weekly_progress), CountingCollection(db.case_price_history)
+
+    entries = fetch_week_entries(progress, history, user_id, accounts, [WEEK])
+    assert progress_stamps(entries, accounts, [WEEK])[WEEK] == (3, WEEK)
+    rows, total = get_week_views(progress, history, user_id, accounts, [WEEK], {"Case C": 4.0}, entries=entries)[WEEK]
+
+    assert [row["case_value"] for row in rows] == [1.5, 2.5, 4.0]
+    assert total == 8.0
+    assert (progress.calls, history.calls) == (1, 1)
@@ -0,0 +1,313 @@
+"""Shared week-view service for the dashboard (index) and /get_week_data.
+
+Any number of weeks is loaded with one progress query (week_start $in [...]).
+Drops are valued at the price valid at each week_start, either with memoised
+point-in-time lookups against case_price_history or, when server_join is set,
+by joining the history in the same aggregation pipeline. With the catalog
+coming from the process cache, a dashboard render costs two round trips:
+accounts and progress. The conditional-GET ETag is computed from the same
+progress rows (fetch_week_entries, then progress_stamps), so it adds none.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+
+from price_history import get_price_timelines, get_week_price_map, price_from_timeline
+
+ACCOUNT_PROJECTION = {"_id": 1, "account_name": 1, "steamid": 1, "sort_number": 1}
+# Mixed into every ETag; change it (or deploy on Vercel) when the page/JSON shape changes
+ETAG_SALT = os.getenv("ETAG_SALT", os.getenv("VERCEL_GIT_COMMIT_SHA", ""))
+
+
+def as_utc(value):
+    """pymongo returns naive UTC datetimes; make them comparable with our aware week starts."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def week_start_of(moment):
+    """UTC midnight of the Wednesday on or before `moment` (the app's week start); naive values are UTC."""
+    day = as_utc(moment).astimezone(timezone.utc).date()
+    wednesday = day - timedelta(days=(day.weekday() - 2) % 7)
+    return datetime.combine(wednesday, datetime.min.time(), tzinfo=timezone.utc)
+
+
+def load_user_accounts(accounts_collection, user_id):
+    return list(accounts_collection.find({"user_id": user_id}, ACCOUNT_PROJECTION).sort("sort_number", ASCENDING))
+
+
+def _progress_filter(user_id, week_starts, accounts):
+    return {
+        "user_id": user_id,
+        "week_start": {"$in": list(week_starts)},
+        "account_doc_id": {"$in": [acc['_id'] for acc in accounts]},
+    }
+
+
+def _fetch_progress_with_prices(progress_collection, history_collection, user_id, week_starts, accounts):
+    """Single aggregation that joins each farmed entry to the price valid at its week_start."""
+    pipeline = [
+        {"$match": _progress_filter(user_id, week_starts, accounts)},
+        {"$lookup": {
+            "from": history_collection.name,
+            "let": {"case_name": "$case_name", "week_start": "$week_start"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$case_name", "$$case_name"]},
+                    {"$lte": ["$ts", "$$week_start"]},
+                ]}}},
+                {"$sort": {"ts": -1}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "price": 1}},
+            ],
+            "as": "price_point",
+        }},
+    ]
+    return list(progress_collection.aggregate(pipeline))
+
+
+def _build_rows(accounts, week_start, progress_by_account, week_price_map):
+    """One row per tracked account (in display order), with placeholders for accounts without progress."""
+    rows = []
+    week_total_price = 0.0
+    for acc in accounts:
+        entry = progress_by_account.get(acc['_id'])
+        if not entry:
+            rows.append({
+                "_id": None, "account_name": acc["account_name"], "steamid": acc["steamid"],
+                "account_doc_id": acc["_id"], "week_start": week_start,
+                "drop_farmed": False, "case_name": "N/A", "additional_drop": "-",
+                "case_value": 0.0
+            })
+            continue
+
+        case_val = 0.0
+        if entry.get("drop_farmed") and entry.get("case_name"):
+            case_val = week_price_map.get(entry["case_name"], 0.0)
+            week_total_price += case_val
+        rows.append({
+            "_id": entry["_id"],
+            "account_name": acc["account_name"],
+            "steamid": acc["steamid"],
+            "account_doc_id": acc["_id"],
+            "week_start": week_start,
+            "drop_farmed": entry["drop_farmed"],
+            "case_name": entry.get("case_name", ""),
+            "additional_drop": entry.get("additional_drop", ""),
+            "case_value": case_val
+        })
+    return rows, week_total_price
+
+
+def fetch_week_entries(progress_collection, history_collection, user_id, accounts, week_starts, server_join=False):
+    """The progress rows of the given weeks in one query (with joined prices when server_join is set)."""
+    if not accounts or not week_starts:
+        return []
+    if server_join:
+        return _fetch_progress_with_prices(progress_collection, history_collection, user_id, week_starts, accounts)
+    return list(progress_collection.find(_progress_filter(user_id, week_starts, accounts)))
+
+
+def get_week_views(progress_collection, history_collection, user_id, accounts, week_starts, case_price_map,
+                   price_cache=None, server_join=False, entries=None):
+    """
+    Returns {week_start: (rows, total_value)} for every requested week.
+    week_starts must be timezone-aware UTC midnights (see get_most_recent_wednesday).
+    entries are the rows from fetch_week_entries when the caller already loaded them (e.g. for an ETag).
+    """
+    week_starts = list(dict.fromkeys(week_starts))
+    progress_by_week = {week_start: {} for week_start in week_starts}
+    joined_prices = {week_start: {} for week_start in week_starts}
+
+    if entries is None:
+        entries = fetch_week_entries(progress_collection, history_collection, user_id, accounts, week_starts, server_join)
+    if accounts and week_starts:
+        for entry in entries:
+            week_start = as_utc(entry["week_start"])
+            if week_start not in progress_by_week:
+                continue
+            progress_by_week[week_start][entry["account_doc_id"]] = entry
+            if server_join and entry.get("case_name"):
+                price_point = entry.get("price_point") or []
+                joined_prices[week_start][entry["case_name"]] = (
+                    price_point[0]["price"] if price_point else case_price_map.get(entry["case_name"], 0.0)
+                )
+
+    views = {}
+    for week_start in week_starts:
+        if server_join:
+            week_price_map = joined_prices[week_start]
+        else:
+            farmed_cases = [entry.get("case_name") for entry in progress_by_week[week_start].values() if entry.get("drop_farmed")]
+            week_price_map = get_week_price_map(history_collection, farmed_cases, week_start, case_price_map, cache=price_cache)
+        views[week_start] = _build_rows(accounts, week_start, progress_by_week[week_start], week_price_map)
+    return views
+
+
+def week_total(progress_collection, history_collection, user_id, accounts, week_start, case_price_map, price_cache=None):
+    """One week's total value (USD) over the tracked accounts, as shown under its table, from one aggregation."""
+    pipeline = [
+        {"$match": dict(_progress_filter(user_id, [week_start], accounts), drop_farmed=True,
+                        case_name={"$nin": [None, ""]})},
+        {"$group": {"_id": "$case_name", "count": {"$sum": 1}}},
+    ]
+    counts = {row["_id"]: row["count"] for row in progress_collection.aggregate(pipeline)} if accounts else {}
+    prices = get_week_price_map(history_collection, list(counts), week_start, case_price_map, cache=price_cache)
+    return sum(count * prices.get(case_name, 0.0) for case_name, count in counts.items())
+
+
+def row_to_json(row, currency=None):
+    """JSON shape used by /get_week_data (string ids and dates), with case_value in `currency` when given."""
+    return {
+        "account_name": row["account_name"], "steamid": row["steamid"],
+        "week_start": row["week_start"].strftime('%Y-%m-%d'),
+        "drop_farmed": row["drop_farmed"],
+        "case_name": row["case_name"],
+        "additional_drop": row["additional_drop"],
+        "progress_id": str(row["_id"]) if row["_id"] else None,
+        "case_value": currency.convert(row["case_value"]) if currency else row["case_value"]
+    }
+
+
+def progress_stamps(entries, accounts, week_starts):
+    """
+    {week_start: (row count, latest last_updated)} over the tracked accounts' progress rows.
+    Every progress write sets last_updated, so the pair changes whenever a week's rows do.
+    """
+    account_ids = {acc['_id'] for acc in accounts}
+    stamps = {week_start: (0, None) for week_start in week_starts}
+    for entry in entries:
+        week_start = as_utc(entry["week_start"])
+        if week_start not in stamps or entry["account_doc_id"] not in account_ids:
+            continue
+        count, latest = stamps[week_start]
+        last_updated = entry.get("last_updated")
+        if last_updated is not None:
+            last_updated = as_utc(last_updated)
+            latest = last_updated if latest is None or last_updated > latest else latest
+        stamps[week_start] = (count + 1, latest)
+    return stamps
+
+
+def view_etag(accounts, stamps, catalog, currency, *extra):
+    """
+    Weak ETag for a rendered view: the weeks' progress stamps, the tracked accounts (names and order),
+    the catalog contents and the display currency/rate, plus any caller-specific parts.
+    """
+    parts = [
+        ETAG_SALT, catalog.digest, currency.code, currency.rate,
+        [(str(acc['_id']), acc.get('account_name'), acc.get('steamid')) for acc in accounts],
+        [(week_start.strftime('%Y-%m-%d'), count, latest.isoformat() if latest else None)
+         for week_start, (count, latest) in sorted(stamps.items())],
+    ]
+    parts.extend(extra)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:24]
+
+
+def week_etag(accounts, week_start, stamp, catalog, currency):
+    """ETag of one week's data; shared by /get_week_data and the per-week etags of a weeks range."""
+    return view_etag(accounts, {week_start: stamp}, catalog, currency, "week")
+
+
+def weeks_between(first_week, last_week):
+    weeks = []
+    week_start = first_week
+    while week_start <= last_week:
+        weeks.append(week_start)
+        week_start += timedelta(weeks=1)
+    return weeks
+
+
+def range_query(user_id, first_week, last_week, detail=False):
+    """(filter, projection) for the progress rows of a weeks range."""
+    projection = {"account_doc_id": 1, "week_start": 1, "drop_farmed": 1, "case_name": 1, "last_updated": 1}
+    if detail:
+        projection["additional_drop"] = 1
+    return {"user_id": user_id, "week_start": {"$gte": first_week, "$lte": last_week}}, projection
+
+
+def farmed_case_names(entries):
+    return {entry.get("case_name") for entry in entries if entry.get("drop_farmed") and entry.get("case_name")}
+
+
+def build_weeks_range(accounts, weeks, entries, timelines, case_price_map, detail=False, etag_for=None):
+    """
+    Assembles the get_weeks_range payload from already loaded progress rows and price timelines.
+    etag_for(week_start, stamp) adds per-week "etags" matching the ones /get_week_data sends.
+    """
+    week_pos = {week: i for i, week in enumerate(weeks)}
+    account_pos = {acc['_id']: i for i, acc in enumerate(accounts)}
+
+    def matrix(fill):
+        return [[fill] * len(weeks) for _ in accounts]
+
+    farmed, case_idx, values = matrix(None), matrix(-1), matrix(0.0)
+    progress_ids, additional_drops = (matrix(None), matrix(None)) if detail else (None, None)
+    cases, case_pos, farmed_cells = [], {}, []
+
+    for entry in entries:
+        row = account_pos.get(entry["account_doc_id"])
+        col = week_pos.get(as_utc(entry["week_start"]))
+        if row is None or col is None:
+            continue  # Deleted account or a non-Wednesday week_start
+        farmed[row][col] = 1 if entry.get("drop_farmed") else 0
+        case_name = entry.get("case_name")
+        if case_name:
+            if case_name not in case_pos:
+                case_pos[case_name] = len(cases)
+                cases.append(case_name)
+            case_idx[row][col] = case_pos[case_name]
+            if entry.get("drop_farmed"):
+                farmed_cells.append((row, col, case_name))
+        if detail:
+            progress_ids[row][col] = str(entry["_id"])
+            additional_drops[row][col] = entry.get("additional_drop")
+
+    week_totals = [0.0] * len(weeks)
+    for row, col, case_name in farmed_cells:
+        price = price_from_timeline(timelines.get(case_name), weeks[col])
+        value = price if price is not None else case_price_map.get(case_name, 0.0)
+        values[row][col] = value
+        week_totals[col] += value
+
+    payload = {
+        "weeks": [week.strftime('%Y-%m-%d') for week in weeks],
+        "accounts": [{"id": str(acc['_id']), "name": acc['account_name'], "steamid": acc['steamid']} for acc in accounts],
+        "cases": cases,
+        "farmed": farmed,
+        "case_idx": case_idx,
+        "values": values,
+        "week_totals": week_totals,
+    }
+    if detail:
+        payload["progress_ids"] = progress_ids
+        payload["additional_drops"] = additional_drops
+    if etag_for:
+        stamps = progress_stamps(entries, accounts, weeks)
+        payload["etags"] = [etag_for(week, stamps[week]) for week in weeks]
+    return payload
+
+
+def range_in_currency(payload, currency):
+    """Converts a weeks range payload's USD values and totals to `currency` (fx.CurrencyDisplay) in place."""
+    payload["values"] = [[currency.convert(value) for value in row] for row in payload["values"]]
+    payload["week_totals"] = [currency.convert(total) for total in payload["week_totals"]]
+    payload["currency"] = currency.to_json()
+    return payload
+
+
+def get_weeks_range(progress_collection, history_collection, user_id, accounts, first_week, last_week,
+                    case_price_map, detail=False, etag_for=None):
+    """
+    Columnar accounts x weeks view for history browsing and heatmaps.
+    Progress comes from one (user_id, week_start) index range scan and prices from one scan of the
+    involved cases' history. Matrix cells are indexed [account][week]; `farmed` is 1/0 for logged
+    entries and None where nothing was logged, `case_idx` points into `cases` (-1 for none).
+    With detail=True, progress ids and additional drops are included so clients can render/edit rows.
+    """
+    query_filter, projection = range_query(user_id, first_week, last_week, detail)
+    entries = list(progress_collection.find(query_filter, projection))
+    timelines = get_price_timelines(history_collection, farmed_case_names(entries), last_week)
+    return build_weeks_range(accounts, weeks_between(first_week, last_week), entries, timelines, case_price_map, detail,
+                             etag_for=etag_for)
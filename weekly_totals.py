@@ -0,0 +1,224 @@
+"""Materialised per-user, per-week totals (the weekly_totals collection).
+
+One document per (user_id, week_start):
+    {user_id, week_start, farmed_count, total_value, case_counts: {case_key: n}, updated_at}
+
+Progress writes keep it current with $inc deltas (see apply_progress_change), so
+lifetime/season totals are an O(weeks) read instead of a scan over every
+weekly_progress row. Rows belonging to deleted accounts are still counted, since
+deleting an account keeps its progress. Price changes only affect weeks valued
+with the catalog fallback (weeks older than a case's price history), and
+recompute_for_price_change rebuilds exactly those weeks.
+
+Usage:
+    python weekly_totals.py --rebuild   # rebuild every user's totals from weekly_progress
+"""
+import os
+import sys
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne
+
+from price_history import get_price_timelines, price_from_timeline
+from week_view import as_utc
+
+
+def case_key(case_name):
+    """Case names become field names under case_counts; '.' and a leading '$' are not allowed there."""
+    key = case_name.replace('.', '．')
+    return '＄' + key[1:] if key.startswith('$') else key
+
+
+def case_name_from_key(key):
+    name = key.replace('．', '.')
+    return '$' + name[1:] if name.startswith('＄') else name
+
+
+def _contribution(entry, price):
+    """What a single progress row adds to its week's totals."""
+    if not entry or not entry.get("drop_farmed"):
+        return 0, 0.0, None
+    case_name = entry.get("case_name")
+    return 1, (price if case_name else 0.0) or 0.0, case_name or None
+
+
+def apply_progress_change(totals_collection, user_id, week_start, before, after, price_for_case):
+    """
+    Applies the difference between a progress row's previous state (`before`, None for inserts)
+    and its new state (`after`, None for deletes) as one $inc upsert.
+    price_for_case(case_name) must return the price valid at week_start.
+    """
+    old_count, old_value, old_case = _contribution(before, price_for_case(before.get("case_name")) if before and before.get("case_name") else 0.0)
+    new_count, new_value, new_case = _contribution(after, price_for_case(after.get("case_name")) if after and after.get("case_name") else 0.0)
+    if (old_count, old_value, old_case) == (new_count, new_value, new_case):
+        return False
+
+    increments = {"farmed_count": new_count - old_count, "total_value": new_value - old_value}
+    if old_case:
+        increments[f"case_counts.{case_key(old_case)}"] = -1
+    if new_case:
+        field = f"case_counts.{case_key(new_case)}"
+        increments[field] = increments.get(field, 0) + 1
+    totals_collection.update_one(
+        {"user_id": user_id, "week_start": week_start},
+        {"$inc": increments, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    return True
+
+
+def _build_totals_docs(progress_rows, history_collection, case_price_map):
+    """Groups raw progress rows into weekly_totals documents, valuing drops at their week's price."""
+    rows = list(progress_rows)
+    farmed_cases = {row.get("case_name") for row in rows if row.get("drop_farmed") and row.get("case_name")}
+    latest_week = max((row["week_start"] for row in rows), default=None)
+    timelines = get_price_timelines(history_collection, farmed_cases, latest_week) if latest_week else {}
+
+    docs = {}
+    for row in rows:
+        week_start = as_utc(row["week_start"])
+        doc = docs.setdefault((row["user_id"], week_start), {
+            "user_id": row["user_id"], "week_start": week_start,
+            "farmed_count": 0, "total_value": 0.0, "case_counts": {},
+        })
+        case_name = row.get("case_name")
+        price = 0.0
+        if case_name:
+            price = price_from_timeline(timelines.get(case_name), week_start)
+            if price is None:
+                price = case_price_map.get(case_name, 0.0)
+        count, value, counted_case = _contribution(row, price)
+        doc["farmed_count"] += count
+        doc["total_value"] += value
+        if counted_case:
+            key = case_key(counted_case)
+            doc["case_counts"][key] = doc["case_counts"].get(key, 0) + 1
+    return list(docs.values())
+
+
+RECOMPUTE_BATCH_WEEKS = 500  # (user_id, week_start) pairs per $or query
+
+
+def recompute_weeks(totals_collection, progress_collection, history_collection, case_price_map, week_keys):
+    """Rebuilds the given (user_id, week_start) totals from raw progress rows, RECOMPUTE_BATCH_WEEKS at a time."""
+    week_keys = list(week_keys)
+    if len(week_keys) > RECOMPUTE_BATCH_WEEKS:
+        return sum(
+            recompute_weeks(totals_collection, progress_collection, history_collection, case_price_map,
+                            week_keys[i:i + RECOMPUTE_BATCH_WEEKS])
+            for i in range(0, len(week_keys), RECOMPUTE_BATCH_WEEKS)
+        )
+    if not week_keys:
+        return 0
+    rows = progress_collection.find(
+        {"$or": [{"user_id": user_id, "week_start": week_start} for user_id, week_start in week_keys]},
+        {"user_id": 1, "week_start": 1, "drop_farmed": 1, "case_name": 1}
+    )
+    docs = {(doc["user_id"], doc["week_start"]): doc for doc in _build_totals_docs(rows, history_collection, case_price_map)}
+    now = datetime.now(timezone.utc)
+    operations = []
+    for user_id, week_start in week_keys:
+        doc = docs.get((user_id, week_start)) or {
+            "user_id": user_id, "week_start": week_start, "farmed_count": 0, "total_value": 0.0, "case_counts": {},
+        }
+        doc["updated_at"] = now
+        operations.append(ReplaceOne({"user_id": user_id, "week_start": week_start}, doc, upsert=True))
+    totals_collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def recompute_for_price_change(totals_collection, progress_collection, history_collection, case_price_map,
+                               case_names):
+    """
+    Targeted recompute after `case_names` got a new catalog price (and history point).
+    A week keeps its value when a history point older than the new one exists at its start, so only
+    weeks before each case's first history point (valued with the catalog fallback) and weeks at or
+    after the new point are rebuilt.
+    """
+    case_names = [name for name in case_names if name]
+    if not case_names:
+        return 0
+    points = {
+        row["_id"]: row for row in history_collection.aggregate([
+            {"$match": {"case_name": {"$in": case_names}}},
+            {"$group": {"_id": "$case_name", "first_ts": {"$min": "$ts"}, "last_ts": {"$max": "$ts"}, "count": {"$sum": 1}}},
+        ])
+    }
+    clauses = []
+    for case_name in case_names:
+        clause = {"case_name": case_name, "drop_farmed": True}
+        point = points.get(case_name)
+        if point and point["count"] > 1:
+            clause["$or"] = [{"week_start": {"$lt": point["first_ts"]}}, {"week_start": {"$gte": point["last_ts"]}}]
+        clauses.append(clause)
+    week_keys = {
+        (row["_id"]["user_id"], as_utc(row["_id"]["week_start"]))
+        for row in progress_collection.aggregate([
+            {"$match": {"$or": clauses}},
+            {"$group": {"_id": {"user_id": "$user_id", "week_start": "$week_start"}}},
+        ])
+    }
+    return recompute_weeks(totals_collection, progress_collection, history_collection, case_price_map, week_keys)
+
+
+def rebuild_user_totals(totals_collection, progress_collection, history_collection, case_price_map, user_id):
+    """Full rebuild for one user (backfill or repair)."""
+    rows = progress_collection.find({"user_id": user_id}, {"user_id": 1, "week_start": 1, "drop_farmed": 1, "case_name": 1})
+    docs = _build_totals_docs(rows, history_collection, case_price_map)
+    totals_collection.delete_many({"user_id": user_id})
+    if docs:
+        now = datetime.now(timezone.utc)
+        for doc in docs:
+            doc["updated_at"] = now
+        totals_collection.insert_many(docs, ordered=False)
+    return len(docs)
+
+
+def get_totals(totals_collection, user_id, start=None, end=None):
+    """Sums the weekly rollups for a user, optionally within [start, end]. Reads one document per week."""
+    query = {"user_id": user_id}
+    week_range = {}
+    if start:
+        week_range["$gte"] = start
+    if end:
+        week_range["$lte"] = end
+    if week_range:
+        query["week_start"] = week_range
+
+    totals = {"weeks": 0, "farmed_count": 0, "total_value": 0.0, "case_counts": {}}
+    for doc in totals_collection.find(query, {"_id": 0, "farmed_count": 1, "total_value": 1, "case_counts": 1}):
+        totals["weeks"] += 1
+        totals["farmed_count"] += doc.get("farmed_count", 0)
+        totals["total_value"] += doc.get("total_value", 0.0)
+        for key, count in (doc.get("case_counts") or {}).items():
+            if count:
+                case_name = case_name_from_key(key)
+                totals["case_counts"][case_name] = totals["case_counts"].get(case_name, 0) + count
+    totals["total_value"] = round(totals["total_value"], 2)
+    return totals
+
+
+def main(argv):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    from indexes import DB_NAME
+
+    if "--rebuild" not in argv:
+        print(__doc__)
+        return 2
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("CRITICAL ERROR: MONGO_URI environment variable not set.")
+        return 2
+    db = MongoClient(mongo_uri)[DB_NAME]
+    case_price_map = {case['case_name']: case.get('case_price', 0.0) for case in db.cases.find({}, {"case_name": 1, "case_price": 1})}
+    for user in db.users.find({}, {"_id": 1, "username": 1}):
+        weeks = rebuild_user_totals(db.weekly_totals, db.weekly_progress, db.case_price_history, case_price_map, user["_id"])
+        print(f"Rebuilt {weeks} week(s) of totals for {user.get('username')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))